@@ -0,0 +1,120 @@
+"""GameDB throughput benchmark.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_db [--players N] [--duration S] [--threads 1,4,16] [--json]
+
+Seeds a scratch database and runs a mix of stats reads, game result updates
+and leaderboard reads from several threads, once with GameDB and once with
+the previous access pattern (a new connection per call, rollback journal,
+SELECT then UPDATE under a global lock), and reports operations per second.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+from server.database import GameDB
+
+OPERATION_MIX = (('stats', 0.70), ('update', 0.25), ('leaderboard', 0.05))
+
+class ConnectPerCallDB(GameDB):
+    """GameDB as it used to access SQLite, kept here as the benchmark baseline"""
+    def __init__(self, db_file):
+        self.lock = threading.Lock()
+        super().__init__(db_file)
+
+    def get_db_connection(self):
+        conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def update_game_result(self, username, won, goals_scored, goals_conceded, score_change):
+        with self.lock:
+            with self.get_db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT name FROM players WHERE name = ?', (username,))
+                if not cursor.fetchone():
+                    return False
+                cursor.execute('''
+                    UPDATE players
+                    SET wins = wins + ?, losses = losses + ?, goals_scored = goals_scored + ?,
+                        goals_conceded = goals_conceded + ?, score = MAX(0, score + ?)
+                    WHERE name = ?
+                ''', (1 if won else 0, 0 if won else 1, goals_scored, goals_conceded, score_change, username))
+                conn.commit()
+                return True
+
+def open_db(cls, path, players):
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        db = cls(path)
+    with db.get_db_connection() as conn:
+        conn.executemany('INSERT INTO players (name, password_hash, score) VALUES (?, ?, ?)',
+                         ((f"player{i}", 'x', random.randint(0, 500)) for i in range(players)))
+    return db
+
+def worker(db, players, stop_at, counts, seed):
+    rng = random.Random(seed)
+    kinds, weights = zip(*OPERATION_MIX)
+    local = dict.fromkeys(kinds, 0)
+    while time.perf_counter() < stop_at:
+        kind = rng.choices(kinds, weights)[0]
+        name = f"player{rng.randrange(players)}"
+        if kind == 'stats':
+            db.get_player_stats(name)
+        elif kind == 'update':
+            won = rng.random() < 0.5
+            db.update_game_result(name, won, 5 if won else 2, 2 if won else 5, 3 if won else -3)
+        else:
+            db.get_leaderboard_data()
+        local[kind] += 1
+    counts.append(local)
+
+def run(cls, players, threads, duration, directory):
+    path = os.path.join(directory, f"{cls.__name__}_{threads}.db")
+    db = open_db(cls, path, players)
+    per_thread = []
+    stop_at = time.perf_counter() + duration
+    workers = [threading.Thread(target=worker, args=(db, players, stop_at, per_thread, i)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    db.close()
+    counts = {kind: sum(local[kind] for local in per_thread) for kind, _ in OPERATION_MIX}
+    result = {kind: round(count / duration) for kind, count in sorted(counts.items())}
+    result['total'] = round(sum(counts.values()) / duration)
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark GameDB operations per second")
+    parser.add_argument('--players', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=3.0, help="seconds per configuration")
+    parser.add_argument('--threads', default='1,4,16', help="comma-separated thread counts")
+    parser.add_argument('--json', action='store_true', help="print machine-readable results")
+    args = parser.parse_args(argv)
+
+    random.seed(0)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for threads in (int(n) for n in args.threads.split(',')):
+            for cls in (ConnectPerCallDB, GameDB):
+                results.setdefault(cls.__name__, {})[threads] = run(cls, args.players, threads, args.duration, directory)
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+        return
+    for name, by_threads in results.items():
+        print(f"{name}:")
+        for threads, result in by_threads.items():
+            per_kind = ", ".join(f"{kind} {count:,}" for kind, count in result.items() if kind != 'total')
+            print(f"  {threads:>3} threads: {result['total']:>8,} ops/s  ({per_kind})")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""Physics and serialization benchmarks built on the headless simulator.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_physics [--ticks N] [--matches N] [--json]
+
+Reports whole-tick throughput, the cost of each physics function and of each
+state serializer, bytes allocated per tick, and compares the scalar engine
+with the NumPy batch engine (when NumPy is installed; it is only needed for
+the benchmarks, so it lives in benchmarks/requirements.txt).
+"""
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+import server.physics as physics
+from common.protocol import StateEncoder, SnapshotEncoder
+from server.match import Match, PADDLE_RADIUS, PUCK_RADIUS, HEIGHT
+from server.simulation import Simulation, sweeping_input, state_digest
+
+def capture_frames(ticks, seed):
+    """Record the per-tick inputs of the physics functions from a simulated match"""
+    frames = []
+    previous = {}
+
+    def record(match):
+        state = match.game_state
+        p1_vel = [state['p1_pos'][i] - previous.get('p1', state['p1_pos'])[i] for i in (0, 1)]
+        p2_vel = [state['p2_pos'][i] - previous.get('p2', state['p2_pos'])[i] for i in (0, 1)]
+        previous['p1'], previous['p2'] = list(state['p1_pos']), list(state['p2_pos'])
+        frames.append((list(state['puck_pos']), list(state['puck_vel']),
+                       list(state['p1_pos']), list(state['p2_pos']), p1_vel, p2_vel))
+
+    seed_offset = 0
+    while len(frames) < ticks:
+        simulation = Simulation(sweeping_input(1, seed + seed_offset), sweeping_input(2, seed + seed_offset),
+                                seed + seed_offset)
+        simulation.run(ticks - len(frames), on_tick=record)
+        seed_offset += 1
+    return frames
+
+def time_per_call(fn, frames, repeat=3):
+    """Best-of-repeat cost of fn(frame) in microseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        work = [(list(a), list(b), c, d, e, f) for a, b, c, d, e, f in frames]
+        started = time.perf_counter()
+        for frame in work:
+            fn(frame)
+        best = min(best, time.perf_counter() - started)
+    return best / len(frames) * 1e6
+
+def bench_functions(frames):
+    rng = random.Random(0)
+    state = {'puck_pos': [0, 0], 'puck_vel': [0, 0], 'p1_pos': [0, 0], 'p2_pos': [0, 0],
+             'score': [0, 0], 'game_over': False, 'p1_name': 'player one', 'p2_name': 'player two'}
+    encoder, snapshots = StateEncoder(), SnapshotEncoder()
+    tick = [0]
+
+    def serialize_setup(frame):
+        state['puck_pos'], state['puck_vel'], state['p1_pos'], state['p2_pos'] = frame[:4]
+        tick[0] += 1
+
+    def snapshot(frame):
+        serialize_setup(frame)
+        snapshots.record(state, tick[0])
+        snapshots.encode(tick[0] - 1)
+
+    cases = {
+        'apply_friction': lambda f: physics.apply_friction(f[1]),
+        'handle_wall_collision': lambda f: physics.handle_wall_collision(f[0], f[1], PUCK_RADIUS, HEIGHT),
+        'handle_paddle_collision': lambda f: physics.handle_paddle_collision(
+            f[0], f[1], f[2], PADDLE_RADIUS, PUCK_RADIUS, f[4], True, rng),
+        'clamp_velocity': lambda f: physics.clamp_velocity(f[1]),
+        'move_puck_swept': lambda f: physics.move_puck_swept(
+            f[0], f[1], [(f[2], f[4]), (f[3], f[5])], PADDLE_RADIUS, PUCK_RADIUS, HEIGHT, rng=rng),
+        'serialize_json': lambda f: (serialize_setup(f), json.dumps(state).encode()),
+        'serialize_binary': lambda f: (serialize_setup(f), encoder.encode(state, tick[0])),
+        'serialize_delta': snapshot,
+    }
+    return {name: round(time_per_call(fn, frames), 3) for name, fn in cases.items()}
+
+def bench_ticks(ticks, seed, tick_rate=60, swept=None):
+    """Whole Match.step throughput, restarting matches as they finish"""
+    done = 0
+    elapsed = 0.0
+    while done < ticks:
+        simulation = Simulation(sweeping_input(1, seed), sweeping_input(2, seed), seed, tick_rate, swept)
+        started = time.perf_counter()
+        simulation.run(ticks - done)
+        elapsed += time.perf_counter() - started
+        done += simulation.match.tick
+        seed += 1
+    return round(done / elapsed)
+
+def bench_allocations(ticks, seed):
+    """Average bytes allocated while a tick runs (tracemalloc peak above the starting level)"""
+    simulation = Simulation(sweeping_input(1, seed), sweeping_input(2, seed), seed)
+    encoder = StateEncoder()
+    tracemalloc.start()
+    total = 0
+    measured = 0
+    for _ in range(ticks):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        if not simulation.step():
+            break
+        encoder.encode(simulation.game_state, simulation.match.tick)
+        _, peak = tracemalloc.get_traced_memory()
+        total += peak - before
+        measured += 1
+    tracemalloc.stop()
+    return round(total / max(measured, 1), 1)
+
+def check_determinism(seed):
+    digests = {state_digest(Simulation(sweeping_input(1, seed), sweeping_input(2, seed), seed).run(3000))
+               for _ in range(2)}
+    return len(digests) == 1
+
+def compare_engines(matches, ticks, seed):
+    """Scalar Match vs BatchPhysics: cost per match-tick and divergence with jitter off"""
+    try:
+        from server.batch_physics import BatchPhysics
+    except ImportError:
+        return {'batch': 'numpy not installed (pip install -r benchmarks/requirements.txt)'}
+
+    class NoJitter(random.Random):
+        def random(self):
+            return 0.5
+
+    scalar = [Match('a', 'b', rng=NoJitter(seed + i)) for i in range(matches)]
+    batch = BatchPhysics(matches, seed=seed, angle_jitter=0)
+    for match in scalar:
+        batch.add_match(puck_vel=match.game_state['puck_vel'])
+    inputs = [(sweeping_input(1, seed + i), sweeping_input(2, seed + i)) for i in range(matches)]
+
+    scalar_time = batch_time = 0.0
+    max_error = 0.0
+    diverged = set()
+    for _ in range(ticks):
+        tick_inputs = [(next(p1), next(p2)) for p1, p2 in inputs]
+        started = time.perf_counter()
+        for match, (p1_input, p2_input) in zip(scalar, tick_inputs):
+            match.step(p1_input, p2_input)
+        scalar_time += time.perf_counter() - started
+
+        for slot, (p1_input, p2_input) in enumerate(tick_inputs):
+            batch.set_targets(slot, (p1_input['x'], p1_input['y']), (p2_input['x'], p2_input['y']))
+        started = time.perf_counter()
+        scored = batch.step()
+        batch_time += time.perf_counter() - started
+
+        # After a goal the two engines draw different serve directions, so stop comparing that match
+        diverged.update(int(slot) for slot in scored)
+        for slot, match in enumerate(scalar):
+            if slot in diverged:
+                continue
+            state = batch.game_state(slot)
+            for key in ('puck_pos', 'puck_vel', 'p1_pos', 'p2_pos'):
+                for a, b in zip(state[key], match.game_state[key]):
+                    max_error = max(max_error, abs(a - b))
+
+    return {
+        'matches': matches,
+        'scalar_us_per_match_tick': round(scalar_time / (matches * ticks) * 1e6, 3),
+        'batch_us_per_match_tick': round(batch_time / (matches * ticks) * 1e6, 3),
+        'speedup': round(scalar_time / batch_time, 1) if batch_time else None,
+        'max_abs_error_px': max_error,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the game physics")
+    parser.add_argument('--ticks', type=int, default=20000)
+    parser.add_argument('--matches', type=int, default=1000, help="matches for the engine comparison")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help="print machine-readable results")
+    args = parser.parse_args(argv)
+
+    frames = capture_frames(args.ticks, args.seed)
+    results = {
+        'ticks_per_second': bench_ticks(args.ticks, args.seed),
+        'ticks_per_second_swept_30hz': bench_ticks(args.ticks, args.seed, tick_rate=30),
+        'us_per_call': bench_functions(frames),
+        'alloc_bytes_per_tick': bench_allocations(min(args.ticks, 5000), args.seed),
+        'deterministic': check_determinism(args.seed),
+        'engines': compare_engines(args.matches, 200, args.seed),
+    }
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+        return
+    print(f"Match.step throughput:       {results['ticks_per_second']:>10,} ticks/s")
+    print(f"Match.step (swept, 30 Hz):   {results['ticks_per_second_swept_30hz']:>10,} ticks/s")
+    print(f"Allocated per tick:          {results['alloc_bytes_per_tick']:>10} bytes")
+    print(f"Deterministic replay:        {results['deterministic']!s:>10}")
+    print("Cost per call:")
+    for name, cost in results['us_per_call'].items():
+        print(f"  {name:<26} {cost:>8.3f} us")
+    print("Engine comparison:")
+    for name, value in results['engines'].items():
+        print(f"  {name:<26} {value}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Import-time and cold-start benchmark for the HTTP and game servers.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_startup [--players 0,100000] [--repeat N] [--json]
+
+Each measurement runs in a fresh interpreter. Import time is how long
+`import server_thread_pool_http` or `import game_server` takes. Startup time
+is from launching the server until it serves its first request: the HTTP
+server answers GET /leaderboard/json, and the game server accepts a TCP
+connection. The HTTP server is started against a scratch database seeded
+with each given number of players, so the numbers show whether startup grows
+with the user base. The servers use their fixed ports (8000 and 9999), which
+must be free.
+"""
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from contextlib import redirect_stdout
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVERS = {
+    'server_thread_pool_http': ('127.0.0.1', 8000),
+    'game_server': ('127.0.0.1', 9999),
+}
+START_TIMEOUT = 60
+
+def child_env():
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    env.setdefault('BCRYPT_ROUNDS', '4')
+    return env
+
+def import_time(module):
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=child_env(),
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.split()[-1])
+
+def seed_database(directory, players):
+    from server.database import GameDB
+    path = os.path.join(directory, 'gamedata.db')
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        GameDB(path).close()
+    with sqlite3.connect(path) as conn:
+        conn.executemany('INSERT INTO players (name, password_hash, score, wins) VALUES (?, ?, ?, ?)',
+                         ((f"player{i}", 'x', i % 500, i % 37) for i in range(players)))
+
+def is_ready(module, address):
+    try:
+        if module == 'server_thread_pool_http':
+            with urllib.request.urlopen(f"http://{address[0]}:{address[1]}/leaderboard/json?limit=1", timeout=1) as r:
+                return r.status == 200
+        with socket.create_connection(address, timeout=1):
+            return True
+    except OSError:
+        return False
+
+def startup_time(module, directory):
+    address = SERVERS[module]
+    if is_ready(module, address):
+        raise SystemExit(f"Port {address[1]} is already in use; stop the server running there first")
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, f"{module}.py")], cwd=directory, env=child_env(),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while not is_ready(module, address):
+            if process.poll() is not None:
+                raise SystemExit(f"{module} exited with status {process.returncode} before it was ready")
+            if time.perf_counter() - started > START_TIMEOUT:
+                raise SystemExit(f"{module} was not ready after {START_TIMEOUT} s")
+            time.sleep(0.005)
+        return time.perf_counter() - started
+    finally:
+        process.terminate()
+        process.wait()
+
+def median_ms(measure, repeat):
+    return round(1000 * statistics.median(measure() for _ in range(repeat)), 1)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark server import and startup times")
+    parser.add_argument('--players', default='0,100000', help="comma-separated player counts to seed")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per measurement (the median is reported)")
+    parser.add_argument('--json', action='store_true', help="print machine-readable results")
+    args = parser.parse_args(argv)
+
+    results = {'import_ms': {}, 'startup_ms': {}}
+    for module in SERVERS:
+        results['import_ms'][module] = median_ms(lambda: import_time(module), args.repeat)
+    for players in (int(n) for n in args.players.split(',')):
+        with tempfile.TemporaryDirectory() as directory:
+            seed_database(directory, players)
+            results['startup_ms'][f"server_thread_pool_http ({players} players)"] = median_ms(
+                lambda: startup_time('server_thread_pool_http', directory), args.repeat)
+    with tempfile.TemporaryDirectory() as directory:
+        results['startup_ms']['game_server'] = median_ms(lambda: startup_time('game_server', directory), args.repeat)
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+        return
+    for kind, label in (('import_ms', 'Import'), ('startup_ms', 'Startup to first request')):
+        print(f"{label}:")
+        for name, ms in results[kind].items():
+            print(f"  {name:<45} {ms:>8.1f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+"""Synthetic load generator for the game server and the HTTP API.
+
+Run from the repository root, with the servers already up:
+
+    python -m benchmarks.loadgen --bots 200 --http-rate 500 --duration 30 > run.json
+
+Game bots speak the same login and input protocol as game_client.py (JSON,
+binary or delta, see --protocol) and measure the interval between state
+updates they receive. HTTP workers replay a mix of /register, /login,
+/leaderboard, /stats/<name> and /game-result at a fixed total rate. The
+report is a single JSON document so runs can be diffed or plotted.
+"""
+import argparse
+import http.client
+import json
+import math
+import random
+import socket
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+from common.protocol import (
+    JsonStreamDecoder, FrameDecoder, SnapshotDecoder,
+    PROTOCOL_JSON, PROTOCOL_BINARY, PROTOCOL_DELTA,
+    split_handshake, decode_state, encode_input, encode_input_ack
+)
+from server.match import WIDTH, HEIGHT
+
+HTTP_MIX = (
+    ('leaderboard', 0.35),
+    ('stats', 0.30),
+    ('login', 0.15),
+    ('game_result', 0.15),
+    ('register', 0.05),
+)
+
+def percentiles(samples):
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(math.ceil(q * len(ordered))) - 1)] * 1000, 3)
+
+    mean = sum(ordered) / len(ordered)
+    stdev = math.sqrt(sum((sample - mean) ** 2 for sample in ordered) / len(ordered))
+    return {
+        'count': len(ordered),
+        'mean_ms': round(mean * 1000, 3),
+        'stdev_ms': round(stdev * 1000, 3),
+        'p50_ms': pick(0.50), 'p99_ms': pick(0.99), 'p999_ms': pick(0.999),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+class Stats:
+    """Thread-safe collection of latency samples and error counts per name"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+        self.counters = {}
+
+    def record(self, name, seconds):
+        with self.lock:
+            self.samples.setdefault(name, []).append(seconds)
+
+    def error(self, name, kind):
+        with self.lock:
+            key = f"{name}:{kind}"
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def report(self, duration):
+        with self.lock:
+            endpoints = {}
+            for name, samples in sorted(self.samples.items()):
+                summary = percentiles(samples)
+                summary['throughput_per_s'] = round(len(samples) / duration, 2)
+                endpoints[name] = summary
+            return {'endpoints': endpoints, 'errors': dict(sorted(self.errors.items())),
+                    'counters': dict(sorted(self.counters.items()))}
+
+class HttpUser:
+    """One API client with its own account and a reused HTTP connection"""
+    def __init__(self, url, stats):
+        parts = urlsplit(url)
+        self.conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=10)
+        self.stats = stats
+        self.name = f"load_{uuid.uuid4().hex[:10]}"
+        self.password = uuid.uuid4().hex
+        self.token = None
+
+    def request(self, name, method, path, payload=None):
+        body = json.dumps(payload).encode() if payload is not None else None
+        headers = {'Content-Type': 'application/json'} if body else {}
+        started = time.perf_counter()
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+            if response.getheader('Connection', '').lower() == 'close':
+                self.conn.close()
+        except (OSError, http.client.HTTPException) as e:
+            self.conn.close()
+            self.stats.error(name, type(e).__name__)
+            return None, None
+        self.stats.record(name, time.perf_counter() - started)
+        if response.status >= 400:
+            self.stats.error(name, str(response.status))
+        return response.status, data
+
+    def setup(self):
+        self.request('register', 'POST', '/register', {'name': self.name, 'password': self.password})
+        self.login()
+
+    def login(self):
+        status, data = self.request('login', 'POST', '/login', {'name': self.name, 'password': self.password})
+        if status == 200:
+            self.token = json.loads(data)['token']
+
+    def run_one(self, kind):
+        if kind == 'leaderboard':
+            self.request(kind, 'GET', '/leaderboard/json')
+        elif kind == 'stats':
+            self.request(kind, 'GET', f'/stats/{self.name}')
+        elif kind == 'login':
+            self.login()
+        elif kind == 'register':
+            self.request(kind, 'POST', '/register', {'name': f"load_{uuid.uuid4().hex[:10]}", 'password': 'x'})
+        elif kind == 'game_result':
+            won = random.random() < 0.5
+            self.request(kind, 'POST', '/game-result', {
+                'token': self.token, 'won': won, 'goals_scored': 5 if won else 2,
+                'goals_conceded': 2 if won else 5, 'score_change': 3 if won else -3
+            })
+
+def http_worker(url, rate, stop_at, stats, seed):
+    rng = random.Random(seed)
+    kinds, weights = zip(*HTTP_MIX)
+    user = HttpUser(url, stats)
+    user.setup()
+    interval = 1 / rate
+    next_at = time.perf_counter()
+    while next_at < stop_at and time.perf_counter() < stop_at:
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        user.run_one(rng.choices(kinds, weights)[0])
+        next_at += interval
+
+class GameBot:
+    """Headless player speaking game_client.py's protocol, measuring state arrival jitter"""
+    def __init__(self, host, port, protocol, stats, token):
+        self.host, self.port, self.protocol = host, port, protocol
+        self.stats = stats
+        self.name = f"bot_{uuid.uuid4().hex[:8]}"
+        self.token = token or uuid.uuid4().hex
+        self.states = 0
+        self.bytes = 0
+
+    def run(self, stop_at, rng):
+        started = time.perf_counter()
+        sock = None
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=10)
+            sock.sendall(json.dumps({'name': self.name, 'token': self.token, 'protocol': self.protocol}).encode())
+            sock.settimeout(0.5)
+            buffer = b''
+            handshake = None
+            while handshake is None:
+                try:
+                    data = sock.recv(4096)
+                except socket.timeout:
+                    if time.perf_counter() >= stop_at:
+                        sock.close()
+                        return
+                    continue
+                if not data:
+                    raise ConnectionError("closed before match start")
+                buffer += data
+                handshake, pending = split_handshake(buffer)
+        except OSError as e:
+            self.stats.error('game_connect', type(e).__name__)
+            if sock is not None:
+                sock.close()
+            return
+        self.stats.record('game_matchmaking', time.perf_counter() - started)
+
+        protocol = handshake.get('protocol', PROTOCOL_JSON)
+        decoder = JsonStreamDecoder() if protocol == PROTOCOL_JSON else FrameDecoder()
+        snapshots = SnapshotDecoder()
+        player_id = handshake.get('player_id', 1)
+        half = 0 if player_id == 1 else WIDTH / 2
+        sock.settimeout(1.0)
+        last_state_at = None
+        next_input_at = time.perf_counter()
+        if protocol == PROTOCOL_DELTA:
+            for message in decoder.feed(pending):
+                snapshots.apply(*message)
+        else:
+            decoder.feed(pending)
+        try:
+            while time.perf_counter() < stop_at:
+                now = time.perf_counter()
+                if now >= next_input_at:
+                    x, y = half + rng.uniform(0, WIDTH / 2), rng.uniform(0, HEIGHT)
+                    if protocol == PROTOCOL_DELTA:
+                        sock.sendall(encode_input_ack(x, y, snapshots.latest_tick))
+                    elif protocol == PROTOCOL_BINARY:
+                        sock.sendall(encode_input(x, y))
+                    else:
+                        sock.sendall(json.dumps({'x': x, 'y': y}).encode())
+                    next_input_at += 1 / 60
+                data = sock.recv(65536)
+                if not data:
+                    break
+                self.bytes += len(data)
+                messages = decoder.feed(data)
+                arrived = time.perf_counter()
+                game_over = False
+                for message in messages:
+                    self.states += 1
+                    if protocol == PROTOCOL_DELTA:
+                        snapshots.apply(*message)
+                        game_over = game_over or (snapshots.latest_tick and snapshots.latest_state()['game_over'])
+                    elif protocol == PROTOCOL_BINARY:
+                        game_over = game_over or decode_state(message[1])['game_over']
+                    else:
+                        game_over = game_over or message.get('game_over', False)
+                if messages:
+                    if last_state_at is not None:
+                        self.stats.record('game_state_interval', arrived - last_state_at)
+                    last_state_at = arrived
+                if game_over:
+                    break
+        except socket.timeout:
+            self.stats.error('game_state', 'timeout')
+        except (OSError, ValueError) as e:
+            self.stats.error('game_state', type(e).__name__)
+        finally:
+            sock.close()
+
+def bot_worker(args, stop_at, stats, seed):
+    rng = random.Random(seed)
+    token = None
+    if args.bot_login:
+        user = HttpUser(args.http_url, stats)
+        user.setup()
+        token = user.token
+    while time.perf_counter() < stop_at:
+        bot = GameBot(args.game_host, args.game_port, args.protocol, stats, token)
+        bot.run(stop_at, rng)
+        stats.count('game_states', bot.states)
+        stats.count('game_bytes', bot.bytes)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate load against the game and HTTP servers")
+    parser.add_argument('--duration', type=float, default=30, help="seconds to run")
+    parser.add_argument('--bots', type=int, default=0, help="concurrent game bots (pairs form matches)")
+    parser.add_argument('--protocol', type=int, default=PROTOCOL_JSON, choices=(PROTOCOL_JSON, PROTOCOL_BINARY, PROTOCOL_DELTA))
+    parser.add_argument('--bot-login', action='store_true', help="register and log bots in over HTTP for real tokens")
+    parser.add_argument('--game-host', default='127.0.0.1')
+    parser.add_argument('--game-port', type=int, default=9999)
+    parser.add_argument('--http-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--http-rate', type=float, default=0, help="total HTTP requests per second")
+    parser.add_argument('--http-workers', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    stats = Stats()
+    started = time.perf_counter()
+    stop_at = started + args.duration
+    threads = []
+    if args.http_rate > 0:
+        per_worker = args.http_rate / args.http_workers
+        for i in range(args.http_workers):
+            threads.append(threading.Thread(target=http_worker, args=(args.http_url, per_worker, stop_at, stats, args.seed + i), daemon=True))
+    for i in range(args.bots):
+        threads.append(threading.Thread(target=bot_worker, args=(args, stop_at, stats, args.seed + 10000 + i), daemon=True))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(args.duration + 30)
+
+    elapsed = time.perf_counter() - started
+    report = stats.report(elapsed)
+    report['config'] = {k: v for k, v in vars(args).items()}
+    report['elapsed_s'] = round(elapsed, 3)
+    counters = report['counters']
+    if counters.get('game_states'):
+        report['game_bytes_per_state'] = round(counters['game_bytes'] / counters['game_states'], 1)
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+if __name__ == '__main__':
+    main()
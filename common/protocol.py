@@ -0,0 +1,302 @@
+import codecs
+import collections
+import json
+import struct
+
+MAX_PENDING_BYTES = 64 * 1024
+
+class JsonStreamDecoder:
+    """Split a TCP byte stream of back-to-back JSON objects into messages.
+
+    TCP does not preserve message boundaries, so one recv() can return half
+    a message or several of them glued together.
+    """
+    def __init__(self):
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ''
+
+    def feed(self, data):
+        """Add received bytes and return every complete message decoded so far"""
+        self.buffer += self.text_decoder.decode(data)
+        messages = []
+        pos = 0
+        length = len(self.buffer)
+        while True:
+            while pos < length and self.buffer[pos].isspace():
+                pos += 1
+            if pos >= length:
+                break
+            try:
+                message, pos = self.json_decoder.raw_decode(self.buffer, pos)
+            except json.JSONDecodeError:
+                # Most likely an incomplete message; wait for more data
+                if length - pos > MAX_PENDING_BYTES:
+                    raise
+                break
+            messages.append(message)
+        self.buffer = self.buffer[pos:]
+        return messages
+
+# Wire protocol versions, negotiated with the 'protocol' field of the login
+# message. Version 0 is the original stream of JSON objects; version 1 uses
+# length-prefixed binary frames after the JSON handshake; version 2 uses the
+# same framing but sends quantized keyframes and deltas against the last
+# state the client acknowledged.
+PROTOCOL_JSON = 0
+PROTOCOL_BINARY = 1
+PROTOCOL_DELTA = 2
+SUPPORTED_PROTOCOLS = (PROTOCOL_JSON, PROTOCOL_BINARY, PROTOCOL_DELTA)
+
+# Frame header: payload length, message type
+FRAME_HEADER = struct.Struct('<HB')
+MSG_STATE = 1
+MSG_INPUT = 2
+MSG_KEYFRAME = 3
+MSG_DELTA = 4
+MSG_INPUT_ACK = 5
+
+# tick, puck x/y, puck vx/vy, p1 x/y, p2 x/y, score p1/p2, game_over
+STATE_LAYOUT = struct.Struct('<I8f2HB')
+# paddle target x/y
+INPUT_LAYOUT = struct.Struct('<2f')
+# paddle target x/y, newest snapshot tick the client has applied
+INPUT_ACK_LAYOUT = struct.Struct('<2fI')
+
+def negotiate_protocol(login_data):
+    """Pick the wire protocol requested in a login message, falling back to JSON"""
+    protocol = login_data.get('protocol', PROTOCOL_JSON)
+    return protocol if protocol in SUPPORTED_PROTOCOLS else PROTOCOL_JSON
+
+def split_handshake(buffer):
+    """Split a leading JSON handshake object off a byte buffer.
+
+    Returns (message, remaining bytes), or (None, buffer) if the handshake is
+    not complete yet. The handshake is ASCII-only JSON, so latin-1 maps every
+    character to exactly one byte and the decode offset is a byte offset.
+    """
+    text = bytes(buffer).decode('latin-1')
+    start = len(text) - len(text.lstrip())
+    try:
+        message, end = json.JSONDecoder().raw_decode(text, start)
+    except json.JSONDecodeError:
+        return None, buffer
+    return message, buffer[end:]
+
+class FrameDecoder:
+    """Split a byte stream into (message type, payload) frames"""
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer += data
+        frames = []
+        pos = 0
+        available = len(self.buffer)
+        while available - pos >= FRAME_HEADER.size:
+            length, msg_type = FRAME_HEADER.unpack_from(self.buffer, pos)
+            end = pos + FRAME_HEADER.size + length
+            if end > available:
+                break
+            frames.append((msg_type, bytes(self.buffer[pos + FRAME_HEADER.size:end])))
+            pos = end
+        del self.buffer[:pos]
+        return frames
+
+class StateEncoder:
+    """Pack game state frames into one preallocated buffer.
+
+    The returned memoryview is overwritten by the next call, so callers must
+    copy or send it before encoding again.
+    """
+    def __init__(self):
+        self.buffer = bytearray(FRAME_HEADER.size + STATE_LAYOUT.size)
+        FRAME_HEADER.pack_into(self.buffer, 0, STATE_LAYOUT.size, MSG_STATE)
+        self.view = memoryview(self.buffer)
+
+    def encode(self, game_state, tick):
+        puck, vel = game_state['puck_pos'], game_state['puck_vel']
+        p1, p2 = game_state['p1_pos'], game_state['p2_pos']
+        score = game_state['score']
+        STATE_LAYOUT.pack_into(
+            self.buffer, FRAME_HEADER.size, tick,
+            puck[0], puck[1], vel[0], vel[1], p1[0], p1[1], p2[0], p2[1],
+            score[0], score[1], game_state['game_over']
+        )
+        return self.view
+
+def decode_state(payload):
+    """Unpack a state frame payload into the same dict shape as the JSON protocol"""
+    (tick, puck_x, puck_y, vel_x, vel_y, p1_x, p1_y, p2_x, p2_y,
+     score1, score2, game_over) = STATE_LAYOUT.unpack(payload)
+    return {
+        'tick': tick,
+        'puck_pos': [puck_x, puck_y], 'puck_vel': [vel_x, vel_y],
+        'p1_pos': [p1_x, p1_y], 'p2_pos': [p2_x, p2_y],
+        'score': [score1, score2], 'game_over': bool(game_over)
+    }
+
+def encode_input(x, y):
+    return FRAME_HEADER.pack(INPUT_LAYOUT.size, MSG_INPUT) + INPUT_LAYOUT.pack(x, y)
+
+def decode_input(payload):
+    x, y = INPUT_LAYOUT.unpack(payload)
+    return {'x': x, 'y': y}
+
+def encode_input_ack(x, y, ack_tick):
+    return FRAME_HEADER.pack(INPUT_ACK_LAYOUT.size, MSG_INPUT_ACK) + INPUT_ACK_LAYOUT.pack(x, y, ack_tick)
+
+def decode_input_ack(payload):
+    x, y, ack_tick = INPUT_ACK_LAYOUT.unpack(payload)
+    return {'x': x, 'y': y}, ack_tick
+
+# Protocol 2 snapshots are tuples of quantized integers: positions in 1/16 px,
+# velocities in 1/256 px per tick. Each group below is one bit of the delta
+# mask and is only sent when it differs from the acknowledged base snapshot.
+POS_SCALE = 16
+VEL_SCALE = 256
+SNAPSHOT_GROUPS = (
+    ('puck_pos', struct.Struct('<2H'), POS_SCALE),
+    ('puck_vel', struct.Struct('<2h'), VEL_SCALE),
+    ('p1_pos', struct.Struct('<2H'), POS_SCALE),
+    ('p2_pos', struct.Struct('<2H'), POS_SCALE),
+    ('score', struct.Struct('<2H'), 1),
+    ('game_over', struct.Struct('<B'), 1),
+)
+KEYFRAME_HEADER = struct.Struct('<I')  # tick
+DELTA_HEADER = struct.Struct('<IBB')  # tick, ticks since base, changed-group mask
+KEYFRAME_INTERVAL = 60
+SNAPSHOT_HISTORY = 128
+MAX_BASE_AGE = 255
+
+def _clamp(value, low, high):
+    return low if value < low else high if value > high else value
+
+def take_snapshot(game_state):
+    """Quantize the dynamic part of a game state into a tuple of per-group tuples"""
+    puck, vel = game_state['puck_pos'], game_state['puck_vel']
+    p1, p2 = game_state['p1_pos'], game_state['p2_pos']
+    score = game_state['score']
+    return (
+        (_clamp(round(puck[0] * POS_SCALE), 0, 0xFFFF), _clamp(round(puck[1] * POS_SCALE), 0, 0xFFFF)),
+        (_clamp(round(vel[0] * VEL_SCALE), -0x8000, 0x7FFF), _clamp(round(vel[1] * VEL_SCALE), -0x8000, 0x7FFF)),
+        (_clamp(round(p1[0] * POS_SCALE), 0, 0xFFFF), _clamp(round(p1[1] * POS_SCALE), 0, 0xFFFF)),
+        (_clamp(round(p2[0] * POS_SCALE), 0, 0xFFFF), _clamp(round(p2[1] * POS_SCALE), 0, 0xFFFF)),
+        (score[0], score[1]),
+        (int(game_state['game_over']),),
+    )
+
+def snapshot_to_state(snapshot):
+    """Expand a snapshot back into the dict shape used by the JSON protocol"""
+    state = {}
+    for (name, _, scale), values in zip(SNAPSHOT_GROUPS, snapshot):
+        state[name] = [v / scale for v in values] if scale != 1 else list(values)
+    state['game_over'] = bool(state['game_over'][0])
+    return state
+
+class SnapshotEncoder:
+    """Keyframe/delta encoder for one session (protocol 2).
+
+    Remembers the recent snapshots so each client can be sent only the groups
+    that changed since the newest tick it acknowledged. A client whose ack is
+    unknown or too old, and every client once per keyframe interval, gets a
+    full keyframe instead.
+    """
+    def __init__(self, keyframe_interval=KEYFRAME_INTERVAL, history=SNAPSHOT_HISTORY):
+        self.keyframe_interval = keyframe_interval
+        self.history = history
+        self.snapshots = {}
+        self.ticks = collections.deque()
+        self.tick = None
+        self.force_keyframe = True
+        self.last_keyframe_tick = 0
+        self.frames = {}
+        max_payload = DELTA_HEADER.size + sum(layout.size for _, layout, _ in SNAPSHOT_GROUPS)
+        self.buffer = bytearray(FRAME_HEADER.size + max_payload)
+
+    def record(self, game_state, tick):
+        """Store the snapshot for this tick; call once per sent tick, before encode()"""
+        self.snapshots[tick] = take_snapshot(game_state)
+        self.ticks.append(tick)
+        while len(self.ticks) > self.history:
+            del self.snapshots[self.ticks.popleft()]
+        self.tick = tick
+        self.frames = {}
+        self.force_keyframe = tick - self.last_keyframe_tick >= self.keyframe_interval
+        if self.force_keyframe:
+            self.last_keyframe_tick = tick
+
+    def encode(self, acked_tick):
+        """Frame for a client that last acknowledged acked_tick (cached per distinct ack)"""
+        frame = self.frames.get(acked_tick)
+        if frame is None:
+            frame = self.frames[acked_tick] = self._encode(acked_tick)
+        return frame
+
+    def _encode(self, acked_tick):
+        tick = self.tick
+        snapshot = self.snapshots[tick]
+        base = self.snapshots.get(acked_tick)
+        buffer = self.buffer
+        offset = FRAME_HEADER.size
+        if self.force_keyframe or base is None or tick - acked_tick > MAX_BASE_AGE:
+            msg_type = MSG_KEYFRAME
+            KEYFRAME_HEADER.pack_into(buffer, offset, tick)
+            offset += KEYFRAME_HEADER.size
+            for (_, layout, _), values in zip(SNAPSHOT_GROUPS, snapshot):
+                layout.pack_into(buffer, offset, *values)
+                offset += layout.size
+        else:
+            msg_type = MSG_DELTA
+            offset += DELTA_HEADER.size
+            mask = 0
+            for bit, ((_, layout, _), values, base_values) in enumerate(zip(SNAPSHOT_GROUPS, snapshot, base)):
+                if values != base_values:
+                    mask |= 1 << bit
+                    layout.pack_into(buffer, offset, *values)
+                    offset += layout.size
+            DELTA_HEADER.pack_into(buffer, FRAME_HEADER.size, tick, tick - acked_tick, mask)
+        FRAME_HEADER.pack_into(buffer, 0, offset - FRAME_HEADER.size, msg_type)
+        return bytes(buffer[:offset])
+
+class SnapshotDecoder:
+    """Client side of protocol 2: rebuilds snapshots from keyframes and deltas"""
+    def __init__(self, history=SNAPSHOT_HISTORY):
+        self.history = history
+        self.snapshots = {}
+        self.ticks = collections.deque()
+        self.latest_tick = 0
+
+    def apply(self, msg_type, payload):
+        """Apply one frame; returns False if it referenced a base we no longer have"""
+        if msg_type == MSG_KEYFRAME:
+            (tick,) = KEYFRAME_HEADER.unpack_from(payload)
+            offset = KEYFRAME_HEADER.size
+            groups = []
+            for _, layout, _ in SNAPSHOT_GROUPS:
+                groups.append(layout.unpack_from(payload, offset))
+                offset += layout.size
+        elif msg_type == MSG_DELTA:
+            tick, base_age, mask = DELTA_HEADER.unpack_from(payload)
+            base = self.snapshots.get(tick - base_age)
+            if base is None:
+                return False
+            offset = DELTA_HEADER.size
+            groups = []
+            for bit, ((_, layout, _), base_values) in enumerate(zip(SNAPSHOT_GROUPS, base)):
+                if mask & (1 << bit):
+                    groups.append(layout.unpack_from(payload, offset))
+                    offset += layout.size
+                else:
+                    groups.append(base_values)
+        else:
+            return False
+        self.snapshots[tick] = tuple(groups)
+        self.ticks.append(tick)
+        while len(self.ticks) > self.history:
+            del self.snapshots[self.ticks.popleft()]
+        self.latest_tick = max(self.latest_tick, tick)
+        return True
+
+    def latest_state(self):
+        return snapshot_to_state(self.snapshots[self.latest_tick])
@@ -1,8 +1,15 @@
 import pygame
 import socket
 import json
+import select
+import struct
 import sys
 from client.auth import auth_flow
+from common.protocol import (
+    JsonStreamDecoder, FrameDecoder, SnapshotDecoder,
+    PROTOCOL_JSON, PROTOCOL_BINARY, PROTOCOL_DELTA,
+    split_handshake, decode_state, encode_input, encode_input_ack
+)
 from client.graphics import (
     draw_arena, update_puck_trail, draw_puck_trail, 
     draw_paddle, draw_puck, draw_score_display, show_message,
@@ -17,13 +24,66 @@ pygame.init()
 screen = pygame.display.set_mode((WIDTH, HEIGHT))
 pygame.display.set_caption("Air Hockey")
 
+def receive_available(game_socket, decoder):
+    """Block until a message arrives, then drain the socket and return every message read.
+
+    The server ticks on its own clock, so several states may be waiting when
+    we get here. An empty list means the server closed the connection.
+    """
+    messages = []
+    while not messages or select.select([game_socket], [], [], 0)[0]:
+        data = game_socket.recv(4096)
+        if not data:
+            break
+        messages.extend(decoder.feed(data))
+    return messages
+
+def latest_state(protocol, messages, snapshots, names):
+    """Turn the messages read this frame into the newest full game state, or None"""
+    if protocol == PROTOCOL_DELTA:
+        # Deltas build on earlier snapshots, so every frame has to be applied in order
+        for msg_type, payload in messages:
+            snapshots.apply(msg_type, payload)
+        if not snapshots.latest_tick:
+            return None
+        state = snapshots.latest_state()
+    elif protocol == PROTOCOL_BINARY:
+        state = decode_state(messages[-1][1])
+    else:
+        return messages[-1]
+    state.update(names)
+    return state
+
+def receive_handshake(game_socket):
+    """Read the match start message; returns it with any bytes that followed it"""
+    buffer = b''
+    while True:
+        data = game_socket.recv(1024)
+        if not data:
+            raise ConnectionError("connection closed")
+        buffer += data
+        message, rest = split_handshake(buffer)
+        if message is not None:
+            return message, rest
+
 def game_loop(game_socket):
     try:
-        json.loads(game_socket.recv(1024).decode())
-    except (socket.error, json.JSONDecodeError):
+        handshake, pending = receive_handshake(game_socket)
+    except socket.error:
         show_message(screen, "Failed to start game.", color=P1_PADDLE_COLOR)
         return
 
+    # Servers that predate the binary protocols ignore the request and keep talking JSON
+    protocol = handshake.get('protocol', PROTOCOL_JSON)
+    decoder = JsonStreamDecoder() if protocol == PROTOCOL_JSON else FrameDecoder()
+    snapshots = SnapshotDecoder()
+    names = {'p1_name': handshake.get('p1_name', 'P1'), 'p2_name': handshake.get('p2_name', 'P2')}
+    if protocol == PROTOCOL_DELTA:
+        for msg_type, payload in decoder.feed(pending):
+            snapshots.apply(msg_type, payload)
+    else:
+        decoder.feed(pending)
+
     running = True
     while running:
         for event in pygame.event.get():
@@ -31,11 +91,19 @@ def game_loop(game_socket):
                 running = False
         
         try:
-            game_socket.sendall(json.dumps({'x': pygame.mouse.get_pos()[0], 'y': pygame.mouse.get_pos()[1]}).encode())
-            data = game_socket.recv(2048).decode()
-            if not data: 
+            mouse_x, mouse_y = pygame.mouse.get_pos()
+            if protocol == PROTOCOL_DELTA:
+                game_socket.sendall(encode_input_ack(mouse_x, mouse_y, snapshots.latest_tick))
+            elif protocol == PROTOCOL_BINARY:
+                game_socket.sendall(encode_input(mouse_x, mouse_y))
+            else:
+                game_socket.sendall(json.dumps({'x': mouse_x, 'y': mouse_y}).encode())
+            messages = receive_available(game_socket, decoder)
+            if not messages:
                 break
-            state = json.loads(data)
+            state = latest_state(protocol, messages, snapshots, names)
+            if state is None:
+                continue
 
             # Draw game
             draw_arena(screen)
@@ -65,7 +133,7 @@ def game_loop(game_socket):
                 show_message(screen, f"Game Over! {winner_name} Wins!", duration=3000)
                 running = False
                 
-        except (socket.error, json.JSONDecodeError):
+        except (socket.error, json.JSONDecodeError, struct.error):
             running = False
             
     game_socket.close()
@@ -80,7 +148,7 @@ def main():
     try:
         game_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         game_socket.connect((GAME_SERVER_HOST, GAME_PORT))
-        game_socket.sendall(json.dumps({'name': username, 'token': token}).encode())
+        game_socket.sendall(json.dumps({'name': username, 'token': token, 'protocol': PROTOCOL_DELTA}).encode())
         game_loop(game_socket)
     except socket.error:
         show_message(screen, "Could not connect to game server.", color=P1_PADDLE_COLOR)
@@ -1,184 +1,211 @@
 import socket
 import threading
 import json
+import argparse
+import os
+import selectors
 import time
-import random
-import requests
-import server.physics as physics
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from common.protocol import PROTOCOL_JSON, negotiate_protocol
+from server.connection import PlayerConnection, StateSerializer
+from server.recording import start_match
+from server.tick import TickScheduler
+from server.event_loop import EventLoopGameServer
+from server.sharding import ShardedGameServer
+from server.matchmaking import Matchmaker, socket_is_alive, fetch_rating, DEFAULT_RATING
+from server.result_reporter import get_result_reporter
+from server.game_stats import GAME_STATS
+from server.metrics import REGISTRY
+from server.spectators import SPECTATORS, spectate_request
+from server.stats_server import STATS_PORT, start_stats_server
 
 HTTP_SERVER_URL = 'http://127.0.0.1:8000'
 GAME_PORT = 9999
-WIDTH, HEIGHT = 1200, 800
-WINNING_SCORE = 5
+TICK_RATE = 60
+MATCHMAKING_INTERVAL = 0.25
 
-waiting_players = []
+matchmaker = Matchmaker(is_alive=lambda player: socket_is_alive(player['conn']))
 lock = threading.Lock()
+rating_pool = ThreadPoolExecutor(4, thread_name_prefix='rating')
+REGISTRY.gauge('matchmaking_queue_length', lambda: len(matchmaker), "Players waiting for a match")
+REGISTRY.histogram_source('matchmaking_wait_seconds', lambda: matchmaker.waits, "Time players waited to be paired")
 
-def report_game_result_to_http_server(token, won, goals_scored, goals_conceded, score_change):
-    try:
-        payload = {
-            'token': token, 
-            'won': won, 
-            'goals_scored': goals_scored, 
-            'goals_conceded': goals_conceded,
-            'score_change': score_change
-        }
-        requests.post(f"{HTTP_SERVER_URL}/game-result", json=payload, timeout=5)
-        result = "WON" if won else "LOST"
-        print(f"Reported game result for token {token[:8]}...: {result} ({goals_scored}-{goals_conceded}), score change: {score_change:+}")
-    except requests.RequestException as e:
-        print(f"Could not report game result: {e}")
+def report_final_scores(score, p1_token, p2_token):
+    """Queue both players' results for the background reporter; never blocks the caller"""
+    get_result_reporter(HTTP_SERVER_URL).submit(score, p1_token, p2_token)
 
 class GameSession(threading.Thread):
-    def __init__(self, p1_conn, p1_name, p1_token, p2_conn, p2_name, p2_token):
+    def __init__(self, p1_conn, p1_name, p1_token, p2_conn, p2_name, p2_token, tick_rate=TICK_RATE,
+                 p1_protocol=PROTOCOL_JSON, p2_protocol=PROTOCOL_JSON, record_dir=None):
         super().__init__()
         self.p1_conn, self.p1_name, self.p1_token = p1_conn, p1_name, p1_token
         self.p2_conn, self.p2_name, self.p2_token = p2_conn, p2_name, p2_token
-        self.game_state = {
-            'puck_pos': [WIDTH / 2, HEIGHT / 2], 'puck_vel': [random.choice([-3, 3]), random.choice([-3, 3])],
-            'p1_pos': [WIDTH / 4, HEIGHT / 2],
-            'p2_pos': [WIDTH * 3 / 4, HEIGHT / 2],
-            'score': [0, 0], 'game_over': False,
-            'p1_name': self.p1_name, 'p2_name': self.p2_name
-        }
-        
-        self.prev_p1_pos = [WIDTH / 4, HEIGHT / 2]
-        self.prev_p2_pos = [WIDTH * 3 / 4, HEIGHT / 2]
-
-    def reset_puck(self):
-        self.game_state['puck_pos'] = [WIDTH / 2, HEIGHT / 2]
-        self.game_state['puck_vel'] = [random.choice([-3, 3]), random.choice([-3, 3])]
-        time.sleep(1)
+        self.p1_protocol, self.p2_protocol = p1_protocol, p2_protocol
+        self.match, self.recorder = start_match(p1_name, p2_name, tick_rate, record_dir)
+        self.game_state = self.match.game_state
+        self.scheduler = TickScheduler(tick_rate)
+        self.serializer = StateSerializer()
+        self.channel = SPECTATORS.open_channel(p1_name, p2_name)
 
     def run(self):
-        print(f"Game session started between {self.p1_name} and {self.p2_name}.")
+        print(f"Game session {self.channel.id} started between {self.p1_name} and {self.p2_name}.")
+        p1 = PlayerConnection(self.p1_conn, None)
+        p2 = PlayerConnection(self.p2_conn, None)
+        p1.set_protocol(self.p1_protocol)
+        p2.set_protocol(self.p2_protocol)
+        selector = selectors.DefaultSelector()
         try:
-            self.p1_conn.sendall(json.dumps({'player_id': 1}).encode())
-            self.p2_conn.sendall(json.dumps({'player_id': 2}).encode())
+            p1.send(p1.start_message(1, self.p1_name, self.p2_name))
+            p2.send(p2.start_message(2, self.p1_name, self.p2_name))
+            for player in (p1, p2):
+                selector.register(player.conn, selectors.EVENT_READ, player)
         except socket.error:
+            SPECTATORS.close_channel(self.channel)
             self.close_connections()
             return
 
-        PADDLE_RADIUS, PUCK_RADIUS = 25, 15
-        GOAL_HEIGHT = 150
-        GOAL_TOP_Y = HEIGHT/2 - GOAL_HEIGHT/2
-        GOAL_BOTTOM_Y = HEIGHT/2 + GOAL_HEIGHT/2
-
+        # Inputs are read as they arrive; the simulation advances on its own clock
+        stats = GAME_STATS.open_session()
         while not self.game_state['game_over']:
             try:
-                p1_input = json.loads(self.p1_conn.recv(1024).decode())
-                p2_input = json.loads(self.p2_conn.recv(1024).decode())
-
-                # Update paddle positions 
-                p1_x = max(PADDLE_RADIUS, min(p1_input['x'], WIDTH / 2 - PADDLE_RADIUS))
-                p1_y = max(PADDLE_RADIUS, min(p1_input['y'], HEIGHT - PADDLE_RADIUS))
-                
-                p2_x = max(WIDTH / 2 + PADDLE_RADIUS, min(p2_input['x'], WIDTH - PADDLE_RADIUS))
-                p2_y = max(PADDLE_RADIUS, min(p2_input['y'], HEIGHT - PADDLE_RADIUS))
-                
-                # Count paddle velocities
-                p1_vel = [p1_x - self.prev_p1_pos[0], p1_y - self.prev_p1_pos[1]]
-                p2_vel = [p2_x - self.prev_p2_pos[0], p2_y - self.prev_p2_pos[1]]
-                
-                self.game_state['p1_pos'] = [p1_x, p1_y]
-                self.game_state['p2_pos'] = [p2_x, p2_y]
-
-                # Use physics module
-                self.game_state['puck_vel'] = physics.apply_friction(self.game_state['puck_vel'])
-
-                self.game_state['puck_pos'][0] += self.game_state['puck_vel'][0]
-                self.game_state['puck_pos'][1] += self.game_state['puck_vel'][1]
-
-                self.game_state['puck_pos'], self.game_state['puck_vel'] = physics.handle_wall_collision(
-                    self.game_state['puck_pos'], self.game_state['puck_vel'], PUCK_RADIUS, HEIGHT
-                )
-
-                self.game_state['puck_pos'], self.game_state['puck_vel'] = physics.handle_paddle_collision(
-                    self.game_state['puck_pos'], self.game_state['puck_vel'], 
-                    self.game_state['p1_pos'], PADDLE_RADIUS, PUCK_RADIUS, p1_vel, is_player1=True
-                )
-
-                self.game_state['puck_pos'], self.game_state['puck_vel'] = physics.handle_paddle_collision(
-                    self.game_state['puck_pos'], self.game_state['puck_vel'], 
-                    self.game_state['p2_pos'], PADDLE_RADIUS, PUCK_RADIUS, p2_vel, is_player1=False
-                )
-
-                self.prev_p1_pos = [p1_x, p1_y]
-                self.prev_p2_pos = [p2_x, p2_y]
-
-                self.game_state['puck_vel'] = physics.clamp_velocity(self.game_state['puck_vel'])
-
-                puck = self.game_state['puck_pos']
-                if puck[0] < PUCK_RADIUS:
-                    if GOAL_TOP_Y < puck[1] < GOAL_BOTTOM_Y:
-                        self.game_state['score'][1] += 1
-                        self.reset_puck()
-                    else: 
-                        puck[0] = PUCK_RADIUS
-                        self.game_state['puck_vel'][0] = abs(self.game_state['puck_vel'][0]) * 0.95
-                elif puck[0] > WIDTH - PUCK_RADIUS:
-                    if GOAL_TOP_Y < puck[1] < GOAL_BOTTOM_Y:
-                        self.game_state['score'][0] += 1
-                        self.reset_puck()
-                    else: 
-                        puck[0] = WIDTH - PUCK_RADIUS
-                        self.game_state['puck_vel'][0] = -abs(self.game_state['puck_vel'][0]) * 0.95
-                
-                # Check win condition
-                if self.game_state['score'][0] >= WINNING_SCORE or self.game_state['score'][1] >= WINNING_SCORE:
-                    self.game_state['game_over'] = True
+                waiting = time.monotonic()
+                events = selector.select(self.scheduler.time_until_next_tick())
+                stats.recv_wait_seconds.observe(time.monotonic() - waiting)
+                for key, mask in events:
+                    if mask & selectors.EVENT_READ:
+                        key.data.read_input()
+                    if mask & selectors.EVENT_WRITE:
+                        key.data.flush()
+
+                ticks = self.scheduler.ticks_due()
+                if not ticks:
+                    continue
+                started = time.monotonic()
+                for _ in range(ticks):
+                    p1_input, p2_input = p1.take_input(), p2.take_input()
+                    scored = self.match.step(p1_input, p2_input)
+                    if self.recorder:
+                        self.recorder.record(self.match, p1_input, p2_input, scored)
+                    if self.game_state['game_over']:
+                        break
+                stats.ticked(started, ticks)
 
                 # Send game state
-                self.p1_conn.sendall(json.dumps(self.game_state).encode())
-                self.p2_conn.sendall(json.dumps(self.game_state).encode())
-                
-                time.sleep(1 / 60)
-            except (socket.error, json.JSONDecodeError):
+                started = time.monotonic()
+                frames = self.serializer.encode(self.game_state, self.match.tick, (p1, p2))
+                for player, frame in zip((p1, p2), frames):
+                    drained = player.send(frame)
+                    events = selectors.EVENT_READ if drained else selectors.EVENT_READ | selectors.EVENT_WRITE
+                    selector.modify(player.conn, events, player)
+                stats.sent(started, frames)
+                self.channel.publish(self.game_state, self.match.tick)
+            except (socket.error, ValueError, KeyError, TypeError):
                 break
-        
+
+        for player in (p1, p2):
+            player.drain()
+        selector.close()
+        SPECTATORS.close_channel(self.channel)
+        if self.recorder:
+            self.recorder.close()
+        GAME_STATS.close_session(stats)
+        print(f"Session {self.p1_name} vs {self.p2_name} ended: {stats.summary()}")
+        if self.scheduler.overruns:
+            print(f"Session {self.p1_name} vs {self.p2_name}: {self.scheduler.overruns} tick overruns, "
+                  f"{self.scheduler.dropped_ticks} ticks dropped")
+
         self.calculate_and_report_final_scores()
         self.close_connections()
 
     def calculate_and_report_final_scores(self):
         """Calculate and report both score changes and detailed game statistics"""
-        p1_goals = self.game_state['score'][0]
-        p2_goals = self.game_state['score'][1]
-        score_diff = abs(p1_goals - p2_goals)
-        
-        if p1_goals > p2_goals:
-            # Player 1 won
-            report_game_result_to_http_server(self.p1_token, True, p1_goals, p2_goals, score_diff)
-            report_game_result_to_http_server(self.p2_token, False, p2_goals, p1_goals, -score_diff)
-            
-        elif p2_goals > p1_goals:
-            # Player 2 won
-            report_game_result_to_http_server(self.p2_token, True, p2_goals, p1_goals, score_diff)
-            report_game_result_to_http_server(self.p1_token, False, p1_goals, p2_goals, -score_diff)
+        report_final_scores(self.game_state['score'], self.p1_token, self.p2_token)
 
     def close_connections(self):
         try: self.p1_conn.close(); self.p2_conn.close()
         except socket.error: pass
 
-def run_game_server():
+def start_game_session(p1, p2, tick_rate, record_dir=None):
+    GameSession(p1['conn'], p1['name'], p1['token'], p2['conn'], p2['name'], p2['token'], tick_rate,
+                p1['protocol'], p2['protocol'], record_dir).start()
+
+def run_matchmaking(tick_rate, record_dir=None):
+    """Pair waiting players whose rating window has widened enough to find a partner"""
+    while True:
+        time.sleep(MATCHMAKING_INTERVAL)
+        with lock:
+            pairs = matchmaker.match()
+        for p1, p2 in pairs:
+            start_game_session(p1, p2, tick_rate, record_dir)
+
+def enqueue_player(player, tick_rate, record_dir=None):
+    """Look up the player's rating and queue them for a match (runs on rating_pool)"""
+    try:
+        rating = fetch_rating(HTTP_SERVER_URL, player['name'])
+    except Exception as e:
+        print(f"Could not fetch rating for {player['name']}: {e}")
+        rating = DEFAULT_RATING
+    with lock:
+        pair = matchmaker.enqueue(player, rating)
+    if pair:
+        start_game_session(*pair, tick_rate, record_dir)
+
+def run_game_server(tick_rate=TICK_RATE, record_dir=None):
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     server_socket.bind(('0.0.0.0', GAME_PORT))
     server_socket.listen(2)
     print(f"Game server listening on port {GAME_PORT}...")
+    threading.Thread(target=run_matchmaking, args=(tick_rate, record_dir), daemon=True).start()
     while True:
         conn, addr = server_socket.accept()
         try:
             login_data = json.loads(conn.recv(1024).decode())
+            if spectate_request(login_data) is not None:
+                SPECTATORS.subscribe_login(conn, login_data)
+                continue
             name, token = login_data['name'], login_data['token']
+            protocol = negotiate_protocol(login_data)
             print(f"Player '{name}' connected from {addr} with token {token[:8]}...")
-            with lock:
-                waiting_players.append({'conn': conn, 'name': name, 'token': token})
-                if len(waiting_players) >= 2:
-                    p1, p2 = waiting_players.pop(0), waiting_players.pop(0)
-                    GameSession(p1['conn'], p1['name'], p1['token'], p2['conn'], p2['name'], p2['token']).start()
-        except (socket.error, json.JSONDecodeError, KeyError) as e:
+            # A slow HTTP API must not hold up the accept loop, so ratings are looked up on a pool
+            rating_pool.submit(enqueue_player, {'conn': conn, 'name': name, 'token': token, 'protocol': protocol},
+                               tick_rate, record_dir)
+        except (socket.error, json.JSONDecodeError, KeyError, TypeError, AttributeError) as e:
             print(f"Error receiving login data: {e}")
             conn.close()
 
+def report_session_in_background(session):
+    report_final_scores(session.game_state['score'], session.p1_token, session.p2_token)
+
+def run_event_loop_game_server(tick_rate=TICK_RATE, record_dir=None):
+    EventLoopGameServer(GAME_PORT, tick_rate, on_match_end=report_session_in_background,
+                        rating_source=functools.partial(fetch_rating, HTTP_SERVER_URL), record_dir=record_dir).run()
+
+def run_sharded_game_server(tick_rate=TICK_RATE, workers=None, record_dir=None):
+    ShardedGameServer(GAME_PORT, workers, tick_rate, on_match_end=report_session_in_background,
+                      rating_source=functools.partial(fetch_rating, HTTP_SERVER_URL), record_dir=record_dir).run()
+
 if __name__ == "__main__":
-    run_game_server()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Air hockey game server")
+    parser.add_argument('--event-loop', action='store_true',
+                        help="serve all matches from a single selector-driven thread")
+    parser.add_argument('--tick-rate', type=int, default=TICK_RATE,
+                        help="simulation ticks per second (below 60, swept collision keeps the physics accurate)")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="host matches in this many worker processes (0 = one per CPU core)")
+    parser.add_argument('--stats-port', type=int, default=STATS_PORT,
+                        help="localhost port serving /metrics (Prometheus) and /stats (JSON); 0 disables it")
+    parser.add_argument('--record-dir', default=None,
+                        help="record every match to a compact binary file in this directory (play back with replay.py)")
+    args = parser.parse_args()
+    if args.record_dir:
+        os.makedirs(args.record_dir, exist_ok=True)
+    if args.stats_port:
+        start_stats_server(args.stats_port)
+    if args.workers is not None:
+        run_sharded_game_server(args.tick_rate, args.workers, args.record_dir)
+    elif args.event_loop:
+        run_event_loop_game_server(args.tick_rate, args.record_dir)
+    else:
+        run_game_server(args.tick_rate, args.record_dir)
@@ -0,0 +1,129 @@
+"""Play back a match recorded with game_server.py --record-dir.
+
+    python replay.py RECORDING [--goal N | --at SECONDS] [--speed X]
+    python replay.py RECORDING --info      print the header and goal index
+    python replay.py RECORDING --verify    re-simulate the recorded inputs headlessly
+
+While playing: space pauses, left/right seek 5 seconds, up/down jump to the
+previous/next goal, escape quits.
+"""
+import argparse
+import sys
+import time
+from server.recording import ReplayReader
+
+WIDTH, HEIGHT = 1200, 800
+PADDLE_RADIUS, PUCK_RADIUS = 25, 15
+SEEK_SECONDS = 5
+GOAL_LEAD_SECONDS = 3
+
+def print_info(replay):
+    started = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(replay.started))
+    final = replay.state_at(len(replay) - 1)
+    print(f"{replay.p1_name} vs {replay.p2_name}, started {started}")
+    print(f"{len(replay)} ticks at {replay.tick_rate} Hz ({len(replay) / replay.tick_rate:.1f} s), "
+          f"final score {final['score'][0]}-{final['score'][1]}, seed {replay.seed}"
+          f"{'' if replay.complete else ' (no goal index: the recording was cut short)'}")
+    for n, tick in enumerate(replay.goal_ticks):
+        score = replay.state_at(tick)['score']
+        print(f"  goal {n}: tick {tick} ({tick / replay.tick_rate:.1f} s), {score[0]}-{score[1]}")
+
+def verify(replay):
+    started = time.perf_counter()
+    tick = replay.verify()
+    elapsed = time.perf_counter() - started
+    if tick is None:
+        print(f"Re-simulated {len(replay) - 1} ticks in {elapsed:.2f} s: identical to the recording")
+        return True
+    print(f"Re-simulation diverges from the recording at tick {tick}")
+    return False
+
+def goal_start(replay, n):
+    return max(0, replay.goal_tick(n) - GOAL_LEAD_SECONDS * replay.tick_rate)
+
+def play(replay, tick, speed):
+    import pygame
+    from client.graphics import (
+        draw_arena, update_puck_trail, draw_puck_trail, draw_paddle, draw_puck, draw_score_display, show_message,
+        P1_PADDLE_COLOR, P2_PADDLE_COLOR
+    )
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption(f"Replay: {replay.p1_name} vs {replay.p2_name}")
+    clock = pygame.time.Clock()
+    last = len(replay) - 1
+    position = float(tick)
+    paused = False
+    while True:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                pygame.quit()
+                return
+            if event.type != pygame.KEYDOWN:
+                continue
+            if event.key == pygame.K_SPACE:
+                paused = not paused
+            elif event.key in (pygame.K_LEFT, pygame.K_RIGHT):
+                step = SEEK_SECONDS * replay.tick_rate
+                position = max(0, min(last, position + (step if event.key == pygame.K_RIGHT else -step)))
+            elif event.key == pygame.K_DOWN:
+                ahead = [n for n in range(len(replay.goal_ticks)) if goal_start(replay, n) > int(position)]
+                if ahead:
+                    position = goal_start(replay, ahead[0])
+            elif event.key == pygame.K_UP:
+                behind = [n for n in range(len(replay.goal_ticks)) if goal_start(replay, n) < int(position) - 1]
+                if behind:
+                    position = goal_start(replay, behind[-1])
+
+        state = replay.state_at(int(position))
+        draw_arena(screen)
+        draw_paddle(screen, [int(c) for c in state['p1_pos']], P1_PADDLE_COLOR, PADDLE_RADIUS)
+        draw_paddle(screen, [int(c) for c in state['p2_pos']], P2_PADDLE_COLOR, PADDLE_RADIUS)
+        puck_pos = [int(c) for c in state['puck_pos']]
+        update_puck_trail(puck_pos)
+        draw_puck_trail(screen)
+        draw_puck(screen, puck_pos, PUCK_RADIUS)
+        draw_score_display(screen, state['p1_name'], state['p2_name'], state['score'])
+        pygame.display.flip()
+
+        if int(position) >= last and not paused:
+            show_message(screen, "End of replay", duration=2000)
+            pygame.quit()
+            return
+        # Draw at 60 fps whatever the recorded tick rate, advancing through the ticks at the requested speed
+        elapsed = clock.tick(60) / 1000
+        if not paused:
+            position = min(last, position + elapsed * replay.tick_rate * speed)
+
+def main():
+    parser = argparse.ArgumentParser(description="Play back a recorded air hockey match")
+    parser.add_argument('recording')
+    parser.add_argument('--info', action='store_true', help="print the recording's header and goal index")
+    parser.add_argument('--verify', action='store_true',
+                        help="re-simulate the recorded inputs without a window and compare every tick")
+    parser.add_argument('--goal', type=int, default=None,
+                        help=f"start {GOAL_LEAD_SECONDS} seconds before this goal (counting from 0)")
+    parser.add_argument('--at', type=float, default=0.0, help="start this many seconds into the match")
+    parser.add_argument('--speed', type=float, default=1.0, help="playback speed")
+    args = parser.parse_args()
+
+    try:
+        replay = ReplayReader(args.recording)
+    except (OSError, ValueError) as e:
+        sys.exit(f"Cannot open {args.recording}: {e}")
+    with replay:
+        if args.info or args.verify:
+            print_info(replay)
+            if args.verify and not verify(replay):
+                sys.exit(1)
+            return
+        if args.goal is not None:
+            if not 0 <= args.goal < len(replay.goal_ticks):
+                sys.exit(f"The recording has {len(replay.goal_ticks)} goals")
+            tick = goal_start(replay, args.goal)
+        else:
+            tick = replay.tick_at(args.at)
+        play(replay, tick, args.speed)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Structured access log written off the request path.
+
+Request threads only build a small dict and put it on a bounded queue. A
+single writer thread redacts and serializes the records and writes them as
+JSON lines, in batches. When the queue is full, records are dropped and
+counted, so a slow log never slows down requests.
+
+Successful requests can be sampled (sample_rate=0.1 keeps one in ten).
+Errors (status 400 and up) are always logged. Values under sensitive keys,
+such as passwords and tokens, are replaced in records and in query strings
+before anything is written.
+"""
+import atexit
+import json
+import queue
+import random
+import sys
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode
+
+SENSITIVE_FIELDS = frozenset({'password', 'password_hash', 'token', 'authorization', 'cookie'})
+REDACTED = '[redacted]'
+MAX_QUEUE = 10000
+
+def redact(value):
+    """A copy of value with every sensitive dict entry replaced, at any depth"""
+    if isinstance(value, dict):
+        return {key: REDACTED if str(key).lower() in SENSITIVE_FIELDS else redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return value
+
+def redact_path(path):
+    path, separator, query = path.partition('?')
+    if not query:
+        return path
+    pairs = [(key, REDACTED if key.lower() in SENSITIVE_FIELDS else item)
+             for key, item in parse_qsl(query, keep_blank_values=True)]
+    return path + separator + urlencode(pairs, safe='[]/')
+
+class AccessLogger:
+    def __init__(self, stream=None, sample_rate=1.0, max_queue=MAX_QUEUE):
+        self.stream = stream or sys.stdout
+        self.sample_rate = sample_rate
+        self.queue = queue.Queue(max_queue)
+        self.written = self.dropped = self.sampled_out = 0
+        self.thread = threading.Thread(target=self.run, name='access-log', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def log(self, record):
+        """Queue a record for writing; never blocks"""
+        if self.sample_rate < 1 and record.get('status', 0) < 400 and random.random() >= self.sample_rate:
+            self.sampled_out += 1
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout=2):
+        """Write what is queued and stop the writer thread"""
+        if self.thread.is_alive():
+            try:
+                self.queue.put(None, timeout=timeout)
+            except queue.Full:
+                return
+            self.thread.join(timeout)
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            records = [self.queue.get()]
+            while len(records) < 1000:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in records:
+                stopping = True
+                records = [record for record in records if record is not None]
+            lines = []
+            for record in records:
+                record = redact(record)
+                if 'path' in record:
+                    record['path'] = redact_path(record['path'])
+                if 'time' in record:
+                    record['time'] = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record['time'])) + \
+                        f".{int(record['time'] % 1 * 1000):03d}Z"
+                lines.append(json.dumps(record, default=str))
+            if not lines:
+                continue
+            try:
+                self.stream.write('\n'.join(lines) + '\n')
+                self.stream.flush()
+                self.written += len(lines)
+            except (OSError, ValueError):
+                self.dropped += len(lines)
@@ -0,0 +1,196 @@
+"""Vectorized physics that advances many matches in one NumPy step.
+
+Puck and paddle state for every match lives in structure-of-arrays buffers
+(one row per match slot) and BatchPhysics.step() applies the same rules as
+Match.step() -- friction, walls, paddle reflection with angle jitter and
+momentum transfer, speed clamping, goals and the serve phase -- to all
+active slots at once. With jitter disabled the results match the scalar
+functions in server/physics.py to floating point tolerance.
+
+Time is scaled by dt = BASE_TICK_RATE / tick_rate exactly as in Match.
+Swept collision is not vectorized, so below BASE_TICK_RATE, where Match
+switches it on by default, BatchPhysics must be created with swept=False
+and then matches Match(..., swept=False).
+"""
+import numpy as np
+from server.match import (
+    WIDTH, HEIGHT, WINNING_SCORE, PADDLE_RADIUS, PUCK_RADIUS,
+    GOAL_TOP_Y, GOAL_BOTTOM_Y, SERVE_DELAY, BASE_TICK_RATE
+)
+from server.physics import FRICTION
+
+MAX_SPEED, MIN_SPEED = 20, 1.0
+WALL_RESTITUTION = 0.95
+MOMENTUM_FACTOR = 0.4
+BASE_ENERGY_BOOST = 1.1
+MAX_SPEED_BONUS = 0.3
+
+class BatchPhysics:
+    def __init__(self, capacity, tick_rate=BASE_TICK_RATE, seed=None, angle_jitter=0.05, swept=None):
+        swept = tick_rate < BASE_TICK_RATE if swept is None else swept
+        if swept:
+            raise ValueError("BatchPhysics has no swept collision; pass swept=False below "
+                             f"{BASE_TICK_RATE} ticks per second")
+        self.capacity = capacity
+        self.dt = BASE_TICK_RATE / tick_rate
+        self.friction = FRICTION ** self.dt
+        self.serve_delay_ticks = round(SERVE_DELAY * tick_rate)
+        self.angle_jitter = angle_jitter
+        self.rng = np.random.default_rng(seed)
+
+        self.puck_pos = np.zeros((capacity, 2))
+        self.puck_vel = np.zeros((capacity, 2))
+        self.p1_pos = np.zeros((capacity, 2))
+        self.p2_pos = np.zeros((capacity, 2))
+        self.prev_p1_pos = np.zeros((capacity, 2))
+        self.prev_p2_pos = np.zeros((capacity, 2))
+        self.p1_target = np.zeros((capacity, 2))
+        self.p2_target = np.zeros((capacity, 2))
+        self.score = np.zeros((capacity, 2), dtype=np.int32)
+        self.serve_ticks = np.zeros(capacity, dtype=np.int32)
+        self.game_over = np.zeros(capacity, dtype=bool)
+        self.active = np.zeros(capacity, dtype=bool)
+
+        # Paddle clamping bounds per player: (min_x, max_x), y bounds are shared
+        self.p1_x_bounds = (PADDLE_RADIUS, WIDTH / 2 - PADDLE_RADIUS)
+        self.p2_x_bounds = (WIDTH / 2 + PADDLE_RADIUS, WIDTH - PADDLE_RADIUS)
+        self.y_bounds = (PADDLE_RADIUS, HEIGHT - PADDLE_RADIUS)
+
+    def add_match(self, puck_vel=None):
+        """Claim a free slot for a new match and return its index"""
+        free = np.flatnonzero(~self.active)
+        if not len(free):
+            raise RuntimeError("BatchPhysics is full")
+        slot = int(free[0])
+        self.active[slot] = True
+        self.game_over[slot] = False
+        self.score[slot] = 0
+        self.serve_ticks[slot] = 0
+        self.puck_pos[slot] = (WIDTH / 2, HEIGHT / 2)
+        self.puck_vel[slot] = puck_vel if puck_vel is not None else self.rng.choice([-3.0, 3.0], 2)
+        for pos in (self.p1_pos, self.prev_p1_pos, self.p1_target):
+            pos[slot] = (WIDTH / 4, HEIGHT / 2)
+        for pos in (self.p2_pos, self.prev_p2_pos, self.p2_target):
+            pos[slot] = (WIDTH * 3 / 4, HEIGHT / 2)
+        return slot
+
+    def remove_match(self, slot):
+        self.active[slot] = False
+
+    def set_targets(self, slot, p1_target=None, p2_target=None):
+        """Latest paddle input for a match; None keeps the previous target"""
+        if p1_target is not None:
+            self.p1_target[slot] = p1_target
+        if p2_target is not None:
+            self.p2_target[slot] = p2_target
+
+    def game_state(self, slot):
+        """Snapshot of one slot in the same shape as Match.game_state (minus names)"""
+        return {
+            'puck_pos': self.puck_pos[slot].tolist(), 'puck_vel': self.puck_vel[slot].tolist(),
+            'p1_pos': self.p1_pos[slot].tolist(), 'p2_pos': self.p2_pos[slot].tolist(),
+            'score': self.score[slot].tolist(), 'game_over': bool(self.game_over[slot])
+        }
+
+    def step(self):
+        """Advance every active match by one tick. Returns the slots that scored."""
+        running = self.active & ~self.game_over
+
+        # Paddles follow their targets, clamped to each player's half
+        np.clip(self.p1_target[:, 0], *self.p1_x_bounds, out=self.p1_pos[:, 0], where=running)
+        np.clip(self.p1_target[:, 1], *self.y_bounds, out=self.p1_pos[:, 1], where=running)
+        np.clip(self.p2_target[:, 0], *self.p2_x_bounds, out=self.p2_pos[:, 0], where=running)
+        np.clip(self.p2_target[:, 1], *self.y_bounds, out=self.p2_pos[:, 1], where=running)
+        # Paddle velocities in px per base tick, as in Match.step
+        p1_vel = (self.p1_pos - self.prev_p1_pos) / self.dt
+        p2_vel = (self.p2_pos - self.prev_p2_pos) / self.dt
+        self.prev_p1_pos[running] = self.p1_pos[running]
+        self.prev_p2_pos[running] = self.p2_pos[running]
+
+        # Matches in their serve phase only move paddles
+        serving = running & (self.serve_ticks > 0)
+        self.serve_ticks[serving] -= 1
+        moving = running & ~serving
+        if not moving.any():
+            return np.empty(0, dtype=np.intp)
+
+        pos, vel = self.puck_pos, self.puck_vel
+        vel[moving] *= self.friction
+        pos[moving] += vel[moving] * self.dt
+
+        # Top and bottom walls
+        top = moving & (pos[:, 1] <= PUCK_RADIUS)
+        bottom = moving & ~top & (pos[:, 1] >= HEIGHT - PUCK_RADIUS)
+        pos[top, 1] = PUCK_RADIUS
+        vel[top, 1] = np.abs(vel[top, 1]) * WALL_RESTITUTION
+        pos[bottom, 1] = HEIGHT - PUCK_RADIUS
+        vel[bottom, 1] = -np.abs(vel[bottom, 1]) * WALL_RESTITUTION
+
+        # Paddles, player 1 first exactly like the scalar step
+        self._paddle_collision(moving, self.p1_pos, p1_vel, 1.0)
+        self._paddle_collision(moving, self.p2_pos, p2_vel, -1.0)
+
+        # Speed clamp
+        speed = np.hypot(vel[:, 0], vel[:, 1])
+        fast = moving & (speed > MAX_SPEED)
+        slow = moving & (speed < MIN_SPEED) & (speed > 0)
+        vel[fast] *= (MAX_SPEED / speed[fast])[:, None]
+        vel[slow] *= (MIN_SPEED / speed[slow])[:, None]
+
+        # Goal lines: inside the goal mouth scores, elsewhere the end wall bounces
+        in_goal_mouth = (pos[:, 1] > GOAL_TOP_Y) & (pos[:, 1] < GOAL_BOTTOM_Y)
+        left = moving & (pos[:, 0] < PUCK_RADIUS)
+        right = moving & ~left & (pos[:, 0] > WIDTH - PUCK_RADIUS)
+        left_goal, right_goal = left & in_goal_mouth, right & in_goal_mouth
+        left_wall, right_wall = left & ~in_goal_mouth, right & ~in_goal_mouth
+        pos[left_wall, 0] = PUCK_RADIUS
+        vel[left_wall, 0] = np.abs(vel[left_wall, 0]) * WALL_RESTITUTION
+        pos[right_wall, 0] = WIDTH - PUCK_RADIUS
+        vel[right_wall, 0] = -np.abs(vel[right_wall, 0]) * WALL_RESTITUTION
+
+        self.score[left_goal, 1] += 1
+        self.score[right_goal, 0] += 1
+        scored = left_goal | right_goal
+        scored_slots = np.flatnonzero(scored)
+        if len(scored_slots):
+            pos[scored_slots] = (WIDTH / 2, HEIGHT / 2)
+            vel[scored_slots] = self.rng.choice([-3.0, 3.0], (len(scored_slots), 2))
+            self.serve_ticks[scored_slots] = self.serve_delay_ticks
+            self.game_over |= self.active & (self.score.max(axis=1) >= WINNING_SCORE)
+        return scored_slots
+
+    def _paddle_collision(self, moving, paddle_pos, paddle_vel, default_normal_x):
+        pos, vel = self.puck_pos, self.puck_vel
+        offset = pos - paddle_pos
+        dist = np.hypot(offset[:, 0], offset[:, 1])
+        hit = moving & (dist < PUCK_RADIUS + PADDLE_RADIUS)
+        if not hit.any():
+            return
+        idx = np.flatnonzero(hit)
+        d = dist[idx]
+        normal = np.empty((len(idx), 2))
+        separated = d > 0
+        normal[separated] = offset[idx[separated]] / d[separated, None]
+        normal[~separated] = (default_normal_x, 0.0)
+
+        pos[idx] += normal * ((PUCK_RADIUS + PADDLE_RADIUS) - d)[:, None]
+
+        dot = np.einsum('ij,ij->i', vel[idx], normal)
+        bouncing = dot < 0
+        if not bouncing.any():
+            return
+        idx, normal, dot = idx[bouncing], normal[bouncing], dot[bouncing]
+        v = vel[idx] - 2 * dot[:, None] * normal
+
+        # Small random change of direction keeps rallies from repeating exactly
+        speed = np.hypot(v[:, 0], v[:, 1])
+        angle = np.arctan2(v[:, 1], v[:, 0])
+        if self.angle_jitter:
+            angle += (self.rng.random(len(idx)) - 0.5) * self.angle_jitter
+        v = np.stack((speed * np.cos(angle), speed * np.sin(angle)), axis=1)
+
+        pv = paddle_vel[idx]
+        v += pv * MOMENTUM_FACTOR
+        v *= BASE_ENERGY_BOOST
+        v *= (1.0 + np.minimum(np.hypot(pv[:, 0], pv[:, 1]) * 0.02, MAX_SPEED_BONUS))[:, None]
+        vel[idx] = v
@@ -0,0 +1,136 @@
+import json
+import socket
+from common.protocol import (
+    JsonStreamDecoder, FrameDecoder, StateEncoder, SnapshotEncoder,
+    PROTOCOL_JSON, PROTOCOL_BINARY, PROTOCOL_DELTA, MSG_INPUT, MSG_INPUT_ACK,
+    decode_input, decode_input_ack
+)
+
+MAX_OUTBUF_BYTES = 256 * 1024
+
+class PlayerConnection:
+    """Non-blocking player socket with buffered input and output"""
+    def __init__(self, conn, addr):
+        conn.setblocking(False)
+        self.conn, self.addr = conn, addr
+        self.name, self.token = None, None
+        self.session = None
+        self.protocol = PROTOCOL_JSON
+        self.decoder = JsonStreamDecoder()
+        self.latest_input = None
+        self.acked_tick = 0
+        self.outbuf = bytearray()
+        self.closing = False
+        self.closed = False
+
+    def fileno(self):
+        return self.conn.fileno()
+
+    def read(self):
+        """Read whatever is available and return the decoded messages.
+
+        Raises ConnectionError when the peer has closed the connection.
+        """
+        try:
+            data = self.conn.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return []
+        if not data:
+            raise ConnectionError("connection closed by peer")
+        return self.decoder.feed(data)
+
+    def set_protocol(self, protocol):
+        """Switch to the wire protocol negotiated at login"""
+        self.protocol = protocol
+        if protocol in (PROTOCOL_BINARY, PROTOCOL_DELTA):
+            self.decoder = FrameDecoder()
+
+    def start_message(self, player_id, p1_name, p2_name):
+        """Handshake sent when the match starts; binary clients get the static fields here, once"""
+        message = {'player_id': player_id}
+        if self.protocol != PROTOCOL_JSON:
+            message.update({'protocol': self.protocol, 'p1_name': p1_name, 'p2_name': p2_name})
+        return json.dumps(message).encode()
+
+    def read_input(self):
+        """Read available messages and keep only the newest one as the current input"""
+        messages = self.read()
+        if self.protocol == PROTOCOL_DELTA:
+            for msg_type, payload in messages:
+                if msg_type == MSG_INPUT_ACK:
+                    self.latest_input, acked_tick = decode_input_ack(payload)
+                    self.acked_tick = max(self.acked_tick, acked_tick)
+        elif self.protocol == PROTOCOL_BINARY:
+            messages = [payload for msg_type, payload in messages if msg_type == MSG_INPUT]
+            if messages:
+                self.latest_input = decode_input(messages[-1])
+        elif messages:
+            self.latest_input = messages[-1]
+
+    def take_input(self):
+        """Return the newest input received since the last call, or None"""
+        latest, self.latest_input = self.latest_input, None
+        return latest
+
+    def send(self, data):
+        """Queue data and write as much as the socket accepts. Returns True when drained."""
+        self.outbuf += data
+        if len(self.outbuf) > MAX_OUTBUF_BYTES:
+            raise ConnectionError("client is not reading its game state")
+        return self.flush()
+
+    def flush(self):
+        while self.outbuf:
+            try:
+                sent = self.conn.send(self.outbuf)
+            except (BlockingIOError, InterruptedError):
+                return False
+            del self.outbuf[:sent]
+        return True
+
+    def drain(self, timeout=1.0):
+        """Blocking best-effort write of whatever is still queued, used before closing"""
+        if not self.outbuf or self.closed:
+            return
+        try:
+            self.conn.settimeout(timeout)
+            self.conn.sendall(self.outbuf)
+            self.outbuf.clear()
+        except socket.error:
+            pass
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.conn.close()
+        except socket.error:
+            pass
+
+class StateSerializer:
+    """Serializes one session's state for its players, once per distinct encoding"""
+    def __init__(self):
+        self.state_encoder = StateEncoder()
+        self.snapshot_encoder = SnapshotEncoder()
+
+    def encode(self, game_state, tick, players):
+        """Return the frame to send to each player, in the same order as players"""
+        frames = []
+        json_frame = binary_frame = None
+        recorded = False
+        for player in players:
+            if player.protocol == PROTOCOL_DELTA:
+                if not recorded:
+                    self.snapshot_encoder.record(game_state, tick)
+                    recorded = True
+                frames.append(self.snapshot_encoder.encode(player.acked_tick))
+            elif player.protocol == PROTOCOL_BINARY:
+                if binary_frame is None:
+                    binary_frame = self.state_encoder.encode(game_state, tick)
+                frames.append(binary_frame)
+            else:
+                if json_frame is None:
+                    json_frame = json.dumps(game_state).encode()
+                frames.append(json_frame)
+        return frames
@@ -1,69 +1,156 @@
+import itertools
 import sqlite3
 import threading
-import bcrypt
-import pandas as pd
 import os
+from server.metrics import REGISTRY
+from server.password_hasher import PasswordHasher
+from server.rank_index import RankIndex
 
 DB_FILE = 'gamedata.db'
+LEADERBOARD_COLUMNS = 'name, score, wins, losses, goals_scored, goals_conceded'
+LEADERBOARD_ORDER = 'score DESC, wins DESC, name ASC'
+CACHE_SIZE_KIB = 16 * 1024
+BUSY_TIMEOUT_MS = 5000
+# Parameters: win, loss, goals scored, goals conceded, score change, name
+UPDATE_RESULT_SQL = '''
+    UPDATE players
+    SET wins = wins + ?,
+        losses = losses + ?,
+        goals_scored = goals_scored + ?,
+        goals_conceded = goals_conceded + ?,
+        score = MAX(0, score + ?)
+    WHERE name = ?
+'''
+# Stays well under SQLite's limit on parameters per statement
+MAX_IN_PARAMS = 500
+
+REGISTRY.describe('db_query_seconds', "Time spent in SQLite per GameDB operation")
+
+# Schema changes in order. PRAGMA user_version records how many a database
+# has applied, so startup only runs the new ones, and none once it is current.
+MIGRATIONS = [
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS players (
+            name TEXT PRIMARY KEY,
+            password_hash TEXT NOT NULL,
+            score INTEGER DEFAULT 0 CHECK (score >= 0),
+            wins INTEGER DEFAULT 0 CHECK (wins >= 0),
+            losses INTEGER DEFAULT 0 CHECK (losses >= 0),
+            goals_scored INTEGER DEFAULT 0 CHECK (goals_scored >= 0),
+            goals_conceded INTEGER DEFAULT 0 CHECK (goals_conceded >= 0),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS update_players_timestamp
+        AFTER UPDATE ON players
+        BEGIN
+            UPDATE players SET updated_at = CURRENT_TIMESTAMP WHERE name = NEW.name;
+        END
+        ''',
+    ),
+    (
+        # Covers every leaderboard query, so pages are read straight from the index in order
+        '''
+        CREATE INDEX IF NOT EXISTS players_leaderboard
+        ON players (score DESC, wins DESC, name, losses, goals_scored, goals_conceded)
+        ''',
+    ),
+]
 
 class GameDB:
-    def __init__(self, db_file=DB_FILE):
+    def __init__(self, db_file=DB_FILE, hasher=None):
         self.db_file = db_file
-        self.lock = threading.Lock()
+        # bcrypt runs on the hasher's worker processes, not on the calling thread. Servers pass a hasher
+        # that is already started, because init_database() starts a thread and the workers must fork first.
+        self.hasher = hasher or PasswordHasher()
+        # One long-lived connection per thread, created on first use
+        self.local = threading.local()
+        self.connections = []
+        self.connections_lock = threading.Lock()
+        # Bumped after every committed write so caches of query results know when they are stale
+        self.version_counter = itertools.count(1)
+        self.version = 0
+        self.rank_index = RankIndex()
         self.init_database()
 
     def init_database(self):
         abspath = os.path.abspath(self.db_file)
         print(f"Database file location: {abspath}")
-        
-        with sqlite3.connect(self.db_file) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS players (
-                    name TEXT PRIMARY KEY,
-                    password_hash TEXT NOT NULL,
-                    score INTEGER DEFAULT 0 CHECK (score >= 0),
-                    wins INTEGER DEFAULT 0 CHECK (wins >= 0),
-                    losses INTEGER DEFAULT 0 CHECK (losses >= 0),
-                    goals_scored INTEGER DEFAULT 0 CHECK (goals_scored >= 0),
-                    goals_conceded INTEGER DEFAULT 0 CHECK (goals_conceded >= 0),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TRIGGER IF NOT EXISTS update_players_timestamp 
-                AFTER UPDATE ON players
-                BEGIN
-                    UPDATE players SET updated_at = CURRENT_TIMESTAMP WHERE name = NEW.name;
-                END
-            ''')
-            
-            for row in cursor.execute('SELECT name FROM players'):
-                print(f"Player {row[0]} already exists in the database.")
-            
+
+        conn = self.get_db_connection()
+        if conn.execute('PRAGMA user_version').fetchone()[0] < len(MIGRATIONS):
+            self.migrate(conn)
+
+        # Reading every player happens in the background, so startup time does not grow with the table
+        threading.Thread(target=self.load_rank_index, name='rank-index-loader', daemon=True).start()
+        print("Database initialized successfully")
+
+    def migrate(self, conn):
+        # BEGIN IMMEDIATE takes the write lock first, so concurrently starting processes migrate one at a time
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            for statements in MIGRATIONS[version:]:
+                for statement in statements:
+                    conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {len(MIGRATIONS)}')
             conn.commit()
-            print("Database initialized successfully")
-            
+        except BaseException:
+            conn.rollback()
+            raise
+        if version < len(MIGRATIONS):
+            print(f"Database schema migrated from version {version} to {len(MIGRATIONS)}")
+
+    def load_rank_index(self):
+        try:
+            self.rank_index.load(self.get_db_connection().execute('SELECT name, score, wins FROM players'))
+        except Exception as e:
+            print(f"Could not load the rank index: {e}")
+        finally:
+            # Whatever went wrong, the index must end up loaded, or every rank lookup would wait for it
+            if not self.rank_index.loaded.is_set():
+                self.rank_index.load([])
 
     def get_db_connection(self):
-        conn = sqlite3.connect(self.db_file, check_same_thread=False)
-        conn.row_factory = sqlite3.Row 
+        """This thread's connection, opened and tuned on first use.
+
+        WAL lets readers run alongside the single writer, synchronous=NORMAL
+        only syncs at checkpoints (still safe against corruption in WAL mode)
+        and statements are kept prepared in the connection's statement cache.
+        """
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            # check_same_thread=False only so close() can run from another thread; each connection is used by one thread
+            conn = sqlite3.connect(self.db_file, timeout=BUSY_TIMEOUT_MS / 1000, cached_statements=256,
+                                   check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA cache_size=-{CACHE_SIZE_KIB}')
+            conn.execute('PRAGMA temp_store=MEMORY')
+            self.local.conn = conn
+            with self.connections_lock:
+                self.connections.append(conn)
         return conn
 
+    def close(self):
+        """Close every thread's connection (call once no thread uses the database any more)"""
+        with self.connections_lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections.clear()
+        self.local = threading.local()
+
     def hash_password(self, password):
         """Hash password using bcrypt with automatic salt generation"""
-        password_bytes = password.encode('utf-8')
-        salt = bcrypt.gensalt()
-        hashed = bcrypt.hashpw(password_bytes, salt)
-        return hashed.decode('utf-8')
+        return self.hasher.hash(password)
 
     def verify_password(self, password, hashed_password):
         """Verify password against bcrypt hash"""
-        password_bytes = password.encode('utf-8')
-        hashed_bytes = hashed_password.encode('utf-8')
-        return bcrypt.checkpw(password_bytes, hashed_bytes)
+        return self.hasher.verify(password, hashed_password)
 
     def calculate_win_rate(self, wins, losses):
         total_games = wins + losses
@@ -71,33 +158,66 @@ class GameDB:
             return 0.0
         return round((wins / total_games) * 100, 1)
 
-    def get_leaderboard_data(self):
-        with self.get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT name, score, wins, losses, goals_scored, goals_conceded
+    def leaderboard_entry(self, row, rank):
+        return {
+            'rank': rank,
+            'name': row['name'],
+            'score': row['score'],
+            'wins': row['wins'],
+            'losses': row['losses'],
+            'win_rate': self.calculate_win_rate(row['wins'], row['losses']),
+            'goals_scored': row['goals_scored'],
+            'goals_conceded': row['goals_conceded'],
+            'games_played': row['wins'] + row['losses']
+        }
+
+    def get_leaderboard_data(self, offset=0, limit=None):
+        """Players in leaderboard order, optionally one page of them.
+
+        The cost of OFFSET grows with the offset; use get_leaderboard_after()
+        to walk deep into the table.
+        """
+        with REGISTRY.time('db_query_seconds', operation='leaderboard'), self.get_db_connection() as conn:
+            cursor = conn.execute(f'''
+                SELECT {LEADERBOARD_COLUMNS}
                 FROM players
-                ORDER BY score DESC, wins DESC, name ASC
-            ''')
-            
-            players = []
-            for row in cursor.fetchall():
-                players.append({
-                    'name': row['name'],
-                    'score': row['score'],
-                    'wins': row['wins'],
-                    'losses': row['losses'],
-                    'win_rate': self.calculate_win_rate(row['wins'], row['losses']),
-                    'goals_scored': row['goals_scored'],
-                    'goals_conceded': row['goals_conceded'],
-                    'games_played': row['wins'] + row['losses']
-                })
-            
-            return players
+                ORDER BY {LEADERBOARD_ORDER}
+                LIMIT ? OFFSET ?
+            ''', (-1 if limit is None else limit, offset))
+            return [self.leaderboard_entry(row, offset + i) for i, row in enumerate(cursor.fetchall(), 1)]
+
+    def get_leaderboard_after(self, cursor, limit):
+        """Keyset page: the limit players ranked after cursor = (score, wins, name, rank).
+
+        Each branch is an index seek, so the cost does not depend on how deep
+        into the leaderboard the cursor points.
+        """
+        score, wins, name, rank = cursor
+        rows = []
+        with REGISTRY.time('db_query_seconds', operation='leaderboard_after'), self.get_db_connection() as conn:
+            for where, params in (
+                ('score = ? AND wins = ? AND name > ?', (score, wins, name)),
+                ('score = ? AND wins < ?', (score, wins)),
+                ('score < ?', (score,)),
+            ):
+                if len(rows) >= limit:
+                    break
+                rows += conn.execute(f'''
+                    SELECT {LEADERBOARD_COLUMNS}
+                    FROM players
+                    WHERE {where}
+                    ORDER BY {LEADERBOARD_ORDER}
+                    LIMIT ?
+                ''', (*params, limit - len(rows))).fetchall()
+        return [self.leaderboard_entry(row, rank + i) for i, row in enumerate(rows, 1)]
+
+    def get_players_around_rank(self, rank, limit=11):
+        """A page of limit players with the player at the given 1-based rank in the middle"""
+        return self.get_leaderboard_data(max(rank - limit // 2, 1) - 1, limit)
 
     def get_player_stats(self, username):
         """Get specific player statistics"""
-        with self.get_db_connection() as conn:
+        with REGISTRY.time('db_query_seconds', operation='stats'), self.get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT name, score, wins, losses, goals_scored, goals_conceded
@@ -109,8 +229,11 @@ class GameDB:
             if not row:
                 return None
             
+            rank = self.rank_index.rank(row['name'])
             return {
                 'name': row['name'],
+                'rank': rank,
+                'percentile': self.rank_index.percentile(rank) if rank else None,
                 'score': row['score'],
                 'wins': row['wins'],
                 'losses': row['losses'],
@@ -122,60 +245,69 @@ class GameDB:
 
     def register_player(self, username, password):
         """Register new player"""
-        with self.lock:
-            try:
-                with self.get_db_connection() as conn:
-                    cursor = conn.cursor()
-                    cursor.execute('''
-                        INSERT INTO players (name, password_hash)
-                        VALUES (?, ?)
-                    ''', (username, self.hash_password(password)))
-                    conn.commit()
-                    return True
-            except sqlite3.IntegrityError:
-                return False
+        password_hash = self.hash_password(password)
+        try:
+            with REGISTRY.time('db_query_seconds', operation='register'), self.get_db_connection() as conn:
+                conn.execute('''
+                    INSERT INTO players (name, password_hash)
+                    VALUES (?, ?)
+                ''', (username, password_hash))
+        except sqlite3.IntegrityError:
+            return False
+        self.rank_index.update(username, 0, 0)
+        self.version = next(self.version_counter)
+        return True
 
     def authenticate_player(self, username, password):
         """Authenticate player login using bcrypt"""
-        with self.get_db_connection() as conn:
+        with REGISTRY.time('db_query_seconds', operation='authenticate'), self.get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT password_hash FROM players WHERE name = ?
             ''', (username,))
             
             row = cursor.fetchone()
-            if row:
-                return self.verify_password(password, row['password_hash'])
-            return False
+        # bcrypt runs after the connection is released; it is timed separately by the hasher
+        if row:
+            return self.verify_password(password, row['password_hash'])
+        return False
 
     def update_game_result(self, username, won, goals_scored, goals_conceded, score_change):
-        """Update player stats after game"""
-        with self.lock:
-            with self.get_db_connection() as conn:
-                cursor = conn.cursor()
-                
-                # Check if player exists
-                cursor.execute('SELECT name FROM players WHERE name = ?', (username,))
-                if not cursor.fetchone():
-                    return False
-                
-                # Update player statistics
-                cursor.execute('''
-                    UPDATE players 
-                    SET wins = wins + ?,
-                        losses = losses + ?,
-                        goals_scored = goals_scored + ?,
-                        goals_conceded = goals_conceded + ?,
-                        score = MAX(0, score + ?)
-                    WHERE name = ?
-                ''', (
-                    1 if won else 0,
-                    0 if won else 1,
-                    goals_scored,
-                    goals_conceded,
-                    score_change,
-                    username
-                ))
-                
-                conn.commit()
-                return True
\ No newline at end of file
+        """Update player stats after game; False if the player does not exist.
+
+        RETURNING hands back the new score and wins, so the rank index is
+        updated without another query.
+        """
+        with REGISTRY.time('db_query_seconds', operation='game_result'), self.get_db_connection() as conn:
+            row = conn.execute(UPDATE_RESULT_SQL + ' RETURNING score, wins',
+                               self.result_params(username, won, goals_scored, goals_conceded, score_change)).fetchone()
+        if row is None:
+            return False
+        self.rank_index.update(username, row['score'], row['wins'])
+        self.version = next(self.version_counter)
+        return True
+
+    def update_game_results(self, results):
+        """Apply many (username, won, goals_scored, goals_conceded, score_change) results in one transaction.
+
+        Returns one bool per result, False where the player does not exist.
+        The rank index and version move on only after the commit, as for
+        update_game_result().
+        """
+        names = list(dict.fromkeys(result[0] for result in results))
+        with REGISTRY.time('db_query_seconds', operation='game_results'), self.get_db_connection() as conn:
+            conn.executemany(UPDATE_RESULT_SQL, [self.result_params(*result) for result in results])
+            rows = []
+            for start in range(0, len(names), MAX_IN_PARAMS):
+                chunk = names[start:start + MAX_IN_PARAMS]
+                rows += conn.execute(f'SELECT name, score, wins FROM players WHERE name IN ({",".join("?" * len(chunk))})',
+                                     chunk).fetchall()
+        for row in rows:
+            self.rank_index.update(row['name'], row['score'], row['wins'])
+        if rows:
+            self.version = next(self.version_counter)
+        found = {row['name'] for row in rows}
+        return [result[0] in found for result in results]
+
+    def result_params(self, username, won, goals_scored, goals_conceded, score_change):
+        return (1 if won else 0, 0 if won else 1, goals_scored, goals_conceded, score_change, username)
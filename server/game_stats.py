@@ -0,0 +1,115 @@
+"""Tick instrumentation for game sessions, aggregated per process.
+
+Every session records its own measurements into a SessionStats of
+fixed-size histograms:
+- tick duration: the physics steps of one loop pass
+- tick interval: time between loop passes, the inverse of the effective
+  tick rate
+- receive wait: time spent blocked in select() waiting for input or the
+  next tick
+- send time: serializing and sending one state frame to both players
+- frame size: bytes of one state frame
+Only the session's own thread writes to its SessionStats, so recording
+takes no locks. GAME_STATS keeps the active sessions and the merged totals
+of finished ones. It publishes them in the metrics registry, together with
+the number of active sessions and the effective tick rate, so the stats
+port serves them.
+"""
+import threading
+import time
+from server.metrics import REGISTRY, Histogram
+
+TICK_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.0167, 0.025, 0.05, 0.1)
+INTERVAL_BUCKETS = (0.005, 0.01, 0.015, 0.016, 0.017, 0.018, 0.02, 0.025, 0.033, 0.05, 0.1, 0.25)
+WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.0167, 0.025, 0.05, 0.1)
+FRAME_BUCKETS = (32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+HISTOGRAMS = {
+    'tick_seconds': (TICK_BUCKETS, "Physics time of one tick pass"),
+    'tick_interval_seconds': (INTERVAL_BUCKETS, "Time between tick passes"),
+    'recv_wait_seconds': (WAIT_BUCKETS, "Time blocked waiting for input or the next tick"),
+    'send_seconds': (TICK_BUCKETS, "Time to serialize and send one state frame to both players"),
+    'frame_bytes': (FRAME_BUCKETS, "Bytes of one state frame per player"),
+}
+
+class SessionStats:
+    """Measurements of one session, written only by the thread running it"""
+    __slots__ = tuple(HISTOGRAMS) + ('ticks', 'bytes_sent', 'started', 'last_tick')
+
+    def __init__(self):
+        for name, (bounds, _) in HISTOGRAMS.items():
+            setattr(self, name, Histogram(bounds))
+        self.ticks = self.bytes_sent = 0
+        self.started = time.monotonic()
+        self.last_tick = None
+
+    def ticked(self, started, ticks):
+        """Record a loop pass that began at started (time.monotonic()) and ran ticks physics steps"""
+        now = time.monotonic()
+        self.tick_seconds.observe(now - started)
+        if self.last_tick is not None:
+            self.tick_interval_seconds.observe(started - self.last_tick)
+        self.last_tick = started
+        self.ticks += ticks
+
+    def sent(self, started, frames):
+        self.send_seconds.observe(time.monotonic() - started)
+        for frame in frames:
+            self.frame_bytes.observe(len(frame))
+            self.bytes_sent += len(frame)
+
+    def tick_rate(self, now):
+        elapsed = now - self.started
+        return self.ticks / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        """One line for the end-of-session log"""
+        rate = self.tick_rate(self.last_tick or time.monotonic())
+        return (f"{self.ticks} ticks at {rate:.1f}/s, tick p99 {fmt_ms(self.tick_seconds.quantile(0.99))}, "
+                f"send p99 {fmt_ms(self.send_seconds.quantile(0.99))}, {self.bytes_sent / 1024:.0f} KiB sent")
+
+def fmt_ms(seconds):
+    return '-' if seconds is None else f"<={seconds * 1000:g} ms"
+
+class GameStats:
+    def __init__(self, registry=REGISTRY):
+        self.lock = threading.Lock()
+        self.active = set()
+        self.finished = SessionStats()
+        self.sessions_total = 0
+        for name, (_, help) in HISTOGRAMS.items():
+            registry.histogram_source(f'game_{name}', lambda name=name: self.merged(name), help)
+        registry.gauge('game_active_sessions', lambda: len(self.active), "Matches being played")
+        registry.gauge('game_sessions_total', lambda: self.sessions_total, "Matches started since the process started")
+        registry.gauge('game_effective_tick_rate', self.effective_tick_rate,
+                       "Mean simulation ticks per second across active matches")
+
+    def open_session(self):
+        stats = SessionStats()
+        with self.lock:
+            self.active.add(stats)
+            self.sessions_total += 1
+        return stats
+
+    def close_session(self, stats):
+        with self.lock:
+            if stats in self.active:
+                self.active.discard(stats)
+                for name in HISTOGRAMS:
+                    getattr(self.finished, name).merge(getattr(stats, name))
+
+    def merged(self, name):
+        """One histogram over finished and active sessions"""
+        with self.lock:
+            histogram = getattr(self.finished, name).copy()
+            for stats in self.active:
+                histogram.merge(getattr(stats, name))
+        return histogram
+
+    def effective_tick_rate(self):
+        now = time.monotonic()
+        with self.lock:
+            rates = [stats.tick_rate(now) for stats in self.active]
+        return round(sum(rates) / len(rates), 2) if rates else 0.0
+
+GAME_STATS = GameStats()
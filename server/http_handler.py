@@ -1,36 +1,114 @@
+from collections import OrderedDict
+from concurrent.futures import Future
 from datetime import datetime
+from urllib.parse import parse_qs, urlencode
+import atexit
+import base64
 import html
-import uuid
+import math
+import os
+import threading
+import time
+from server.access_log import AccessLogger
 from server.database import GameDB
+from server.leaderboard_cache import LeaderboardCache, accepts_gzip, etag_matches
+from server.metrics import REGISTRY
+from server.password_hasher import PasswordHasher
+from server.rate_limit import RateLimiter
+from server.session_store import open_session_store
+from server.write_behind import ResultWriter
+
+MAX_APPLIED_RESULTS = 10000
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Routes that run bcrypt and are admitted through the rate limiter
+AUTH_ROUTES = ('/register', '/login')
+# Metrics are labelled by route; anything else counts as 'other' so label values stay bounded
+ROUTES = frozenset({'/leaderboard', '/leaderboard/json', '/metrics', '/register', '/login', '/game-result',
+                    '/game-results'})
+
+REGISTRY.describe('http_requests_total', "HTTP requests by method, route and status")
+REGISTRY.describe('http_request_duration_seconds', "Time spent in the route handler")
+REGISTRY.describe('http_rate_limited_total', "Login and register attempts refused by the rate limiter")
+
+def route_of(path):
+    path = path.partition('?')[0]
+    if path.startswith('/stats/'):
+        return '/stats/{name}'
+    return path if path in ROUTES else 'other'
+
+def encode_cursor(player):
+    """Opaque keyset cursor pointing just after the given leaderboard entry"""
+    import json
+    raw = json.dumps([player['score'], player['wins'], player['name'], player['rank']]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    import json
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    score, wins, name, rank = json.loads(raw)
+    if not (isinstance(score, int) and isinstance(wins, int) and isinstance(name, str) and isinstance(rank, int)):
+        raise ValueError("malformed cursor")
+    return score, wins, name, rank
+
+def parse_page_query(query):
+    """(mode, value, limit) for a parsed leaderboard query string; raises ValueError if invalid"""
+    limit = min(max(int(query.get('limit', [DEFAULT_PAGE_SIZE])[0]), 1), MAX_PAGE_SIZE)
+    if 'cursor' in query:
+        return 'cursor', decode_cursor(query['cursor'][0]), limit
+    if 'around' in query:
+        rank = int(query['around'][0])
+        if rank < 1:
+            raise ValueError("rank must be positive")
+        return 'around', rank, limit
+    offset = int(query.get('offset', [0])[0])
+    if offset < 0:
+        raise ValueError("offset must not be negative")
+    return 'offset', offset, limit
 
 class HttpServer:
-    def __init__(self):
-        self.sessions = {} 
+    def __init__(self, session_store=None, write_behind=None, access_log=None, hasher=None):
+        # Fork the password workers first: GameDB opens a connection and starts its rank index loader thread.
+        # A caller that opens its own session store passes a hasher it started before that.
+        self.db = GameDB(hasher=(hasher or PasswordHasher()).start())
+        self.sessions = session_store or open_session_store()
         self.types = { '.html': 'text/html', '.json': 'application/json' }
-        self.db = GameDB()
+        # (match_id, username) -> True once applied, False while a request is applying it
+        self.applied_results = OrderedDict()
+        self.applied_lock = threading.Lock()
+        self.leaderboard_cache = LeaderboardCache(self.db)
+        self.auth_limiter = RateLimiter()
+        if write_behind is None:
+            write_behind = os.environ.get('WRITE_BEHIND') == '1'
+        self.result_writer = None
+        if write_behind:
+            self.result_writer = ResultWriter(self.db)
+            atexit.register(self.result_writer.close)
+        # ACCESS_LOG_SAMPLE is the share of successful requests logged (errors are always logged)
+        self.access_log = access_log or AccessLogger(sample_rate=float(os.environ.get('ACCESS_LOG_SAMPLE', 1)))
 
     def response(self, code=404, message='Not Found', body=b'', headers={}):
         date_str = datetime.now().strftime('%c')
-        response_line = f"HTTP/1.0 {code} {message}\r\n"
-        headers_list = [f"Date: {date_str}", "Connection: close", "Server: MyAirHockeyServer/1.0", f"Content-Length: {len(body)}"]
+        response_line = f"HTTP/1.1 {code} {message}\r\n"
+        # The connection layer adds the Connection header once it knows whether to keep the socket open
+        headers_list = [f"Date: {date_str}", "Server: MyAirHockeyServer/1.0", f"Content-Length: {len(body)}"]
         for key, value in headers.items():
             headers_list.append(f"{key}: {value}")
         header_str = "\r\n".join(headers_list)
         return response_line.encode() + header_str.encode() + b'\r\n\r\n' + body
 
-    def http_get(self, path):
+    def http_get(self, path, headers=None):
+        path, _, query_string = path.partition('?')
         try:
             if path == '/leaderboard':
-                player_data = self.db.get_leaderboard_data()
-                html_body = self.generate_leaderboard_html(player_data)
-                return self.response(200, 'OK', html_body.encode('utf-8'), {'Content-Type': 'text/html'})
+                return self.leaderboard_response('html', path, parse_qs(query_string), headers or {})
             
             elif path == '/leaderboard/json':
-                import json
-                player_data = self.db.get_leaderboard_data()
-                return self.response(200, 'OK', json.dumps(player_data, indent=2).encode(), 
-                                   {'Content-Type': 'application/json'})
+                return self.leaderboard_response('json', path, parse_qs(query_string), headers or {})
             
+            elif path == '/metrics':
+                return self.metrics_response(parse_qs(query_string))
+
             elif path.startswith('/stats/'):
                 import json
                 username = path.split('/')[-1]
@@ -63,18 +141,79 @@ class HttpServer:
                 return self.handle_login(payload)
             elif path == '/game-result':
                 return self.handle_game_result(payload)
+            elif path == '/game-results':
+                return self.handle_game_results(payload)
             else:
                 return self.response(404, 'Not Found', b'{"error": "Endpoint not found"}')
         except Exception as e:
             print(f"Error in http_post: {e}")
             return self.response(500, 'Internal Server Error', b'{"error": "Database error"}')
 
-    def generate_leaderboard_html(self, player_data):
+    def metrics_response(self, query):
+        """Process metrics as Prometheus text, or as JSON with ?format=json"""
+        import json
+        if query.get('format', [''])[0] == 'json':
+            return self.response(200, 'OK', json.dumps(REGISTRY.snapshot(), indent=2).encode(),
+                                 {'Content-Type': 'application/json', 'Cache-Control': 'no-store'})
+        return self.response(200, 'OK', REGISTRY.render_prometheus().encode(),
+                             {'Content-Type': 'text/plain; version=0.0.4', 'Cache-Control': 'no-store'})
+
+    def leaderboard_response(self, fmt, path, query, headers):
+        """One leaderboard page from the cache, gzipped if accepted, 304 if the client's copy is current.
+
+        Pages are selected with ?offset=&limit=, ?cursor=&limit= (keyset, from
+        the previous page's next link) or ?around=<rank>&limit=.
+        """
+        try:
+            page = parse_page_query(query)
+        except (ValueError, TypeError):
+            return self.response(400, 'Bad Request', b'{"error": "Invalid page parameters"}')
+        rendering = self.leaderboard_cache.get((fmt, page), lambda: self.render_leaderboard(fmt, path, page))
+        use_gzip = accepts_gzip(headers)
+        etag = rendering.gzip_etag if use_gzip else rendering.etag
+        response_headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+        if rendering.links:
+            response_headers['Link'] = ', '.join(f'<{url}>; rel="{rel}"' for rel, url in rendering.links.items())
+        if etag_matches(headers, etag):
+            return self.response(304, 'Not Modified', b'', response_headers)
+        response_headers['Content-Type'] = rendering.content_type
+        if use_gzip:
+            response_headers['Content-Encoding'] = 'gzip'
+            return self.response(200, 'OK', rendering.gzip_body, response_headers)
+        return self.response(200, 'OK', rendering.body, response_headers)
+
+    def render_leaderboard(self, fmt, path, page):
+        """Query and render one page; returns (body, content type, links to neighbouring pages)"""
+        import json
+        mode, value, limit = page
+        if mode == 'cursor':
+            player_data = self.db.get_leaderboard_after(value, limit)
+            first_rank = value[3] + 1
+        elif mode == 'around':
+            player_data = self.db.get_players_around_rank(value, limit)
+            first_rank = max(value - limit // 2, 1)
+        else:
+            player_data = self.db.get_leaderboard_data(value, limit)
+            first_rank = value + 1
+
+        links = {}
+        if first_rank > 1:
+            links['prev'] = f"{path}?{urlencode({'offset': max(first_rank - 1 - limit, 0), 'limit': limit})}"
+        if len(player_data) == limit:
+            links['next'] = f"{path}?{urlencode({'cursor': encode_cursor(player_data[-1]), 'limit': limit})}"
+
+        if fmt == 'json':
+            return json.dumps(player_data, indent=2).encode(), 'application/json', links
+        html_body = self.generate_leaderboard_html(player_data, links.get('prev'), links.get('next'))
+        return html_body.encode('utf-8'), 'text/html', links
+
+    def generate_leaderboard_html(self, player_data, prev_url=None, next_url=None):
         table_rows = []
         if not player_data:
             table_rows.append('<tr><td colspan="8" style="text-align:center;">No scores yet. Play a game!</td></tr>')
         else:
             for rank, player in enumerate(player_data, 1):
+                rank = player.get('rank', rank)
                 safe_name = html.escape(player['name'])
                 
                 # Color coding for win rate
@@ -95,6 +234,10 @@ class HttpServer:
                 table_rows.append(row)
         
         table_body_html = "\n".join(table_rows)
+        pager_html = " ".join(
+            f'<a href="{html.escape(url)}">{label}</a>'
+            for url, label in ((prev_url, '&larr; Previous'), (next_url, 'Next &rarr;')) if url
+        )
         html_template = f"""
         <!DOCTYPE html>
         <html lang="en">
@@ -110,6 +253,8 @@ class HttpServer:
                 tr:nth-child(even) {{ background-color: #f8f9fa; }}
                 tr:hover {{ background-color: #e9ecef; }}
                 .rank {{ font-weight: bold; font-size: 16px; }}
+                .pager {{ text-align: center; margin-top: 15px; }}
+                .pager a {{ margin: 0 10px; color: #007bff; text-decoration: none; }}
                 .stats-note {{ text-align: center; margin-top: 10px; color: #6c757d; font-size: 12px; }}
             </style>
         </head>
@@ -131,6 +276,7 @@ class HttpServer:
                     </thead>
                     <tbody>{table_body_html}</tbody>
                 </table>
+                <p class="pager">{pager_html}</p>
                 <p class="stats-note">F-A = Goals For - Goals Against</p>
             </div>
         </body>
@@ -143,16 +289,55 @@ class HttpServer:
         request_line = requests[0].strip()
         body_start_index = data.find('\r\n\r\n') + 4
         body_str = data[body_start_index:]
+        headers = {}
+        for line in data[:body_start_index - 4].split('\r\n')[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
         try:
             method, path, _ = request_line.split(" ")
-            if method == 'GET':
-                return self.http_get(path)
-            elif method == 'POST':
-                return self.http_post(path, body_str)
-            else:
-                return self.response(400, 'Bad Request', b'{"error": "Unsupported method"}')
         except ValueError:
             return self.response(400, 'Bad Request', b'{"error": "Malformed request line"}')
+        return self.handle_request(method, path, headers, body_str)
+
+    def handle_request(self, method, path, headers, body_str, client_ip=None):
+        """Route an already parsed request, recording metrics and an access log entry; header names are lower case"""
+        started = time.perf_counter()
+        result = self.route_request(method, path, headers, body_str, client_ip)
+        elapsed = time.perf_counter() - started
+        status = int(result[9:12])
+        route = route_of(path)
+        REGISTRY.inc('http_requests_total', method=method, route=route, status=status)
+        REGISTRY.observe('http_request_duration_seconds', elapsed, route=route)
+        self.access_log.log({'time': time.time(), 'client': client_ip, 'method': method, 'path': path,
+                             'status': status, 'bytes': len(result), 'ms': round(elapsed * 1000, 2),
+                             'agent': headers.get('user-agent')})
+        return result
+
+    def route_request(self, method, path, headers, body_str, client_ip):
+        if method == 'GET':
+            return self.http_get(path, headers)
+        elif method == 'POST':
+            if path in AUTH_ROUTES:
+                retry_after = self.auth_limiter.acquire(client_ip)
+                if retry_after:
+                    REGISTRY.inc('http_rate_limited_total', route=path)
+                    return self.response(429, 'Too Many Requests', b'{"error": "Too many attempts, retry later"}',
+                                         {'Content-Type': 'application/json',
+                                          'Retry-After': str(math.ceil(retry_after))})
+            return self.http_post(path, body_str)
+        else:
+            return self.response(400, 'Bad Request', b'{"error": "Unsupported method"}')
+
+    def submit_game_result(self, username, won, goals_scored, goals_conceded, score_change):
+        """Future for one result update; queued for a group commit in write-behind mode, else applied now"""
+        future = Future()
+        try:
+            if self.result_writer:
+                return self.result_writer.submit(username, won, goals_scored, goals_conceded, score_change)
+            future.set_result(self.db.update_game_result(username, won, goals_scored, goals_conceded, score_change))
+        except Exception as e:
+            future.set_exception(e)
+        return future
 
     def handle_register(self, payload):
         import json
@@ -178,8 +363,7 @@ class HttpServer:
             return self.response(400, 'Bad Request', b'{"error": "Username and password required"}')
         
         if self.db.authenticate_player(username, password):
-            token = uuid.uuid4().hex
-            self.sessions[token] = username
+            token = self.sessions.create(username)
             message = {"message": "Login successful", "token": token}
             return self.response(200, 'OK', json.dumps(message).encode(), 
                                {'Content-Type': 'application/json'})
@@ -198,9 +382,83 @@ class HttpServer:
         if not username:
             return self.response(401, 'Unauthorized', b'{"error": "Invalid or expired token"}')
         
-        if self.db.update_game_result(username, won, goals_scored, goals_conceded, score_change):
+        if self.submit_game_result(username, won, goals_scored, goals_conceded, score_change).result():
             message = {"message": "Game result and score updated successfully"}
             return self.response(200, 'OK', json.dumps(message).encode(), 
                                {'Content-Type': 'application/json'})
         else:
-            return self.response(401, 'Unauthorized', b'{"error": "Player not found"}')
\ No newline at end of file
+            return self.response(401, 'Unauthorized', b'{"error": "Player not found"}')
+
+    def claim_result(self, key):
+        """Reserve a (match_id, username) for this request; False if it is applied or being applied"""
+        with self.applied_lock:
+            if key in self.applied_results:
+                return False
+            self.applied_results[key] = False
+            # Only evict ids that are done; a claim in progress must stay visible to retries
+            while len(self.applied_results) > MAX_APPLIED_RESULTS:
+                oldest = next(iter(self.applied_results))
+                if not self.applied_results[oldest]:
+                    break
+                del self.applied_results[oldest]
+            return True
+
+    def release_result(self, key):
+        """Forget a claim whose result was not applied, so a retry can apply it"""
+        if key[0] is not None:
+            with self.applied_lock:
+                self.applied_results.pop(key, None)
+
+    def handle_game_results(self, payload):
+        """Batch of game results, usually both players of one or more matches.
+
+        Each result carries a match_id; a result that was already applied (the
+        reporter retried after a lost response) is acknowledged without being
+        applied twice. The id is claimed under a lock before the result is
+        applied, so concurrent retries of one match cannot both apply it.
+        """
+        import json
+        results = payload.get('results')
+        if not isinstance(results, list):
+            return self.response(400, 'Bad Request', b'{"error": "results list required"}')
+
+        # Every result is submitted before waiting on any, so write-behind commits them together
+        statuses = []
+        pending = []
+        for result in results:
+            if not isinstance(result, dict):
+                statuses.append({'status': 400, 'error': 'Invalid result'})
+                continue
+            username = self.sessions.get(result.get('token'))
+            if not username:
+                statuses.append({'status': 401, 'error': 'Invalid or expired token'})
+                continue
+            key = (result.get('match_id'), username)
+            if key[0] is not None and not self.claim_result(key):
+                statuses.append({'status': 200, 'duplicate': True})
+                continue
+            pending.append((len(statuses), key, self.submit_game_result(
+                username, result.get('won', False), result.get('goals_scored', 0),
+                result.get('goals_conceded', 0), result.get('score_change', 0))))
+            statuses.append(None)
+
+        # Settle every claim before reporting an error, so a retry neither skips nor repeats a result
+        error = None
+        for index, key, outcome in pending:
+            try:
+                applied = outcome.result()
+            except Exception as e:
+                applied, error = False, e
+            if applied:
+                statuses[index] = {'status': 200}
+                if key[0] is not None:
+                    with self.applied_lock:
+                        self.applied_results[key] = True
+            else:
+                self.release_result(key)
+                statuses[index] = {'status': 404, 'error': 'Player not found'}
+        if error is not None:
+            raise error
+
+        return self.response(200, 'OK', json.dumps({'results': statuses}).encode(),
+                             {'Content-Type': 'application/json'})
\ No newline at end of file
@@ -0,0 +1,161 @@
+"""Incremental HTTP/1.1 request parsing for persistent connections.
+
+HttpRequestParser is fed raw bytes as they arrive and returns every request
+that is complete, so one connection can carry many requests, pipelined or
+one after another. Bodies are framed by Content-Length or by chunked
+transfer encoding; nothing relies on the client closing the socket or on a
+read timeout to find the end of a request.
+"""
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+HEX_DIGITS = b'0123456789abcdefABCDEF'
+
+class HttpParseError(Exception):
+    """Malformed or oversized request; status and reason are what to answer with"""
+    def __init__(self, status, reason, message):
+        super().__init__(message)
+        self.status, self.reason = status, reason
+
+class HttpRequest:
+    __slots__ = ('method', 'path', 'version', 'headers', 'body')
+
+    def __init__(self, method, path, version, headers, body=b''):
+        self.method, self.path, self.version = method, path, version
+        self.headers = headers
+        self.body = body
+
+    @property
+    def keep_alive(self):
+        """Whether the client wants the connection kept open after this request"""
+        tokens = {token.strip().lower() for token in self.headers.get('connection', '').split(',')}
+        if self.version == 'HTTP/1.0':
+            return 'keep-alive' in tokens
+        return 'close' not in tokens
+
+class HttpRequestParser:
+    def __init__(self, max_header_bytes=MAX_HEADER_BYTES, max_body_bytes=MAX_BODY_BYTES):
+        self.max_header_bytes = max_header_bytes
+        self.max_body_bytes = max_body_bytes
+        self.buffer = bytearray()
+        self.request = None
+        self.content_length = 0
+        self.chunked = False
+        self.chunks = []
+        self.chunk_size = None
+        self.body_size = 0
+
+    @property
+    def idle(self):
+        """True when no partial request is buffered"""
+        return self.request is None and not self.buffer
+
+    def feed(self, data):
+        """Add received bytes; returns the requests completed by them, in order"""
+        self.buffer += data
+        requests = []
+        while True:
+            if self.request is None and not self.parse_head():
+                break
+            body = self.parse_chunked() if self.chunked else self.parse_fixed()
+            if body is None:
+                break
+            self.request.body = body
+            requests.append(self.request)
+            self.request = None
+        return requests
+
+    def parse_head(self):
+        # Tolerate stray line breaks between pipelined requests
+        while self.buffer[:2] == b'\r\n':
+            del self.buffer[:2]
+        end = self.buffer.find(b'\r\n\r\n')
+        if end < 0:
+            if len(self.buffer) > self.max_header_bytes:
+                raise HttpParseError(431, 'Request Header Fields Too Large', "request head too large")
+            return False
+        if end > self.max_header_bytes:
+            raise HttpParseError(431, 'Request Header Fields Too Large', "request head too large")
+        lines = self.buffer[:end].decode('latin-1').split('\r\n')
+        del self.buffer[:end + 4]
+
+        parts = lines[0].split(' ')
+        if len(parts) != 3 or not parts[2].startswith('HTTP/1.'):
+            raise HttpParseError(400, 'Bad Request', f"malformed request line {lines[0]!r}")
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(':')
+            if not sep or not name or name != name.strip():
+                raise HttpParseError(400, 'Bad Request', f"malformed header {line!r}")
+            name, value = name.lower(), value.strip()
+            headers[name] = f"{headers[name]}, {value}" if name in headers else value
+
+        self.request = HttpRequest(parts[0], parts[1], parts[2], headers)
+        transfer_encoding = headers.get('transfer-encoding', '').lower()
+        if transfer_encoding:
+            if transfer_encoding != 'chunked':
+                raise HttpParseError(501, 'Not Implemented', f"unsupported transfer encoding {transfer_encoding!r}")
+            self.chunked, self.chunks, self.chunk_size, self.body_size = True, [], None, 0
+        else:
+            self.chunked = False
+            try:
+                self.content_length = int(headers.get('content-length', 0))
+            except ValueError:
+                raise HttpParseError(400, 'Bad Request', "invalid Content-Length") from None
+            if self.content_length < 0:
+                raise HttpParseError(400, 'Bad Request', "invalid Content-Length")
+            if self.content_length > self.max_body_bytes:
+                raise HttpParseError(413, 'Payload Too Large', "request body too large")
+        return True
+
+    def parse_fixed(self):
+        if len(self.buffer) < self.content_length:
+            return None
+        body = bytes(self.buffer[:self.content_length])
+        del self.buffer[:self.content_length]
+        return body
+
+    def parse_chunked(self):
+        while True:
+            if self.chunk_size is None:
+                end = self.buffer.find(b'\r\n')
+                if end < 0:
+                    return None
+                size = self.buffer[:end].split(b';', 1)[0].strip()
+                # int() alone would also accept a sign, underscores or surrounding whitespace
+                if not size or size.lstrip(HEX_DIGITS):
+                    raise HttpParseError(400, 'Bad Request', "invalid chunk size")
+                self.chunk_size = int(size, 16)
+                del self.buffer[:end + 2]
+                self.body_size += self.chunk_size
+                if self.body_size > self.max_body_bytes:
+                    raise HttpParseError(413, 'Payload Too Large', "request body too large")
+            if self.chunk_size == 0:
+                # Last chunk: skip optional trailer fields up to the empty line
+                if self.buffer[:2] == b'\r\n':
+                    del self.buffer[:2]
+                else:
+                    end = self.buffer.find(b'\r\n\r\n')
+                    if end < 0:
+                        return None
+                    del self.buffer[:end + 4]
+                self.chunked = False
+                return b''.join(self.chunks)
+            if len(self.buffer) < self.chunk_size + 2:
+                return None
+            if self.buffer[self.chunk_size:self.chunk_size + 2] != b'\r\n':
+                raise HttpParseError(400, 'Bad Request', "chunk data not followed by CRLF")
+            self.chunks.append(bytes(self.buffer[:self.chunk_size]))
+            del self.buffer[:self.chunk_size + 2]
+            self.chunk_size = None
+
+def set_connection_header(response, keep_alive):
+    """Add the Connection header to a response built by HttpServer.response()"""
+    status_end = response.index(b'\r\n') + 2
+    value = b'keep-alive' if keep_alive else b'close'
+    return response[:status_end] + b'Connection: ' + value + b'\r\n' + response[status_end:]
+
+def error_response(status, reason):
+    """Minimal response for requests that could not be parsed; the connection is closed after it"""
+    body = f'{{"error": "{reason}"}}'.encode()
+    return (f"HTTP/1.1 {status} {reason}\r\nConnection: close\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n").encode() + body
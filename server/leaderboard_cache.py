@@ -0,0 +1,74 @@
+"""Rendered leaderboard pages, rebuilt only when the data changes.
+
+GameDB bumps its version after every committed write. The cache keeps each
+requested leaderboard page rendered (HTML or JSON), plus a gzip-compressed
+copy, and drops everything once the version has moved on, so pages are
+queried and rendered again only after the data changed. Each rendering has
+a strong ETag derived from its content, so polling clients can revalidate
+with If-None-Match and get 304 Not Modified without any database work.
+"""
+import gzip
+import hashlib
+import threading
+
+GZIP_LEVEL = 6
+MAX_ENTRIES = 256
+
+class Rendering:
+    """One representation of a leaderboard page: body, gzip copy, their ETags and page links"""
+    __slots__ = ('body', 'gzip_body', 'etag', 'gzip_etag', 'content_type', 'links')
+
+    def __init__(self, body, content_type, links=None):
+        digest = hashlib.blake2b(body, digest_size=12).hexdigest()
+        self.body = body
+        self.gzip_body = gzip.compress(body, GZIP_LEVEL, mtime=0)
+        self.etag = f'"{digest}"'
+        self.gzip_etag = f'"{digest}-gz"'
+        self.content_type = content_type
+        self.links = links or {}
+
+class LeaderboardCache:
+    def __init__(self, db, max_entries=MAX_ENTRIES):
+        self.db = db
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.version = None
+        self.renderings = {}
+        self.rebuilds = 0
+
+    def get(self, key, render):
+        """Cached Rendering for key; on a miss render() -> (body, content_type, links) builds it"""
+        version = self.db.version
+        with self.lock:
+            if self.version != version:
+                self.renderings.clear()
+                self.version = version
+            rendering = self.renderings.get(key)
+        if rendering is not None:
+            return rendering
+
+        # Rendered outside the lock; the data read is at least as new as version
+        rendering = Rendering(*render())
+        self.rebuilds += 1
+        with self.lock:
+            if self.version == version:
+                if len(self.renderings) >= self.max_entries:
+                    del self.renderings[next(iter(self.renderings))]
+                self.renderings[key] = rendering
+        return rendering
+
+def accepts_gzip(headers):
+    for coding in headers.get('accept-encoding', '').split(','):
+        name, _, params = coding.partition(';')
+        if name.strip().lower() in ('gzip', '*'):
+            return params.replace(' ', '').lower() not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+def etag_matches(headers, etag):
+    """Whether an If-None-Match header covers the given ETag (weak comparison)"""
+    value = headers.get('if-none-match')
+    if not value:
+        return False
+    if value.strip() == '*':
+        return True
+    return any(candidate.strip().removeprefix('W/') == etag for candidate in value.split(','))
@@ -0,0 +1,146 @@
+import random
+import server.physics as physics
+
+WIDTH, HEIGHT = 1200, 800
+WINNING_SCORE = 5
+PADDLE_RADIUS, PUCK_RADIUS = 25, 15
+GOAL_HEIGHT = 150
+GOAL_TOP_Y = HEIGHT / 2 - GOAL_HEIGHT / 2
+GOAL_BOTTOM_Y = HEIGHT / 2 + GOAL_HEIGHT / 2
+SERVE_DELAY = 1.0
+# Physics constants are tuned per tick at this rate; other rates scale time by dt
+BASE_TICK_RATE = 60
+
+class Match:
+    """Game rules and state of a single match, independent of any socket.
+
+    At tick rates below BASE_TICK_RATE the puck moves further per tick, so
+    swept collision detection is switched on by default to keep it from
+    tunnelling through paddles; pass swept explicitly to override.
+
+    All randomness (serve direction, bounce jitter) comes from rng, so a
+    match given a seeded random.Random and the same inputs is reproducible.
+    """
+    def __init__(self, p1_name, p2_name, tick_rate=BASE_TICK_RATE, swept=None, rng=None):
+        self.p1_name, self.p2_name = p1_name, p2_name
+        self.rng = rng if rng is not None else random
+        self.dt = BASE_TICK_RATE / tick_rate
+        self.friction = physics.FRICTION ** self.dt
+        self.swept = tick_rate < BASE_TICK_RATE if swept is None else swept
+        self.serve_delay_ticks = round(SERVE_DELAY * tick_rate)
+        self.serve_ticks = 0
+        self.tick = 0
+        self.game_state = {
+            'puck_pos': [WIDTH / 2, HEIGHT / 2], 'puck_vel': [self.rng.choice([-3, 3]), self.rng.choice([-3, 3])],
+            'p1_pos': [WIDTH / 4, HEIGHT / 2],
+            'p2_pos': [WIDTH * 3 / 4, HEIGHT / 2],
+            'score': [0, 0], 'game_over': False,
+            'p1_name': p1_name, 'p2_name': p2_name
+        }
+
+        self.prev_p1_pos = [WIDTH / 4, HEIGHT / 2]
+        self.prev_p2_pos = [WIDTH * 3 / 4, HEIGHT / 2]
+        self.p1_target = (WIDTH / 4, HEIGHT / 2)
+        self.p2_target = (WIDTH * 3 / 4, HEIGHT / 2)
+
+    def reset_puck(self):
+        """Put the puck back on the centre spot and hold it there for the serve delay"""
+        self.game_state['puck_pos'] = [WIDTH / 2, HEIGHT / 2]
+        self.game_state['puck_vel'] = [self.rng.choice([-3, 3]), self.rng.choice([-3, 3])]
+        self.serve_ticks = self.serve_delay_ticks
+
+    def step(self, p1_input=None, p2_input=None):
+        """Advance the match by one tick. Returns True if a goal was scored.
+
+        An input of None means nothing new arrived from that player since the
+        last tick, so their paddle keeps its previous target.
+        """
+        state = self.game_state
+        scored = False
+        self.tick += 1
+
+        if p1_input is not None:
+            self.p1_target = (float(p1_input['x']), float(p1_input['y']))
+        if p2_input is not None:
+            self.p2_target = (float(p2_input['x']), float(p2_input['y']))
+
+        # Update paddle positions
+        p1_x = max(PADDLE_RADIUS, min(self.p1_target[0], WIDTH / 2 - PADDLE_RADIUS))
+        p1_y = max(PADDLE_RADIUS, min(self.p1_target[1], HEIGHT - PADDLE_RADIUS))
+
+        p2_x = max(WIDTH / 2 + PADDLE_RADIUS, min(self.p2_target[0], WIDTH - PADDLE_RADIUS))
+        p2_y = max(PADDLE_RADIUS, min(self.p2_target[1], HEIGHT - PADDLE_RADIUS))
+
+        # Count paddle velocities (px per base tick)
+        p1_vel = [(p1_x - self.prev_p1_pos[0]) / self.dt, (p1_y - self.prev_p1_pos[1]) / self.dt]
+        p2_vel = [(p2_x - self.prev_p2_pos[0]) / self.dt, (p2_y - self.prev_p2_pos[1]) / self.dt]
+
+        state['p1_pos'] = [p1_x, p1_y]
+        state['p2_pos'] = [p2_x, p2_y]
+
+        # Serve phase after a goal: paddles move, the puck waits on the centre spot
+        if self.serve_ticks > 0:
+            self.serve_ticks -= 1
+            self.prev_p1_pos = [p1_x, p1_y]
+            self.prev_p2_pos = [p2_x, p2_y]
+            return False
+
+        state['puck_vel'] = physics.apply_friction(state['puck_vel'], self.friction)
+
+        if self.swept:
+            physics.move_puck_swept(
+                state['puck_pos'], state['puck_vel'],
+                [(self.prev_p1_pos, p1_vel), (self.prev_p2_pos, p2_vel)],
+                PADDLE_RADIUS, PUCK_RADIUS, HEIGHT, self.dt, rng=self.rng
+            )
+        else:
+            self.move_puck_discrete(p1_vel, p2_vel)
+
+        self.prev_p1_pos = [p1_x, p1_y]
+        self.prev_p2_pos = [p2_x, p2_y]
+
+        state['puck_vel'] = physics.clamp_velocity(state['puck_vel'])
+
+        puck = state['puck_pos']
+        if puck[0] < PUCK_RADIUS:
+            if GOAL_TOP_Y < puck[1] < GOAL_BOTTOM_Y:
+                state['score'][1] += 1
+                self.reset_puck()
+                scored = True
+            else:
+                puck[0] = PUCK_RADIUS
+                state['puck_vel'][0] = abs(state['puck_vel'][0]) * 0.95
+        elif puck[0] > WIDTH - PUCK_RADIUS:
+            if GOAL_TOP_Y < puck[1] < GOAL_BOTTOM_Y:
+                state['score'][0] += 1
+                self.reset_puck()
+                scored = True
+            else:
+                puck[0] = WIDTH - PUCK_RADIUS
+                state['puck_vel'][0] = -abs(state['puck_vel'][0]) * 0.95
+
+        # Check win condition
+        if state['score'][0] >= WINNING_SCORE or state['score'][1] >= WINNING_SCORE:
+            state['game_over'] = True
+
+        return scored
+
+    def move_puck_discrete(self, p1_vel, p2_vel):
+        """Move the puck a full tick, then resolve any wall or paddle overlap"""
+        state = self.game_state
+        state['puck_pos'][0] += state['puck_vel'][0] * self.dt
+        state['puck_pos'][1] += state['puck_vel'][1] * self.dt
+
+        state['puck_pos'], state['puck_vel'] = physics.handle_wall_collision(
+            state['puck_pos'], state['puck_vel'], PUCK_RADIUS, HEIGHT
+        )
+
+        state['puck_pos'], state['puck_vel'] = physics.handle_paddle_collision(
+            state['puck_pos'], state['puck_vel'],
+            state['p1_pos'], PADDLE_RADIUS, PUCK_RADIUS, p1_vel, is_player1=True, rng=self.rng
+        )
+
+        state['puck_pos'], state['puck_vel'] = physics.handle_paddle_collision(
+            state['puck_pos'], state['puck_vel'],
+            state['p2_pos'], PADDLE_RADIUS, PUCK_RADIUS, p2_vel, is_player1=False, rng=self.rng
+        )
@@ -0,0 +1,183 @@
+"""Rating-aware matchmaking queue.
+
+Waiting players are indexed by rating bucket (rating // bucket_width) and a
+player is paired with the oldest live player in the nearest non-empty bucket
+inside their search window. The window starts at initial_window rating
+points and widens by window_growth points per second of waiting, so nobody
+waits forever just because nobody of the same skill is online.
+
+Enqueueing a player looks for a partner straight away. Players who could
+not be paired are kept in a heap keyed by the time their window next grows
+by a whole bucket, and match() only revisits the players whose window has
+grown since they were last checked. Neither operation walks the whole
+queue: the cost depends on the number of buckets inside the window, not on
+the number of waiting players.
+
+Before two players are paired, both sockets are checked for liveness and
+dead entries are evicted instead of being handed to a match.
+"""
+import heapq
+import itertools
+import select
+import socket
+import time
+from bisect import bisect_left, bisect_right, insort
+from server.metrics import Histogram
+
+BUCKET_WIDTH = 10
+INITIAL_WINDOW = 10
+WINDOW_GROWTH = 5
+DEFAULT_RATING = 0
+# Seconds a player waited in the queue before being paired
+WAIT_BUCKETS = (0.01, 0.1, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+def socket_is_alive(sock):
+    """True unless the peer has closed the connection (never blocks, consumes nothing)"""
+    try:
+        # select() instead of MSG_DONTWAIT, which Windows does not have
+        readable, _, _ = select.select([sock], [], [], 0)
+        if not readable:
+            return True
+        return sock.recv(1, socket.MSG_PEEK) != b''
+    except (BlockingIOError, InterruptedError):
+        return True
+    except (OSError, ValueError):
+        return False
+
+def fetch_rating(http_url, name, timeout=2):
+    """A player's leaderboard score from the HTTP server, DEFAULT_RATING if unknown or unreachable"""
+    # Imported on first use; requests is the slowest import of the game server
+    import requests
+    try:
+        response = requests.get(f"{http_url}/stats/{name}", timeout=timeout)
+        if response.status_code == 200:
+            return response.json().get('score', DEFAULT_RATING)
+    except (requests.RequestException, ValueError) as e:
+        print(f"Could not fetch rating for {name}: {e}")
+    return DEFAULT_RATING
+
+class Ticket:
+    __slots__ = ('player', 'rating', 'bucket', 'enqueued_at', 'seq')
+
+    def __init__(self, player, rating, bucket, enqueued_at, seq):
+        self.player, self.rating, self.bucket = player, rating, bucket
+        self.enqueued_at, self.seq = enqueued_at, seq
+
+class Matchmaker:
+    """Pairs waiting players by rating; players are any hashable-by-identity objects"""
+    def __init__(self, bucket_width=BUCKET_WIDTH, initial_window=INITIAL_WINDOW, window_growth=WINDOW_GROWTH,
+                 max_window=None, is_alive=None, clock=time.monotonic):
+        self.bucket_width = bucket_width
+        self.initial_window = initial_window
+        self.window_growth = window_growth
+        self.max_window = max_window
+        self.is_alive = is_alive
+        self.clock = clock
+        self.tickets = {}
+        self.buckets = {}
+        self.bucket_keys = []
+        self.rechecks = []
+        self.seq = itertools.count()
+        self.evicted = 0
+        self.waits = Histogram(WAIT_BUCKETS)
+
+    def __len__(self):
+        return len(self.tickets)
+
+    def __contains__(self, player):
+        return id(player) in self.tickets
+
+    def enqueue(self, player, rating):
+        """Queue a player. Returns a (waiting player, player) pair if a partner was found right away."""
+        now = self.clock()
+        ticket = Ticket(player, rating, int(rating // self.bucket_width), now, next(self.seq))
+        partner = self.find_partner(ticket, now)
+        if partner is not None:
+            self.remove(partner.player)
+            self.waits.observe(now - partner.enqueued_at)
+            self.waits.observe(0.0)
+            return partner.player, player
+        if self.is_alive and not self.is_alive(player):
+            self.evicted += 1
+            return None
+        self._insert(ticket, now)
+        return None
+
+    def remove(self, player):
+        """Take a player out of the queue (matched, disconnected or gave up)"""
+        ticket = self.tickets.pop(id(player), None)
+        if ticket is None:
+            return False
+        bucket = self.buckets[ticket.bucket]
+        del bucket[id(player)]
+        if not bucket:
+            del self.buckets[ticket.bucket]
+            del self.bucket_keys[bisect_left(self.bucket_keys, ticket.bucket)]
+        return True
+
+    def match(self):
+        """Pair the players whose search window has widened since they were last checked"""
+        now = self.clock()
+        pairs = []
+        while self.rechecks and self.rechecks[0][0] <= now:
+            _, seq, player_id = heapq.heappop(self.rechecks)
+            ticket = self.tickets.get(player_id)
+            if ticket is None or ticket.seq != seq:
+                continue
+            self.remove(ticket.player)
+            # The rechecked player may have left while waiting; never hand a dead socket to a live partner
+            if self.is_alive and not self.is_alive(ticket.player):
+                self.evicted += 1
+                continue
+            partner = self.find_partner(ticket, now)
+            if partner is not None:
+                self.remove(partner.player)
+                self.waits.observe(now - ticket.enqueued_at)
+                self.waits.observe(now - partner.enqueued_at)
+                first, second = sorted((ticket, partner), key=lambda t: t.seq)
+                pairs.append((first.player, second.player))
+            else:
+                self._insert(ticket, now)
+        return pairs
+
+    def _insert(self, ticket, now):
+        self.tickets[id(ticket.player)] = ticket
+        bucket = self.buckets.get(ticket.bucket)
+        if bucket is None:
+            bucket = self.buckets[ticket.bucket] = {}
+            insort(self.bucket_keys, ticket.bucket)
+        bucket[id(ticket.player)] = ticket
+        self.schedule_recheck(ticket, now)
+
+    def window(self, ticket, now):
+        """Rating distance this ticket accepts after waiting until now"""
+        window = self.initial_window + self.window_growth * (now - ticket.enqueued_at)
+        return window if self.max_window is None else min(window, self.max_window)
+
+    def find_partner(self, ticket, now):
+        """Oldest live ticket in the nearest bucket within the window, or None"""
+        reach = int(self.window(ticket, now) // self.bucket_width)
+        keys = self.bucket_keys
+        nearby = keys[bisect_left(keys, ticket.bucket - reach):bisect_right(keys, ticket.bucket + reach)]
+        nearby.sort(key=lambda key: abs(key - ticket.bucket))
+        for key in nearby:
+            bucket = self.buckets.get(key)
+            while bucket:
+                candidate = next(iter(bucket.values()))
+                if not self.is_alive or self.is_alive(candidate.player):
+                    return candidate
+                self.remove(candidate.player)
+                self.evicted += 1
+                bucket = self.buckets.get(key)
+        return None
+
+    def schedule_recheck(self, ticket, now):
+        """Revisit the ticket once its window reaches the next bucket"""
+        if not self.window_growth:
+            return
+        reach = int(self.window(ticket, now) // self.bucket_width)
+        next_window = (reach + 1) * self.bucket_width
+        if self.max_window is not None and next_window > self.max_window:
+            return
+        at = ticket.enqueued_at + max(0.0, next_window - self.initial_window) / self.window_growth
+        heapq.heappush(self.rechecks, (max(at, now + 0.001), ticket.seq, id(ticket.player)))
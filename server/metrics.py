@@ -0,0 +1,210 @@
+"""In-process metrics: counters, gauges and fixed-bucket histograms.
+
+Recording is a dictionary lookup and a few integer increments under one
+lock, cheap enough for every request or tick. A histogram has a fixed list
+of bucket upper bounds, so it never grows, and percentiles are read off the
+bucket counts. Gauges are callbacks, read only when the metrics are
+exported.
+
+The registry renders everything as Prometheus text (for scraping) or as a
+JSON-ready dict (for people and scripts). REGISTRY is the process-wide
+registry that the servers record into.
+"""
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Seconds, from half a millisecond to five seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+class Histogram:
+    """Counts per bucket upper bound, plus one overflow bucket, with the sum and count of all values"""
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        """Add another histogram with the same bounds into this one"""
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+        self.count += other.count
+
+    def copy(self):
+        histogram = Histogram(self.bounds)
+        histogram.merge(self)
+        return histogram
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (inf in the overflow bucket, None if empty)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return math.inf
+
+    def cumulative(self):
+        """(upper bound, count of values at or below it) pairs, ending with (inf, count)"""
+        total = 0
+        pairs = []
+        for bound, count in zip(self.bounds + (math.inf,), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            # '+Inf' rather than inf, which JSON cannot represent
+            **{name: '+Inf' if value == math.inf else value
+               for name, value in (('p50', self.quantile(0.5)), ('p90', self.quantile(0.9)), ('p99', self.quantile(0.99)))},
+            'buckets': {format_value(bound): count for bound, count in self.cumulative()},
+        }
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(labels, extra=()):
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in pairs) + '}'
+
+def label_key(name, labels):
+    return (name, tuple(sorted((label, str(value)) for label, value in labels.items())))
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.help = {}
+        # (name, ((label, value), ...)) -> number or Histogram
+        self.counters = {}
+        self.histograms = {}
+        # name -> (read, label): read() returns a number, or {label value: number} when label is set
+        self.gauges = {}
+        # name -> (read, label): like gauges, but read() returns Histograms kept elsewhere
+        self.histogram_sources = {}
+
+    def describe(self, name, help):
+        self.help[name] = help
+
+    def inc(self, name, amount=1, **labels):
+        key = label_key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = label_key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def time(self, name, **labels):
+        """Observe the seconds spent in the with block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def gauge(self, name, read, help=None, label=None):
+        """Register a gauge read at export time; read() returns {label value: number} if label is given"""
+        self.gauges[name] = (read, label)
+        if help:
+            self.help[name] = help
+
+    def histogram_source(self, name, read, help=None, label=None):
+        """Register histograms owned by someone else, read at export time like a gauge"""
+        self.histogram_sources[name] = (read, label)
+        if help:
+            self.help[name] = help
+
+    def read_gauges(self, sources=None):
+        """(name, labels, value) for every gauge, or every histogram source; one that fails to read is left out"""
+        samples = []
+        for name, (read, label) in list((self.gauges if sources is None else sources).items()):
+            try:
+                value = read()
+            except Exception:
+                continue
+            if label is None:
+                samples.append((name, (), value))
+            else:
+                samples.extend((name, ((label, str(key)),), number) for key, number in value.items())
+        return samples
+
+    def snapshot(self):
+        """Every metric as name -> [{'labels': {...}, 'value': n} or {'labels': {...}, <histogram fields>}]"""
+        result = {}
+        with self.lock:
+            counters = list(self.counters.items())
+            histograms = [(key, histogram.to_dict()) for key, histogram in self.histograms.items()]
+        histograms += [((name, labels), histogram.to_dict())
+                       for name, labels, histogram in self.read_gauges(self.histogram_sources)]
+        for (name, labels), value in counters:
+            result.setdefault(name, []).append({'labels': dict(labels), 'value': value})
+        for name, labels, value in self.read_gauges():
+            result.setdefault(name, []).append({'labels': dict(labels), 'value': value})
+        for (name, labels), fields in histograms:
+            result.setdefault(name, []).append({'labels': dict(labels), **fields})
+        return result
+
+    def render_prometheus(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = [(key, histogram.cumulative(), histogram.sum, histogram.count)
+                          for key, histogram in self.histograms.items()]
+        histograms += [((name, labels), histogram.cumulative(), histogram.sum, histogram.count)
+                       for name, labels, histogram in self.read_gauges(self.histogram_sources)]
+        histograms.sort(key=lambda item: item[0])
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in self.help:
+                    lines.append(f'# HELP {name} {self.help[name]}')
+                lines.append(f'# TYPE {name} {kind}')
+
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+        for name, labels, value in sorted(self.read_gauges(), key=lambda sample: sample[:2]):
+            header(name, 'gauge')
+            lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+        for (name, labels), buckets, total, count in histograms:
+            header(name, 'histogram')
+            for bound, cumulative in buckets:
+                lines.append(f'{name}_bucket{format_labels(labels, (("le", format_value(bound)),))} {cumulative}')
+            lines.append(f'{name}_sum{format_labels(labels)} {format_value(total)}')
+            lines.append(f'{name}_count{format_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,76 @@
+"""bcrypt hashing and verification on a dedicated process pool.
+
+bcrypt is deliberately slow. Run inline on HTTP worker threads it ties up
+those threads, and with them every other route, during a login storm. The
+pool runs the hashes in separate processes on all cores, while the HTTP
+threads only wait on a future.
+
+The cost factor comes from the BCRYPT_ROUNDS environment variable (default
+12, bcrypt's own default). Existing hashes keep verifying whatever the
+setting, because the cost is stored in each hash.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from server.metrics import REGISTRY
+
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+
+REGISTRY.describe('bcrypt_seconds', "CPU time of one bcrypt hash or check in a pool worker")
+REGISTRY.describe('bcrypt_wait_seconds', "Time a bcrypt job waited for a pool worker")
+
+def timed(function, *args):
+    """Run function in a pool worker; returns (result, seconds it took there)"""
+    started = time.perf_counter()
+    return function(*args), time.perf_counter() - started
+
+def hash_password(password, rounds):
+    import bcrypt
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+def verify_password(password, hashed_password):
+    import bcrypt
+    return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+class PasswordHasher:
+    def __init__(self, workers=None, rounds=BCRYPT_ROUNDS):
+        self.workers = workers or os.cpu_count() or 1
+        self.rounds = rounds
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Start the worker processes now.
+
+        Call this before the server starts its threads: workers are forked
+        where the platform allows it, and forking a process that is already
+        running threads is best avoided.
+        """
+        with self.lock:
+            if self.pool is None:
+                context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+                self.pool = ProcessPoolExecutor(self.workers, mp_context=context)
+                # A fork pool starts all of its workers on the first submit
+                self.pool.submit(int).result()
+        return self
+
+    def hash(self, password):
+        return self.run('hash', hash_password, password, self.rounds)
+
+    def verify(self, password, hashed_password):
+        return self.run('verify', verify_password, password, hashed_password)
+
+    def run(self, operation, function, *args):
+        started = time.perf_counter()
+        result, seconds = self.start().pool.submit(timed, function, *args).result()
+        REGISTRY.observe('bcrypt_seconds', seconds, operation=operation)
+        REGISTRY.observe('bcrypt_wait_seconds', max(0.0, time.perf_counter() - started - seconds), operation=operation)
+        return result
+
+    def shutdown(self):
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
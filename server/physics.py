@@ -1,7 +1,9 @@
 import math
 import random
 
-def apply_friction(vel, friction=0.998):
+FRICTION = 0.998
+
+def apply_friction(vel, friction=FRICTION):
     """Apply friction to velocity"""
     vel[0] *= friction
     vel[1] *= friction
@@ -18,7 +20,7 @@ def clamp_velocity(vel, max_speed=20, min_speed=1.0):
         vel[1] = (vel[1] / speed) * min_speed
     return vel
 
-def handle_paddle_collision(puck_pos, puck_vel, paddle_pos, paddle_radius, puck_radius, paddle_vel, is_player1=True):
+def handle_paddle_collision(puck_pos, puck_vel, paddle_pos, paddle_radius, puck_radius, paddle_vel, is_player1=True, rng=random):
     """Handle collision between puck and paddle"""
     dist = math.hypot(puck_pos[0] - paddle_pos[0], puck_pos[1] - paddle_pos[1])
     
@@ -37,34 +39,39 @@ def handle_paddle_collision(puck_pos, puck_vel, paddle_pos, paddle_radius, puck_
         dot_product = puck_vel[0] * normal_x + puck_vel[1] * normal_y
         
         if dot_product < 0:
-            puck_vel[0] -= 2 * dot_product * normal_x
-            puck_vel[1] -= 2 * dot_product * normal_y
-            
-            angle_variation = (random.random() - 0.5) * 0.05  
-            speed = math.hypot(puck_vel[0], puck_vel[1])
-            current_angle = math.atan2(puck_vel[1], puck_vel[0])
-            new_angle = current_angle + angle_variation
-            
-            puck_vel[0] = speed * math.cos(new_angle)
-            puck_vel[1] = speed * math.sin(new_angle)
-            
-            paddle_speed = math.hypot(paddle_vel[0], paddle_vel[1])
-            momentum_factor = 0.4  
-            
-            puck_vel[0] += paddle_vel[0] * momentum_factor
-            puck_vel[1] += paddle_vel[1] * momentum_factor
-            
-            base_energy_boost = 1.1
-            puck_vel[0] *= base_energy_boost
-            puck_vel[1] *= base_energy_boost
-            
-            speed_bonus = min(paddle_speed * 0.02, 0.3)  
-            speed_boost = 1.0 + speed_bonus
-            puck_vel[0] *= speed_boost
-            puck_vel[1] *= speed_boost
+            bounce_off_paddle(puck_vel, normal_x, normal_y, dot_product, paddle_vel, rng)
     
     return puck_pos, puck_vel
 
+def bounce_off_paddle(puck_vel, normal_x, normal_y, dot_product, paddle_vel, rng=random):
+    """Reflect the puck off a paddle surface and add some of the paddle's momentum"""
+    puck_vel[0] -= 2 * dot_product * normal_x
+    puck_vel[1] -= 2 * dot_product * normal_y
+
+    angle_variation = (rng.random() - 0.5) * 0.05  
+    speed = math.hypot(puck_vel[0], puck_vel[1])
+    current_angle = math.atan2(puck_vel[1], puck_vel[0])
+    new_angle = current_angle + angle_variation
+    
+    puck_vel[0] = speed * math.cos(new_angle)
+    puck_vel[1] = speed * math.sin(new_angle)
+    
+    paddle_speed = math.hypot(paddle_vel[0], paddle_vel[1])
+    momentum_factor = 0.4  
+    
+    puck_vel[0] += paddle_vel[0] * momentum_factor
+    puck_vel[1] += paddle_vel[1] * momentum_factor
+    
+    base_energy_boost = 1.1
+    puck_vel[0] *= base_energy_boost
+    puck_vel[1] *= base_energy_boost
+    
+    speed_bonus = min(paddle_speed * 0.02, 0.3)  
+    speed_boost = 1.0 + speed_bonus
+    puck_vel[0] *= speed_boost
+    puck_vel[1] *= speed_boost
+    return puck_vel
+
 def handle_wall_collision(puck_pos, puck_vel, puck_radius, height):
     """Handle collision between puck and walls"""
     if puck_pos[1] <= puck_radius:
@@ -74,4 +81,99 @@ def handle_wall_collision(puck_pos, puck_vel, puck_radius, height):
         puck_pos[1] = height - puck_radius
         puck_vel[1] = -abs(puck_vel[1]) * 0.95  
     
-    return puck_pos, puck_vel
\ No newline at end of file
+    return puck_pos, puck_vel
+
+def circle_time_of_impact(pos, disp, other_pos, other_disp, radius_sum):
+    """Earliest fraction of a frame at which two moving circles touch.
+
+    pos/other_pos are the centres at the start of the frame and disp/other_disp
+    how far each one moves over the frame. Returns None if they do not touch
+    within the frame or are already moving apart.
+    """
+    dx, dy = pos[0] - other_pos[0], pos[1] - other_pos[1]
+    wx, wy = disp[0] - other_disp[0], disp[1] - other_disp[1]
+    approach = dx * wx + dy * wy
+    if approach >= 0:
+        return None
+    c = dx * dx + dy * dy - radius_sum * radius_sum
+    if c <= 0:
+        return 0.0
+    a = wx * wx + wy * wy
+    discriminant = approach * approach - a * c
+    if discriminant < 0:
+        return None
+    t = (-approach - math.sqrt(discriminant)) / a
+    return t if t <= 1 else None
+
+def wall_time_of_impact(pos_y, disp_y, puck_radius, height):
+    """Earliest fraction of a frame at which the puck touches the top or bottom wall"""
+    if disp_y < 0:
+        gap = pos_y - puck_radius
+    elif disp_y > 0:
+        gap = height - puck_radius - pos_y
+    else:
+        return None
+    if gap <= 0:
+        return 0.0
+    t = gap / abs(disp_y)
+    return t if t <= 1 else None
+
+def move_puck_swept(puck_pos, puck_vel, paddles, paddle_radius, puck_radius, height, dt=1.0, max_bounces=4, rng=random):
+    """Move the puck through one frame with continuous collision detection.
+
+    Instead of moving the puck and then checking for overlap, find the exact
+    time of impact against the walls and both (moving) paddles, advance to it,
+    bounce, and repeat with the rest of the frame. A fast puck can therefore
+    not pass through a paddle between ticks, whatever the tick rate.
+
+    paddles is a list of (start_pos, vel) pairs, where start_pos is the paddle
+    centre at the start of the frame. Velocities are in px per 1/60 s tick and
+    the frame lasts dt of those ticks.
+    """
+    radius_sum = paddle_radius + puck_radius
+    elapsed = 0.0
+    for _ in range(max_bounces + 1):
+        remaining = 1.0 - elapsed
+        disp = (puck_vel[0] * dt * remaining, puck_vel[1] * dt * remaining)
+
+        hit_t = wall_time_of_impact(puck_pos[1], disp[1], puck_radius, height)
+        hit_paddle = None
+        for start, vel in paddles:
+            paddle_pos = (start[0] + vel[0] * dt * elapsed, start[1] + vel[1] * dt * elapsed)
+            paddle_disp = (vel[0] * dt * remaining, vel[1] * dt * remaining)
+            t = circle_time_of_impact(puck_pos, disp, paddle_pos, paddle_disp, radius_sum)
+            if t is not None and (hit_t is None or t < hit_t):
+                hit_t, hit_paddle = t, (paddle_pos, paddle_disp, vel)
+
+        if hit_t is None:
+            puck_pos[0] += disp[0]
+            puck_pos[1] += disp[1]
+            break
+
+        puck_pos[0] += disp[0] * hit_t
+        puck_pos[1] += disp[1] * hit_t
+        elapsed += remaining * hit_t
+
+        if hit_paddle is None:
+            if puck_vel[1] < 0:
+                puck_pos[1] = puck_radius
+                puck_vel[1] = abs(puck_vel[1]) * 0.95
+            else:
+                puck_pos[1] = height - puck_radius
+                puck_vel[1] = -abs(puck_vel[1]) * 0.95
+            continue
+
+        paddle_pos, paddle_disp, paddle_vel = hit_paddle
+        contact_x = paddle_pos[0] + paddle_disp[0] * hit_t
+        contact_y = paddle_pos[1] + paddle_disp[1] * hit_t
+        dist = math.hypot(puck_pos[0] - contact_x, puck_pos[1] - contact_y)
+        if dist == 0:
+            break
+        normal_x = (puck_pos[0] - contact_x) / dist
+        normal_y = (puck_pos[1] - contact_y) / dist
+        # Reflect in the paddle's frame of reference so a paddle chasing the puck still hits it
+        relative_dot = (puck_vel[0] - paddle_vel[0]) * normal_x + (puck_vel[1] - paddle_vel[1]) * normal_y
+        bounce_off_paddle(puck_vel, normal_x, normal_y, relative_dot, paddle_vel, rng)
+
+    puck_pos[1] = min(max(puck_pos[1], puck_radius), height - puck_radius)
+    return puck_pos, puck_vel
@@ -0,0 +1,139 @@
+"""In-memory order-statistics index over the leaderboard order.
+
+Players are ranked by score (descending), then wins (descending), then
+name. A Fenwick tree over score values counts how many players hold each
+score, so the number of players with a higher score is one prefix sum, and
+each score keeps a sorted list of (-wins, name) keys for the position inside
+its group. A rank lookup is O(log n); an update is O(log n) plus the list
+insertion within one score group.
+
+The index can be loaded in the background. Until load() finishes, updates
+are recorded and replayed on top of the loaded rows, and rank() waits up to
+LOAD_WAIT seconds for it, then answers None rather than hold up a request.
+"""
+import threading
+from bisect import bisect_left, insort
+
+INITIAL_SCORE_CAPACITY = 1024
+LOAD_WAIT = 1.0
+
+class FenwickTree:
+    """Prefix sums of counts over 0..size-1 with point updates"""
+    def __init__(self, size):
+        self.size = size
+        self.tree = [0] * (size + 1)
+
+    def add(self, index, delta):
+        index += 1
+        while index <= self.size:
+            self.tree[index] += delta
+            index += index & -index
+
+    def prefix_sum(self, index):
+        """Sum of counts at 0..index inclusive"""
+        index = min(index, self.size - 1) + 1
+        total = 0
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+class RankIndex:
+    def __init__(self, score_capacity=INITIAL_SCORE_CAPACITY):
+        self.lock = threading.Lock()
+        self.counts = FenwickTree(score_capacity)
+        self.groups = {}
+        self.players = {}
+        self.loaded = threading.Event()
+        # Updates that arrive before load() finished, as (name, score, wins) or (name, None, None) for removal
+        self.pending = []
+
+    def __len__(self):
+        return len(self.players)
+
+    def load(self, rows):
+        """Replace the contents with (name, score, wins) rows"""
+        rows = list(rows)
+        with self.lock:
+            self.groups, self.players = {}, {}
+            top = 0
+            for name, score, wins in rows:
+                self.players[name] = (score, wins)
+                self.groups.setdefault(score, []).append((-wins, name))
+                top = max(top, score)
+            capacity = INITIAL_SCORE_CAPACITY
+            while capacity <= top:
+                capacity *= 2
+            self.counts = FenwickTree(capacity)
+            for score, group in self.groups.items():
+                group.sort()
+                self.counts.add(score, len(group))
+            for name, score, wins in self.pending:
+                if score is None:
+                    self._pop(name)
+                else:
+                    self._update(name, score, wins)
+            self.pending = []
+            self.loaded.set()
+
+    def update(self, name, score, wins):
+        """Insert a player or move them to their new score and wins"""
+        with self.lock:
+            if not self.loaded.is_set():
+                self.pending.append((name, score, wins))
+            else:
+                self._update(name, score, wins)
+
+    def remove(self, name):
+        with self.lock:
+            if not self.loaded.is_set():
+                self.pending.append((name, None, None))
+            else:
+                self._pop(name)
+
+    def rank(self, name, timeout=LOAD_WAIT):
+        """1-based leaderboard rank, or None for an unknown player or while the index is still loading"""
+        if not self.loaded.wait(timeout):
+            return None
+        with self.lock:
+            entry = self.players.get(name)
+            if entry is None:
+                return None
+            score, wins = entry
+            higher = len(self.players) - self.counts.prefix_sum(score)
+            return higher + bisect_left(self.groups[score], (-wins, name)) + 1
+
+    def percentile(self, rank):
+        """Share of players ranked at or below the given rank, in percent (100 for the leader)"""
+        total = len(self.players)
+        return round(100 * (total - rank + 1) / total, 1) if total else None
+
+    def _update(self, name, score, wins):
+        previous = self.players.get(name)
+        if previous is not None:
+            self._remove(name, *previous)
+        if score >= self.counts.size:
+            self._grow(score)
+        self.players[name] = (score, wins)
+        insort(self.groups.setdefault(score, []), (-wins, name))
+        self.counts.add(score, 1)
+
+    def _pop(self, name):
+        previous = self.players.pop(name, None)
+        if previous is not None:
+            self._remove(name, *previous)
+
+    def _remove(self, name, score, wins):
+        group = self.groups[score]
+        del group[bisect_left(group, (-wins, name))]
+        if not group:
+            del self.groups[score]
+        self.counts.add(score, -1)
+
+    def _grow(self, score):
+        capacity = self.counts.size
+        while capacity <= score:
+            capacity *= 2
+        self.counts = FenwickTree(capacity)
+        for group_score, group in self.groups.items():
+            self.counts.add(group_score, len(group))
@@ -0,0 +1,72 @@
+"""Token-bucket admission control for expensive endpoints.
+
+Every bcrypt hash or check costs the password pool a few hundred
+milliseconds of CPU. A client that sends logins faster than that would fill
+the pool's queue, and everyone else's logins would wait behind it. Each
+client IP gets its own bucket, and one global bucket caps the total rate so
+that the pool keeps up. A request that finds either bucket empty is refused
+at once (429), before it costs anything.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+PER_IP_RATE = 2.0
+PER_IP_BURST = 5
+# About what the password pool can hash per second at the default bcrypt cost
+GLOBAL_RATE = 4.0 * (os.cpu_count() or 1)
+GLOBAL_BURST = 2 * GLOBAL_RATE
+MAX_TRACKED_CLIENTS = 10000
+
+class TokenBucket:
+    """rate tokens per second, holding at most burst tokens"""
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """Seconds until one token is available"""
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+class RateLimiter:
+    def __init__(self, per_ip_rate=PER_IP_RATE, per_ip_burst=PER_IP_BURST, global_rate=GLOBAL_RATE,
+                 global_burst=GLOBAL_BURST, max_clients=MAX_TRACKED_CLIENTS, clock=time.monotonic):
+        self.per_ip_rate = per_ip_rate
+        self.per_ip_burst = per_ip_burst
+        self.max_clients = max_clients
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.global_bucket = TokenBucket(global_rate, global_burst, clock())
+        # Least recently seen first, so the oldest client is dropped when the table is full
+        self.clients = OrderedDict()
+        self.rejected = 0
+
+    def acquire(self, client_ip):
+        """0 if the request may proceed (a token is taken), else seconds to wait before retrying"""
+        now = self.clock()
+        with self.lock:
+            bucket = self.clients.get(client_ip)
+            if bucket is None:
+                bucket = self.clients[client_ip] = TokenBucket(self.per_ip_rate, self.per_ip_burst, now)
+                if len(self.clients) > self.max_clients:
+                    self.clients.popitem(last=False)
+            else:
+                self.clients.move_to_end(client_ip)
+            bucket.refill(now)
+            self.global_bucket.refill(now)
+            # Both buckets must have a token; neither is charged for a refused request
+            if bucket.tokens < 1 or self.global_bucket.tokens < 1:
+                self.rejected += 1
+                return max(bucket.wait_time(), self.global_bucket.wait_time())
+            bucket.tokens -= 1
+            self.global_bucket.tokens -= 1
+            return 0
@@ -0,0 +1,256 @@
+"""Compact binary match recordings and random-access replay.
+
+A recording is one append-only file per match:
+
+    header    magic, format version, record size, tick rate, swept flag,
+              the match's RNG seed, start time and both player names
+    records   one fixed-size record per tick, starting with tick 0 (the
+              initial state): puck position and velocity, both paddles,
+              score, flags and the inputs the match was stepped with
+    goal index  written when the recording is closed: the ticks a goal was
+              scored on, followed by their count and a trailer magic
+
+Records have a fixed size, so tick N sits at HEADER.size + N * RECORD.size
+and seeking is O(1). The goal index makes jumping to the n-th goal O(1) as
+well. A recording cut short by a crash has no goal index; the reader then
+drops any partial last record and rebuilds the index by scanning the goal
+flags once.
+
+State is stored as float32 (exact enough to draw). Inputs are stored as
+float64, and the match's RNG is seeded from the header, so Simulation can
+replay the recorded inputs and reproduce the match tick for tick.
+
+Recording costs one struct.pack_into per tick into a preallocated buffer,
+plus one write() per second of play (about 4.4 KB at 60 Hz), so it can stay
+on in production. A recorder that fails to write stops recording; it never
+ends the match.
+"""
+import itertools
+import math
+import mmap
+import os
+import random
+import re
+import struct
+import time
+from server.match import Match
+from server.metrics import REGISTRY
+from server.simulation import Simulation, recorded_input
+
+MAGIC = b'AHREC\x00\x00\x01'
+INDEX_MAGIC = b'AHGOALS\x00'
+VERSION = 1
+NAME_BYTES = 32
+# magic, version, record size, tick rate, swept, seed, start time (unix), p1 name, p2 name
+HEADER = struct.Struct(f'<8sHHH?Qd{NAME_BYTES}s{NAME_BYTES}s')
+# tick, puck pos/vel, p1 pos, p2 pos (float32), p1 input, p2 input (float64), score, flags
+RECORD = struct.Struct('<I8f4d2HB')
+GOAL = struct.Struct('<I')
+TRAILER = struct.Struct('<I8s')  # goal count, index magic
+
+FLAG_GAME_OVER = 1
+FLAG_GOAL = 2
+FLAG_P1_INPUT = 4
+FLAG_P2_INPUT = 8
+
+FLUSH_SECONDS = 1.0
+RECORDING_SUFFIX = '.rec'
+
+recording_numbers = itertools.count(1)
+
+class MatchRecorder:
+    """Writes the ticks of one match to a recording file"""
+    def __init__(self, path, match, seed, tick_rate):
+        self.path = path
+        self.file = open(path, 'wb', buffering=0)
+        self.goals = []
+        self.records = 0
+        flush_records = max(1, round(tick_rate * FLUSH_SECONDS))
+        self.buffer = bytearray(RECORD.size * flush_records)
+        self.buffered = 0
+        try:
+            self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.size, tick_rate, match.swept, seed, time.time(),
+                                        encode_name(match.p1_name), encode_name(match.p2_name)))
+            self.record(match)
+        except OSError:
+            self.file.close()
+            raise
+
+    def record(self, match, p1_input=None, p2_input=None, scored=False):
+        """Append the state the match is in after its last step, and the inputs that step was given"""
+        if self.file is None:
+            return
+        state = match.game_state
+        flags = (FLAG_GAME_OVER if state['game_over'] else 0) | (FLAG_GOAL if scored else 0)
+        if p1_input is not None:
+            flags |= FLAG_P1_INPUT
+        if p2_input is not None:
+            flags |= FLAG_P2_INPUT
+        if scored:
+            self.goals.append(match.tick)
+        puck_pos, puck_vel, p1_pos, p2_pos = state['puck_pos'], state['puck_vel'], state['p1_pos'], state['p2_pos']
+        RECORD.pack_into(
+            self.buffer, self.buffered, match.tick,
+            puck_pos[0], puck_pos[1], puck_vel[0], puck_vel[1], p1_pos[0], p1_pos[1], p2_pos[0], p2_pos[1],
+            *input_values(p1_input), *input_values(p2_input), *state['score'], flags
+        )
+        self.buffered += RECORD.size
+        self.records += 1
+        if self.buffered == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        if self.file is None or not self.buffered:
+            return
+        try:
+            self.file.write(memoryview(self.buffer)[:self.buffered])
+        except OSError as e:
+            print(f"Recording {self.path} stopped: {e}")
+            self.file.close()
+            self.file = None
+            return
+        REGISTRY.inc('match_recording_bytes_total', self.buffered)
+        self.buffered = 0
+
+    def close(self):
+        """Write the remaining ticks and the goal index"""
+        self.flush()
+        if self.file is None:
+            return
+        try:
+            self.file.write(b''.join(GOAL.pack(tick) for tick in self.goals) +
+                            TRAILER.pack(len(self.goals), INDEX_MAGIC))
+        except OSError as e:
+            print(f"Recording {self.path}: could not write the goal index: {e}")
+        finally:
+            self.file.close()
+            self.file = None
+
+def encode_name(name):
+    return str(name).encode('utf-8')[:NAME_BYTES]
+
+def input_values(paddle_input):
+    if paddle_input is None:
+        return 0.0, 0.0
+    return float(paddle_input['x']), float(paddle_input['y'])
+
+def recording_path(record_dir, p1_name, p2_name):
+    safe = [re.sub(r'[^A-Za-z0-9_.-]', '_', str(name))[:NAME_BYTES] for name in (p1_name, p2_name)]
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    name = f"{stamp}-{safe[0]}-vs-{safe[1]}-{os.getpid()}-{next(recording_numbers)}{RECORDING_SUFFIX}"
+    return os.path.join(record_dir, name)
+
+def start_match(p1_name, p2_name, tick_rate, record_dir=None):
+    """A new Match and its recorder, or (Match, None) when not recording.
+
+    A recorded match gets its own seeded RNG, so the recording can be re-simulated.
+    """
+    if not record_dir:
+        return Match(p1_name, p2_name, tick_rate), None
+    seed = random.getrandbits(64)
+    match = Match(p1_name, p2_name, tick_rate, rng=random.Random(seed))
+    try:
+        return match, MatchRecorder(recording_path(record_dir, p1_name, p2_name), match, seed, tick_rate)
+    except OSError as e:
+        print(f"Not recording {p1_name} vs {p2_name}: {e}")
+        return match, None
+
+class ReplayReader:
+    """Random access to a recording through a read-only memory map"""
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER.size:
+                raise ValueError(f"{path} is not a match recording")
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size, self.tick_rate, self.swept, self.seed, self.started, p1_name, p2_name = \
+            HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            self.map.close()
+            raise ValueError(f"{path} is not a version {VERSION} match recording")
+        self.p1_name = p1_name.rstrip(b'\x00').decode('utf-8', 'ignore')
+        self.p2_name = p2_name.rstrip(b'\x00').decode('utf-8', 'ignore')
+
+        count, magic = TRAILER.unpack_from(self.map, size - TRAILER.size) if size >= HEADER.size + TRAILER.size \
+            else (0, None)
+        index_start = size - TRAILER.size - count * GOAL.size
+        if magic == INDEX_MAGIC and index_start >= HEADER.size and (index_start - HEADER.size) % RECORD.size == 0:
+            self.complete = True
+            self.ticks = (index_start - HEADER.size) // RECORD.size
+            self.goal_ticks = [tick for (tick,) in GOAL.iter_unpack(self.map[index_start:size - TRAILER.size])]
+        else:
+            self.complete = False
+            self.ticks = (size - HEADER.size) // RECORD.size
+            self.goal_ticks = [tick for tick in range(self.ticks) if self.record(tick)[-1] & FLAG_GOAL]
+
+    def __len__(self):
+        """Number of recorded ticks, including tick 0"""
+        return self.ticks
+
+    def close(self):
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, tick):
+        if not 0 <= tick < self.ticks:
+            raise IndexError(f"tick {tick} is not in the recording (0-{self.ticks - 1})")
+        return RECORD.unpack_from(self.map, HEADER.size + tick * RECORD.size)
+
+    def state_at(self, tick):
+        """The game state after the given tick, shaped like Match.game_state"""
+        _, px, py, vx, vy, x1, y1, x2, y2, _, _, _, _, score1, score2, flags = self.record(tick)
+        return {
+            'puck_pos': [px, py], 'puck_vel': [vx, vy], 'p1_pos': [x1, y1], 'p2_pos': [x2, y2],
+            'score': [score1, score2], 'game_over': bool(flags & FLAG_GAME_OVER),
+            'p1_name': self.p1_name, 'p2_name': self.p2_name
+        }
+
+    def inputs_at(self, tick):
+        """(p1 input, p2 input) the match was stepped with to reach tick; None where nothing arrived"""
+        *_, ix1, iy1, ix2, iy2, _, _, flags = self.record(tick)
+        return ({'x': ix1, 'y': iy1} if flags & FLAG_P1_INPUT else None,
+                {'x': ix2, 'y': iy2} if flags & FLAG_P2_INPUT else None)
+
+    def goal_tick(self, n):
+        """Tick on which the n-th goal (counting from 0) was scored"""
+        return self.goal_ticks[n]
+
+    def tick_at(self, seconds):
+        """Tick reached after the given seconds of play, clamped to the recording"""
+        return max(0, min(self.ticks - 1, math.floor(seconds * self.tick_rate)))
+
+    def input_positions(self, player):
+        """The (x, y) positions one player sent, tick by tick from tick 1; None where nothing arrived"""
+        flag = FLAG_P1_INPUT if player == 1 else FLAG_P2_INPUT
+        first = 9 if player == 1 else 11
+        for tick in range(1, self.ticks):
+            values = self.record(tick)
+            yield (values[first], values[first + 1]) if values[-1] & flag else None
+
+    def simulation(self):
+        """A headless Simulation fed with the recorded inputs, starting from the recorded seed"""
+        return Simulation(recorded_input(self.input_positions(1)), recorded_input(self.input_positions(2)),
+                          self.seed, self.tick_rate, self.swept, self.p1_name, self.p2_name)
+
+    def verify(self):
+        """Re-simulate the recorded inputs; returns the first tick that differs from the recording, or None"""
+        simulation = self.simulation()
+        tick = 0
+        while simulation.step():
+            tick = simulation.match.tick
+            if tick >= self.ticks:
+                return tick
+            state, recorded = simulation.game_state, self.record(tick)
+            replayed = RECORD.unpack(RECORD.pack(
+                tick, *state['puck_pos'], *state['puck_vel'], *state['p1_pos'], *state['p2_pos'],
+                *recorded[9:13], *state['score'], recorded[-1]))
+            if replayed[:9] != recorded[:9] or replayed[13:15] != recorded[13:15] or \
+                    state['game_over'] != bool(recorded[-1] & FLAG_GAME_OVER):
+                return tick
+        return None if tick == self.ticks - 1 else tick + 1
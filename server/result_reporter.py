@@ -0,0 +1,283 @@
+"""Background reporting of match results to the HTTP server.
+
+Ending a match only puts its results on a queue. A single reporter thread
+drains the queue and sends everything that is waiting, both players of a
+match and any other finished matches, in one POST to /game-results over a
+pooled keep-alive requests.Session.
+
+Failed sends are retried with exponential backoff. When the HTTP server
+stays unreachable the batch is appended to a local spool file (one JSON
+result per line) and sent again once the server answers, or on the next
+start. Every result carries a match_id so the server can ignore a retry of
+a batch it already applied.
+
+A batch the server refuses as malformed (a 4xx other than 408 or 429) is
+never spooled, or it would be retried forever along with everything spooled
+after it. It is split in halves and each half is sent again, so the valid
+results still get through. A single result that is refused is appended to
+a dead-letter file next to the spool.
+
+If the spool file cannot be written, the batch is kept in memory, up to
+MAX_HELD_RESULTS, and retried with the next one. The reporter thread never
+exits on an error, or every later result would wait in a queue nobody reads.
+
+Several processes (shard workers) may share one spool file. A reader first
+renames the file to a private name, so nothing appended later is deleted
+with it. A writer that finds its file was claimed while it was writing
+appends the batch again to a fresh spool file. That can send a result
+twice, but never loses one, and the match_id makes the duplicate harmless.
+"""
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+
+SPOOL_FILE = 'pending_results.jsonl'
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 5
+BACKOFF_START = 0.5
+BACKOFF_MAX = 30.0
+SPOOL_RETRY_INTERVAL = 60.0
+REJECTED_SUFFIX = '.rejected'
+# Results kept in memory while the spool file cannot be written
+MAX_HELD_RESULTS = 10000
+# Client errors that are worth retrying; any other 4xx means the batch itself is bad
+RETRYABLE_CLIENT_ERRORS = {408, 429}
+
+def match_results(score, p1_token, p2_token):
+    """Per-player results of a finished match; a draw reports nothing"""
+    p1_goals, p2_goals = score[0], score[1]
+    if p1_goals == p2_goals:
+        return []
+    match_id = uuid.uuid4().hex
+    score_diff = abs(p1_goals - p2_goals)
+    p1_won = p1_goals > p2_goals
+    return [
+        {'match_id': match_id, 'token': token, 'won': won, 'goals_scored': scored,
+         'goals_conceded': conceded, 'score_change': score_diff if won else -score_diff}
+        for token, won, scored, conceded in (
+            (p1_token, p1_won, p1_goals, p2_goals),
+            (p2_token, not p1_won, p2_goals, p1_goals),
+        )
+    ]
+
+class ResultReporter:
+    def __init__(self, http_url, spool_path=SPOOL_FILE, batch_size=BATCH_SIZE, max_attempts=MAX_ATTEMPTS):
+        self.url = f"{http_url}/game-results"
+        self.spool_path = spool_path
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        # Imported here, not at module load, so the game server starts without it
+        import requests
+        self.session = requests.Session()
+        self.queue = queue.Queue()
+        self.spooled = os.path.exists(spool_path)
+        self.held = []
+        self.sent = self.failed = 0
+        self.thread = threading.Thread(target=self.run, name='result-reporter', daemon=True)
+        self.thread.start()
+
+    def submit(self, score, p1_token, p2_token):
+        """Queue a finished match for reporting; never blocks"""
+        results = match_results(score, p1_token, p2_token)
+        if results:
+            self.queue.put(results)
+
+    def close(self, timeout=5):
+        """Send what is still queued (spooling it if that fails) and stop the reporter thread"""
+        self.queue.put(None)
+        self.thread.join(timeout)
+
+    def run(self):
+        if self.spooled:
+            try:
+                self.retry_spool()
+            except Exception as e:
+                print(f"Game result reporter error: {e}")
+        stopping = False
+        while not stopping:
+            batch = []
+            try:
+                batch, stopping = self.next_batch()
+                if self.held:
+                    batch, self.held = self.held + batch, []
+                if self.spooled:
+                    # Whenever there is something to send, or the retry interval passed, try the backlog too
+                    batch = self.take_spool() + batch
+                if batch and not self.send(batch, attempts=1 if stopping else self.max_attempts):
+                    self.spool(batch)
+            except Exception as e:
+                # The thread must survive anything, or every later result would sit in a queue nobody reads
+                print(f"Game result reporter error: {e}")
+                self.hold(batch)
+        if self.held:
+            print(f"Lost {len(self.held)} game results: they could be neither sent nor spooled")
+
+    def retry_spool(self):
+        batch = self.take_spool()
+        if batch and not self.send(batch, attempts=1):
+            self.spool(batch)
+
+    def next_batch(self):
+        """Wait for results, then take everything queued up to batch_size. Returns (batch, stopping)."""
+        batch = []
+        try:
+            item = self.queue.get(timeout=SPOOL_RETRY_INTERVAL if self.spooled or self.held else None)
+            while True:
+                if item is None:
+                    return batch, True
+                batch.extend(item)
+                if len(batch) >= self.batch_size:
+                    break
+                item = self.queue.get_nowait()
+        except queue.Empty:
+            pass
+        return batch, False
+
+    def send(self, batch, attempts):
+        import requests
+        delay = BACKOFF_START
+        for attempt in range(attempts):
+            try:
+                response = self.session.post(self.url, json={'results': batch}, timeout=5)
+                if 200 <= response.status_code < 300:
+                    self.log_response(batch, response)
+                    return True
+                if 400 <= response.status_code < 500 and response.status_code not in RETRYABLE_CLIENT_ERRORS:
+                    # Retrying cannot help; spooling would resend it forever
+                    self.reject(batch, response.status_code)
+                    return True
+                # Anything else means the batch was not applied; retry it, then spool it
+                error = f"HTTP {response.status_code}"
+            except requests.RequestException as e:
+                error = e
+            print(f"Could not report {len(batch)} game results (attempt {attempt + 1}/{attempts}): {error}")
+            if attempt + 1 < attempts:
+                time.sleep(delay)
+                delay = min(delay * 2, BACKOFF_MAX)
+        return False
+
+    def log_response(self, batch, response):
+        try:
+            statuses = [entry.get('status') for entry in response.json()['results']]
+        except (ValueError, KeyError, TypeError, AttributeError):
+            statuses = [response.status_code] * len(batch)
+        for result, status in zip(batch, statuses):
+            outcome = "WON" if result['won'] else "LOST"
+            if status == 200:
+                self.sent += 1
+                print(f"Reported game result for token {result['token'][:8]}...: {outcome} "
+                      f"({result['goals_scored']}-{result['goals_conceded']}), score change: {result['score_change']:+}")
+            else:
+                self.failed += 1
+                print(f"Game result for token {result['token'][:8]}... rejected with status {status}")
+
+    def reject(self, batch, status):
+        """The server refused the batch as a whole: resend the halves, dead-letter single results"""
+        if len(batch) > 1:
+            print(f"{len(batch)} game results refused with HTTP {status}; resending them in halves")
+            middle = len(batch) // 2
+            for half in (batch[:middle], batch[middle:]):
+                if not self.send(half, attempts=1):
+                    self.spool(half)
+            return
+        self.failed += 1
+        rejected_path = self.spool_path + REJECTED_SUFFIX
+        print(f"Game result for match {batch[0].get('match_id')} refused with HTTP {status}; "
+              f"moved to {rejected_path}")
+        try:
+            with open(rejected_path, 'a') as f:
+                f.write(json.dumps(batch[0]) + '\n')
+        except OSError as e:
+            print(f"Could not write {rejected_path}, dropping the result: {e}")
+
+    def spool(self, batch):
+        data = ''.join(json.dumps(result) + '\n' for result in batch).encode()
+        try:
+            while True:
+                with open(self.spool_path, 'ab') as f:
+                    f.write(data)
+                    f.flush()
+                    written = os.fstat(f.fileno())
+                try:
+                    current = os.stat(self.spool_path)
+                except FileNotFoundError:
+                    current = None
+                # Still the file at spool_path: the next take_spool() will see the batch
+                if current is not None and (current.st_dev, current.st_ino) == (written.st_dev, written.st_ino):
+                    break
+        except OSError as e:
+            print(f"Could not spool {len(batch)} game results to {self.spool_path}: {e}")
+            self.hold(batch)
+            return
+        self.spooled = True
+        print(f"Spooled {len(batch)} game results to {self.spool_path}")
+
+    def hold(self, batch):
+        """Keep results in memory for the next attempt, dropping the oldest past MAX_HELD_RESULTS"""
+        self.held.extend(batch)
+        dropped = len(self.held) - MAX_HELD_RESULTS
+        if dropped > 0:
+            del self.held[:dropped]
+            self.failed += dropped
+            print(f"Dropped {dropped} game results: the spool is unwritable and {MAX_HELD_RESULTS} are held already")
+
+    def take_spool(self):
+        """Claim and read the spool file; the results are resent or spooled again"""
+        self.spooled = False
+        claimed = f"{self.spool_path}.{os.getpid()}.sending"
+        try:
+            os.replace(self.spool_path, claimed)
+        except FileNotFoundError:
+            return []
+        except OSError as e:
+            print(f"Could not claim spooled game results: {e}")
+            self.spooled = True
+            return []
+        results = []
+        bad_lines = 0
+        try:
+            with open(claimed) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        result = json.loads(line)
+                    except ValueError:
+                        bad_lines += 1
+                        continue
+                    if isinstance(result, dict):
+                        results.append(result)
+                    else:
+                        bad_lines += 1
+            os.remove(claimed)
+        except OSError as e:
+            print(f"Could not read spooled game results from {claimed}: {e}")
+        if bad_lines:
+            print(f"Skipped {bad_lines} unreadable lines in the game result spool")
+        return results
+
+_reporter = None
+_reporter_lock = threading.Lock()
+
+def get_result_reporter(http_url):
+    """The process-wide reporter, started on first use (each game server process gets its own)"""
+    global _reporter
+    with _reporter_lock:
+        if _reporter is None:
+            _reporter = ResultReporter(http_url)
+            atexit.register(_reporter.close)
+        return _reporter
+
+def close_result_reporter(timeout=10):
+    """Send or spool whatever this process's reporter still holds, if it started one.
+
+    atexit does not run in a multiprocessing child, so shard workers call this before they exit.
+    """
+    with _reporter_lock:
+        reporter = _reporter
+    if reporter is not None:
+        reporter.close(timeout)
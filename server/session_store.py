@@ -0,0 +1,180 @@
+"""Login session tokens with expiry and a bounded size.
+
+A session lasts SESSION_TTL seconds after it was last used, and the number
+of live sessions is capped (the least recently used one goes first), so
+memory stays bounded however many logins arrive.
+
+MemorySessionStore keeps everything in this process. SQLiteSessionStore
+keeps sessions in a SQLite file, so several HTTP processes on one host
+share them and they survive restarts. Each process keeps a small read
+cache in front of that file, so most token checks never touch SQLite. A
+revoked token can stay valid in another process's cache for up to
+CACHE_SECONDS.
+"""
+import itertools
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+SESSION_TTL = 24 * 60 * 60
+MAX_SESSIONS = 100000
+SESSIONS_DB_FILE = 'sessions.db'
+CACHE_SECONDS = 5
+CACHE_SIZE = 10000
+# The shared store only writes a new expiry once this much of the TTL has passed, not on every lookup
+REFRESH_AFTER = 0.1
+PRUNE_EVERY = 1000
+
+def new_token():
+    return secrets.token_hex(16)
+
+class MemorySessionStore:
+    def __init__(self, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.clock = clock
+        self.lock = threading.Lock()
+        # token -> (username, expires at), least recently used first
+        self.sessions = OrderedDict()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def create(self, username):
+        token = new_token()
+        with self.lock:
+            self.sessions[token] = (username, self.clock() + self.ttl)
+            if len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        return token
+
+    def get(self, token):
+        """Username for a live token (extending its expiry), else None"""
+        now = self.clock()
+        with self.lock:
+            entry = self.sessions.get(token)
+            if entry is None:
+                return None
+            if entry[1] <= now:
+                del self.sessions[token]
+                return None
+            self.sessions[token] = (entry[0], now + self.ttl)
+            self.sessions.move_to_end(token)
+            return entry[0]
+
+    def revoke(self, token):
+        with self.lock:
+            self.sessions.pop(token, None)
+
+class SQLiteSessionStore:
+    def __init__(self, db_file=SESSIONS_DB_FILE, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS,
+                 cache_seconds=CACHE_SECONDS, cache_size=CACHE_SIZE, clock=time.time):
+        self.db_file = db_file
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.cache_seconds = cache_seconds
+        self.cache_size = cache_size
+        # Wall clock, since other processes compare against the stored expiry times too
+        self.clock = clock
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        # token -> (username, cached until, expires_at as stored), least recently used first
+        self.cache = OrderedDict()
+        # next() on a count is atomic, so concurrent logins neither lose a create nor skip a prune
+        self.creates = itertools.count(1)
+        with self.get_db_connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    token TEXT PRIMARY KEY,
+                    username TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS sessions_expiry ON sessions (expires_at)')
+
+    def get_db_connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=5, cached_statements=64)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+        return conn
+
+    def create(self, username):
+        token = new_token()
+        expires_at = self.clock() + self.ttl
+        with self.get_db_connection() as conn:
+            conn.execute('INSERT INTO sessions (token, username, expires_at) VALUES (?, ?, ?)',
+                         (token, username, expires_at))
+        if next(self.creates) % PRUNE_EVERY == 0:
+            self.prune()
+        self.remember(token, username, expires_at)
+        return token
+
+    def get(self, token):
+        """Username for a live token (extending its expiry), else None"""
+        if not token:
+            return None
+        now = self.clock()
+        with self.lock:
+            entry = self.cache.get(token)
+            if entry is not None:
+                if entry[1] > now:
+                    self.cache.move_to_end(token)
+                else:
+                    del self.cache[token]
+                    entry = None
+        if entry is None:
+            row = self.get_db_connection().execute(
+                'SELECT username, expires_at FROM sessions WHERE token = ? AND expires_at > ?', (token, now)
+            ).fetchone()
+            if row is None:
+                return None
+            entry = (row[0], now + self.cache_seconds, row[1])
+        username, _, expires_at = entry
+        if expires_at - now < self.ttl * (1 - REFRESH_AFTER):
+            expires_at = now + self.ttl
+            with self.get_db_connection() as conn:
+                conn.execute('UPDATE sessions SET expires_at = ? WHERE token = ?', (expires_at, token))
+        self.remember(token, username, expires_at)
+        return username
+
+    def revoke(self, token):
+        with self.get_db_connection() as conn:
+            conn.execute('DELETE FROM sessions WHERE token = ?', (token,))
+        with self.lock:
+            self.cache.pop(token, None)
+
+    def remember(self, token, username, expires_at):
+        with self.lock:
+            cached_until = min(self.clock() + self.cache_seconds, expires_at)
+            previous = self.cache.get(token)
+            if previous is not None:
+                cached_until = previous[1]
+            self.cache[token] = (username, cached_until, expires_at)
+            self.cache.move_to_end(token)
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def prune(self):
+        """Delete expired sessions, then the ones expiring soonest while over max_sessions"""
+        with self.get_db_connection() as conn:
+            conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (self.clock(),))
+            conn.execute('''
+                DELETE FROM sessions WHERE token IN (
+                    SELECT token FROM sessions ORDER BY expires_at DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_sessions,))
+
+def open_session_store(kind=None):
+    """Session store named by kind, or by the SESSION_STORE environment variable: memory (default) or sqlite"""
+    kind = kind or os.environ.get('SESSION_STORE', 'memory')
+    if kind == 'memory':
+        return MemorySessionStore()
+    if kind == 'sqlite':
+        return SQLiteSessionStore()
+    raise ValueError(f"unknown session store: {kind}")
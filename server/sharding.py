@@ -0,0 +1,238 @@
+"""Multi-process game server: a matchmaking process in front of shard workers.
+
+The matchmaking process accepts players and runs the login handshake on its
+own event loop. Once two players are paired, both sockets are passed to the
+least-loaded worker process over a Unix domain socket (SCM_RIGHTS, see
+socket.send_fds) and closed locally. Each worker is an EventLoopGameServer
+without a listening socket that hosts many matches, so physics and state
+serialization spread over as many cores as there are workers instead of
+sharing one GIL.
+
+Workers send their load (running sessions, tick overruns, dropped ticks)
+back after every change and the matchmaker prints a summary periodically.
+Match results are reported by the worker that hosted the match, through the
+same on_match_end callback the single process server uses. Each worker has
+its own result reporter, so workers are never just killed: when the
+matchmaker stops it sends every worker a shutdown message, and a worker
+flushes its reporter (spooling what it cannot send) before it exits. A
+worker whose matchmaker has died finishes its running matches first.
+"""
+import json
+import multiprocessing
+import os
+import selectors
+import signal
+import socket
+import time
+from server.connection import PlayerConnection
+from server.event_loop import EventLoopGameServer
+from server.metrics import REGISTRY
+from server.result_reporter import close_result_reporter
+
+LOAD_REPORT_INTERVAL = 10.0
+MAX_CONTROL_MESSAGE = 4096
+# How long the matchmaker waits for its workers to flush their results before killing them
+WORKER_SHUTDOWN_TIMEOUT = 15.0
+
+class ShardWorker(EventLoopGameServer):
+    """Worker process side: hosts the matches handed over on its control socket"""
+    def __init__(self, index, control, tick_rate=60, on_match_end=None, record_dir=None):
+        super().__init__(None, tick_rate, on_match_end, record_dir=record_dir)
+        self.index = index
+        self.control = control
+        self.received = 0
+        # The control socket takes the place of the listening socket, so accept() receives matches
+        self.selector.register(control, selectors.EVENT_READ, None)
+
+    def accept(self, control):
+        try:
+            data, fds, _, _ = socket.recv_fds(control, MAX_CONTROL_MESSAGE, 2)
+        except (BlockingIOError, InterruptedError):
+            return
+        if not data:
+            self.detach()
+            return
+        message = json.loads(data)
+        if message.get('shutdown'):
+            print(f"Shard worker {self.index}: shutting down, abandoning {len(self.sessions)} matches")
+            self.stop()
+            return
+        players = []
+        for fd, info in zip(fds, message['players']):
+            player = PlayerConnection(socket.socket(fileno=fd), tuple(info['addr']))
+            player.name, player.token = info['name'], info['token']
+            player.set_protocol(info['protocol'])
+            players.append(player)
+        self.received += 1
+        if len(players) == 2:
+            self.add_session(*players)
+        else:
+            for player in players:
+                player.close()
+        self.report_load()
+
+    def detach(self):
+        """The matchmaker has gone away: finish the running matches, then exit"""
+        print(f"Shard worker {self.index}: matchmaker closed, finishing {len(self.sessions)} matches")
+        self.selector.unregister(self.control)
+        self.control.close()
+        self.control = None
+        if not self.sessions:
+            self.stop()
+
+    def end_session(self, session):
+        super().end_session(session)
+        if self.control is not None:
+            self.report_load()
+        elif not self.sessions:
+            self.stop()
+
+    def report_load(self):
+        status = {
+            'received': self.received, 'sessions': len(self.sessions),
+            'overruns': self.scheduler.overruns, 'dropped_ticks': self.scheduler.dropped_ticks
+        }
+        try:
+            self.control.send(json.dumps(status).encode())
+        except OSError as e:
+            print(f"Shard worker {self.index}: could not report load: {e}")
+
+def run_worker(index, control, tick_rate, on_match_end, record_dir=None, inherited=()):
+    # A forked worker holds copies of the matchmaker's ends of every control socket created so far, its
+    # own included. Left open, they would keep the matchmaker (or this worker) from seeing EOF when the
+    # other side exits.
+    for sock in inherited:
+        sock.close()
+    print(f"Shard worker {index} started (pid {os.getpid()})")
+    worker = ShardWorker(index, control, tick_rate, on_match_end, record_dir)
+    # terminate() sends SIGTERM; stop the loop instead of dying, so the results below still get flushed
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    try:
+        worker.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close_result_reporter()
+
+class WorkerHandle:
+    """Matchmaker side view of one worker process"""
+    def __init__(self, index, process, control):
+        self.index, self.process, self.control = index, process, control
+        self.dispatched = 0
+        self.status = {'received': 0, 'sessions': 0, 'overruns': 0, 'dropped_ticks': 0}
+
+    @property
+    def load(self):
+        """Matches running on the worker plus the ones sent that it has not picked up yet"""
+        return self.status['sessions'] + self.dispatched - self.status['received']
+
+class ShardedGameServer(EventLoopGameServer):
+    """Accepts and pairs players, then hands every match to the least-loaded worker"""
+    def __init__(self, port, workers=None, tick_rate=60, on_match_end=None, rating_source=None, record_dir=None):
+        super().__init__(port, tick_rate, rating_source=rating_source, record_dir=record_dir)
+        self.worker_count = workers or os.cpu_count() or 1
+        self.match_end_callback = on_match_end
+        self.workers = []
+        self.last_load_report = time.monotonic()
+        # Matches run in the workers, so their tick statistics stay there; the parent publishes each worker's load
+        REGISTRY.gauge('shard_worker_sessions', lambda: {w.index: w.status['sessions'] for w in self.workers},
+                       "Matches running in each worker process", label='worker')
+        REGISTRY.gauge('shard_worker_overruns', lambda: {w.index: w.status['overruns'] for w in self.workers},
+                       "Tick overruns reported by each worker process", label='worker')
+
+    def run(self):
+        self.start_workers()
+        try:
+            super().run()
+        finally:
+            self.stop_workers()
+
+    def stop_workers(self):
+        """Ask every worker to flush its results and exit, then wait for them"""
+        for worker in self.workers:
+            try:
+                worker.control.setblocking(True)
+                worker.control.send(json.dumps({'shutdown': True}).encode())
+            except OSError:
+                pass
+        deadline = time.monotonic() + WORKER_SHUTDOWN_TIMEOUT
+        for worker in self.workers:
+            worker.process.join(max(0.0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                print(f"Shard worker {worker.index} did not exit in time; terminating it")
+                worker.process.terminate()
+                worker.process.join(1)
+                if worker.process.is_alive():
+                    worker.process.kill()
+
+    def start_workers(self):
+        for index in range(self.worker_count):
+            parent_end, child_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+            inherited = [parent_end] + [worker.control for worker in self.workers]
+            process = multiprocessing.Process(
+                target=run_worker,
+                args=(index, child_end, self.tick_rate, self.match_end_callback, self.record_dir, inherited),
+                name=f"shard-{index}", daemon=True
+            )
+            process.start()
+            child_end.close()
+            parent_end.setblocking(False)
+            worker = WorkerHandle(index, process, parent_end)
+            self.workers.append(worker)
+            self.selector.register(parent_end, selectors.EVENT_READ, worker)
+
+    def handle_player_event(self, player, mask):
+        if isinstance(player, WorkerHandle):
+            self.read_worker_status(player)
+        else:
+            super().handle_player_event(player, mask)
+
+    def read_worker_status(self, worker):
+        while True:
+            try:
+                data = worker.control.recv(MAX_CONTROL_MESSAGE)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                data = b''
+            if not data:
+                print(f"Shard worker {worker.index} exited with code {worker.process.exitcode}")
+                self.selector.unregister(worker.control)
+                worker.control.close()
+                self.workers.remove(worker)
+                return
+            worker.status.update(json.loads(data))
+
+    def start_session(self, p1, p2):
+        if not self.workers:
+            print(f"No shard workers left, dropping {p1.name} and {p2.name}")
+        else:
+            worker = min(self.workers, key=lambda w: w.load)
+            message = json.dumps({'players': [
+                {'name': p.name, 'token': p.token, 'protocol': p.protocol, 'addr': list(p.addr)}
+                for p in (p1, p2)
+            ]}).encode()
+            try:
+                socket.send_fds(worker.control, [message], [p1.fileno(), p2.fileno()])
+                worker.dispatched += 1
+                print(f"Game session between {p1.name} and {p2.name} handed to shard worker {worker.index}.")
+            except OSError as e:
+                print(f"Could not hand match to shard worker {worker.index}: {e}")
+        # The worker owns its own copies of the sockets now
+        for player in (p1, p2):
+            self.close_player(player)
+
+    def tick(self, ticks):
+        super().tick(ticks)
+        now = time.monotonic()
+        if now - self.last_load_report >= LOAD_REPORT_INTERVAL:
+            self.last_load_report = now
+            if any(worker.load for worker in self.workers):
+                print("Shard loads: " + ", ".join(
+                    f"#{w.index} {w.load} matches ({w.status['overruns']} overruns)" for w in self.workers
+                ))
+
+    def loads(self):
+        """Current load of every worker, for monitoring"""
+        return [dict(worker.status, worker=worker.index, pid=worker.process.pid, load=worker.load)
+                for worker in self.workers]
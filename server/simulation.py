@@ -0,0 +1,78 @@
+"""Headless, deterministic match simulation.
+
+Runs the same Match rules the game server uses, without sockets or wall
+clock time, driven by scripted or recorded paddle input streams. Given the
+same seed and inputs a simulation always produces the same ticks, which
+makes it usable for regression tests, replays and benchmarks.
+"""
+import hashlib
+import math
+import random
+import struct
+from server.match import Match, WIDTH, HEIGHT, BASE_TICK_RATE
+
+DEFAULT_MAX_TICKS = 60 * 60 * 10
+
+def sweeping_input(player, seed=0):
+    """Endless scripted input: the paddle sweeps its half on a seeded pseudo-random path"""
+    rng = random.Random(seed * 2 + player)
+    centre_x = WIDTH / 4 if player == 1 else WIDTH * 3 / 4
+    speed_x, speed_y = rng.uniform(0.03, 0.12), rng.uniform(0.03, 0.12)
+    phase_x, phase_y = rng.uniform(0, math.tau), rng.uniform(0, math.tau)
+    tick = 0
+    while True:
+        yield {
+            'x': centre_x + (WIDTH / 4) * math.sin(tick * speed_x + phase_x),
+            'y': HEIGHT / 2 + (HEIGHT / 2) * math.sin(tick * speed_y + phase_y)
+        }
+        tick += 1
+
+def recorded_input(positions):
+    """Input stream from recorded (x, y) pairs; None entries mean no input that tick"""
+    for position in positions:
+        yield None if position is None else {'x': position[0], 'y': position[1]}
+
+def state_digest(game_state):
+    """Stable hash of the dynamic part of a game state, for determinism checks"""
+    values = (*game_state['puck_pos'], *game_state['puck_vel'],
+              *game_state['p1_pos'], *game_state['p2_pos'])
+    packed = struct.pack('<8d2H?', *values, *game_state['score'], game_state['game_over'])
+    return hashlib.sha1(packed).hexdigest()
+
+class Simulation:
+    """One headless match: a seeded Match plus an input stream for each player"""
+    def __init__(self, p1_inputs, p2_inputs, seed=0, tick_rate=BASE_TICK_RATE, swept=None,
+                 p1_name='P1', p2_name='P2'):
+        self.p1_inputs, self.p2_inputs = iter(p1_inputs), iter(p2_inputs)
+        self.match = Match(p1_name, p2_name, tick_rate, swept, rng=random.Random(seed))
+        self.game_state = self.match.game_state
+        self.goals = []
+
+    def step(self):
+        """Advance one tick; returns False once the match is over or an input stream ran out"""
+        if self.game_state['game_over']:
+            return False
+        try:
+            p1_input, p2_input = next(self.p1_inputs), next(self.p2_inputs)
+        except StopIteration:
+            return False
+        if self.match.step(p1_input, p2_input):
+            self.goals.append(self.match.tick)
+        return True
+
+    def run(self, max_ticks=DEFAULT_MAX_TICKS, on_tick=None):
+        """Run until the match ends, the inputs run out or max_ticks is reached"""
+        while self.match.tick < max_ticks and self.step():
+            if on_tick:
+                on_tick(self.match)
+        return self.game_state
+
+def simulate(seed=0, max_ticks=DEFAULT_MAX_TICKS, tick_rate=BASE_TICK_RATE, swept=None, p1_inputs=None, p2_inputs=None):
+    """Run a whole match with scripted sweeping paddles unless input streams are given"""
+    simulation = Simulation(
+        p1_inputs if p1_inputs is not None else sweeping_input(1, seed),
+        p2_inputs if p2_inputs is not None else sweeping_input(2, seed),
+        seed, tick_rate, swept
+    )
+    simulation.run(max_ticks)
+    return simulation
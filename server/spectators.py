@@ -0,0 +1,275 @@
+"""Live spectators: serialize each tick once and fan it out off the game loop.
+
+Every session opens a Channel with a numeric ID. Observers connect to the
+game port and log in with {"spectate": <session id>, "protocol": 0|1}
+instead of a name and token. The list of live sessions is served on the
+stats port at /sessions.
+
+The session's only cost is publish(): if the channel has spectators, it
+stores a copy of the state in the channel, and that costs a few
+microseconds. It never touches a spectator socket. One broadcaster thread
+wakes at most once per frame interval. It serializes the newest state of
+each channel once per protocol in use, and queues that bytes object, shared
+and not copied, to every spectator.
+
+Each spectator has a small bounded queue of frames. Every frame is a full
+state, so when the queue fills up, the stale frames are thrown away and
+only the newest one is kept. A spectator whose socket accepts nothing for
+STALL_TIMEOUT seconds is disconnected. Slow or stuck spectators cost
+memory only up to their queue bound, and never cost the players any time.
+
+The delta protocol needs per-client acknowledgements, so spectators asking
+for it are served binary state frames instead. Spectating works with the
+threaded and event loop servers. In sharded mode, matches run in worker
+processes that spectators cannot reach, so subscribing fails.
+"""
+import itertools
+import json
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from common.protocol import StateEncoder, negotiate_protocol, PROTOCOL_JSON, PROTOCOL_BINARY, PROTOCOL_DELTA
+from server.metrics import REGISTRY
+
+FRAME_INTERVAL = 1 / 60
+MAX_QUEUED_FRAMES = 8
+STALL_TIMEOUT = 5.0
+# How long a finished session's last frames may take to reach its spectators
+CLOSE_TIMEOUT = 2.0
+
+def spectate_request(login_data):
+    """The session ID a login message asks to watch, or None for a player login"""
+    if not isinstance(login_data, dict) or 'spectate' not in login_data:
+        return None
+    return str(login_data['spectate'])
+
+def reject(conn, reason):
+    """Tell a spectator why it cannot watch, then close its socket.
+
+    Called from accept loops, so this is one non-blocking send: a peer that
+    cannot take a few dozen bytes right away just gets the close.
+    """
+    try:
+        conn.setblocking(False)
+        conn.send(json.dumps({'error': reason}).encode())
+    except socket.error:
+        pass
+    finally:
+        conn.close()
+
+class Spectator:
+    """One observer socket with a bounded queue of shared frames"""
+    __slots__ = ('conn', 'protocol', 'channel', 'frames', 'current', 'last_progress', 'max_frames')
+
+    def __init__(self, conn, protocol, channel, max_frames=MAX_QUEUED_FRAMES):
+        conn.setblocking(False)
+        self.conn, self.protocol, self.channel = conn, protocol, channel
+        self.max_frames = max_frames
+        self.frames = deque()
+        # Remainder of the frame being written; it is never dropped, or the stream would be corrupted
+        self.current = None
+        self.last_progress = time.monotonic()
+
+    def push(self, frame):
+        if len(self.frames) >= self.max_frames:
+            REGISTRY.inc('spectator_frames_skipped_total', len(self.frames))
+            self.frames.clear()
+        self.frames.append(frame)
+
+    def pending(self):
+        return self.current is not None or bool(self.frames)
+
+    def flush(self, now):
+        """Write as much as the socket accepts. Returns True when drained; raises OSError on a dead socket."""
+        while True:
+            if self.current is None:
+                if not self.frames:
+                    return True
+                self.current = memoryview(self.frames.popleft())
+            try:
+                sent = self.conn.send(self.current)
+            except (BlockingIOError, InterruptedError):
+                return False
+            self.last_progress = now
+            self.current = self.current[sent:] if sent < len(self.current) else None
+
+class Channel:
+    """The spectator side of one running session"""
+    def __init__(self, session_id, p1_name, p2_name):
+        self.id = session_id
+        self.p1_name, self.p2_name = p1_name, p2_name
+        self.started = time.time()
+        self.spectators = []
+        # (tick, state copy), replaced by every publish; the broadcaster only ever sends the newest
+        self.latest = None
+        self.sent = None
+        self.closed_at = None
+        self.encoder = StateEncoder()
+
+    def publish(self, game_state, tick):
+        """Called by the session after every tick pass; a no-op while nobody is watching"""
+        if not self.spectators:
+            return
+        self.latest = (tick, {
+            **game_state, 'puck_pos': list(game_state['puck_pos']), 'puck_vel': list(game_state['puck_vel']),
+            'p1_pos': list(game_state['p1_pos']), 'p2_pos': list(game_state['p2_pos']),
+            'score': list(game_state['score'])
+        })
+
+    def handshake(self, protocol):
+        message = {'spectating': self.id, 'p1_name': self.p1_name, 'p2_name': self.p2_name}
+        if protocol != PROTOCOL_JSON:
+            message['protocol'] = protocol
+        return json.dumps(message).encode()
+
+    def frames(self, protocols):
+        """The newest state serialized once for each protocol in protocols"""
+        tick, state = self.latest
+        frames = {}
+        if PROTOCOL_JSON in protocols:
+            frames[PROTOCOL_JSON] = json.dumps(state).encode()
+        if PROTOCOL_BINARY in protocols:
+            # The encoder reuses its buffer, so take one bytes copy that every spectator shares
+            frames[PROTOCOL_BINARY] = bytes(self.encoder.encode(state, tick))
+        return frames
+
+    def info(self):
+        return {'id': self.id, 'p1_name': self.p1_name, 'p2_name': self.p2_name,
+                'started': round(self.started, 3), 'spectators': len(self.spectators)}
+
+class SpectatorHub:
+    def __init__(self, frame_interval=FRAME_INTERVAL, max_frames=MAX_QUEUED_FRAMES, stall_timeout=STALL_TIMEOUT):
+        self.frame_interval = frame_interval
+        self.max_frames = max_frames
+        self.stall_timeout = stall_timeout
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.channels = {}
+        # Spectators subscribed since the broadcaster's last pass; only the broadcaster touches its selector
+        self.joining = []
+        self.selector = None
+        self.thread = None
+        self.connected = 0
+        REGISTRY.gauge('spectators_connected', lambda: self.connected, "Spectators watching a live match")
+
+    def open_channel(self, p1_name, p2_name):
+        with self.lock:
+            channel = Channel(str(next(self.ids)), p1_name, p2_name)
+            self.channels[channel.id] = channel
+        return channel
+
+    def close_channel(self, channel):
+        """The session is over: its spectators get the frames already queued, then are disconnected"""
+        with self.lock:
+            if channel.closed_at is None:
+                channel.closed_at = time.monotonic()
+            if not channel.spectators and not any(s.channel is channel for s in self.joining):
+                self.channels.pop(channel.id, None)
+
+    def subscribe(self, session_id, conn, protocol=PROTOCOL_JSON):
+        """Attach an observer socket to a live session; rejects it (and closes conn) if there is none"""
+        if protocol == PROTOCOL_DELTA:
+            protocol = PROTOCOL_BINARY
+        with self.lock:
+            channel = self.channels.get(session_id)
+            if channel is not None and channel.closed_at is None:
+                spectator = Spectator(conn, protocol, channel, self.max_frames)
+                # Sent ahead of the queue, so skipping stale frames can never drop it
+                spectator.current = memoryview(channel.handshake(protocol))
+                self.joining.append(spectator)
+                self.start()
+        if channel is None or channel.closed_at is not None:
+            reject(conn, f"no live session {session_id}")
+            return False
+        print(f"Spectator joined session {session_id} ({channel.p1_name} vs {channel.p2_name})")
+        return True
+
+    def subscribe_login(self, conn, login_data):
+        return self.subscribe(spectate_request(login_data), conn, negotiate_protocol(login_data))
+
+    def sessions(self):
+        with self.lock:
+            return [channel.info() for channel in self.channels.values() if channel.closed_at is None]
+
+    def start(self):
+        """Start the broadcaster on the first subscription (called with the lock held)"""
+        if self.thread is None:
+            self.selector = selectors.DefaultSelector()
+            self.thread = threading.Thread(target=self.run, name='spectators', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        next_frame = time.monotonic()
+        while True:
+            events = self.selector.select(max(0.0, next_frame - time.monotonic()))
+            now = time.monotonic()
+            for key, mask in events:
+                self.handle_event(key.data, mask, now)
+            if now >= next_frame:
+                next_frame = max(next_frame + self.frame_interval, now)
+                self.broadcast(now)
+
+    def handle_event(self, spectator, mask, now):
+        if spectator.conn.fileno() < 0:
+            return
+        try:
+            if mask & selectors.EVENT_READ and not spectator.conn.recv(4096):
+                raise ConnectionError("spectator disconnected")
+            if mask & selectors.EVENT_WRITE:
+                self.send(spectator, now)
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError:
+            self.drop(spectator)
+
+    def broadcast(self, now):
+        with self.lock:
+            for spectator in self.joining:
+                spectator.channel.spectators.append(spectator)
+                self.selector.register(spectator.conn, selectors.EVENT_READ, spectator)
+                self.connected += 1
+            self.joining = []
+            channels = list(self.channels.values())
+        for channel in channels:
+            spectators = list(channel.spectators)
+            if channel.latest is not channel.sent and spectators:
+                frames = channel.frames({spectator.protocol for spectator in spectators})
+                channel.sent = channel.latest
+                for spectator in spectators:
+                    spectator.push(frames[spectator.protocol])
+            for spectator in spectators:
+                try:
+                    self.send(spectator, now)
+                except OSError:
+                    self.drop(spectator)
+                    continue
+                if spectator.pending() and now - spectator.last_progress > self.stall_timeout:
+                    print(f"Dropping a spectator of session {channel.id}: not reading for {self.stall_timeout:.0f} s")
+                    self.drop(spectator, stalled=True)
+            if channel.closed_at is not None and (
+                    not any(s.pending() for s in channel.spectators) or now - channel.closed_at > CLOSE_TIMEOUT):
+                for spectator in list(channel.spectators):
+                    self.drop(spectator)
+                self.close_channel(channel)
+
+    def send(self, spectator, now):
+        drained = spectator.flush(now)
+        events = selectors.EVENT_READ if drained else selectors.EVENT_READ | selectors.EVENT_WRITE
+        if self.selector.get_key(spectator.conn).events != events:
+            self.selector.modify(spectator.conn, events, spectator)
+
+    def drop(self, spectator, stalled=False):
+        if spectator in spectator.channel.spectators:
+            spectator.channel.spectators.remove(spectator)
+            self.connected -= 1
+            if stalled:
+                REGISTRY.inc('spectators_dropped_total')
+        try:
+            self.selector.unregister(spectator.conn)
+        except (KeyError, ValueError):
+            pass
+        spectator.conn.close()
+
+SPECTATORS = SpectatorHub()
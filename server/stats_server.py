@@ -0,0 +1,58 @@
+"""Local stats port for the game server.
+
+A small HTTP listener on a daemon thread, bound to localhost by default,
+that serves the process's metrics registry:
+
+    GET /metrics   Prometheus text
+    GET /stats     the same metrics as JSON
+    GET /sessions  live sessions that spectators can watch, as JSON
+
+It never touches the game loop. Reading the metrics only takes the
+registry's and the session aggregate's locks briefly.
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from server.metrics import REGISTRY
+from server.spectators import SPECTATORS
+
+STATS_PORT = 9100
+
+class StatsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        path = self.path.partition('?')[0]
+        if path == '/metrics':
+            self.reply(self.registry.render_prometheus().encode(), 'text/plain; version=0.0.4')
+        elif path == '/stats':
+            self.reply(json.dumps(self.registry.snapshot(), indent=2).encode(), 'application/json')
+        elif path == '/sessions':
+            self.reply(json.dumps(SPECTATORS.sessions(), indent=2).encode(), 'application/json')
+        else:
+            self.send_error(404)
+
+    def reply(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stats_server(port=STATS_PORT, host='127.0.0.1'):
+    """Serve the metrics on a daemon thread; returns the server (shutdown() stops it), or None if it cannot bind.
+
+    Stats are optional, so a port that is taken is logged and the game server runs without them.
+    """
+    try:
+        server = ThreadingHTTPServer((host, port), StatsHandler)
+    except OSError as e:
+        print(f"Stats server not started on {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='stats-server', daemon=True).start()
+    print(f"Stats available on http://{host}:{server.server_port}/metrics, /stats and /sessions")
+    return server
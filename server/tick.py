@@ -0,0 +1,41 @@
+import time
+
+class TickScheduler:
+    """Fixed-timestep scheduler based on a monotonic clock accumulator.
+
+    The simulation advances in whole ticks of 1/tick_rate seconds regardless
+    of when player input arrives or how long the previous frame took. When the
+    caller falls behind, up to max_catchup_ticks are run back to back and the
+    rest are dropped so a stall does not turn into a burst of hundreds of ticks.
+    """
+    def __init__(self, tick_rate=60, max_catchup_ticks=5, clock=time.monotonic):
+        self.tick_rate = tick_rate
+        self.tick_interval = 1 / tick_rate
+        self.max_catchup_ticks = max_catchup_ticks
+        self.clock = clock
+        self.last_time = clock()
+        self.accumulator = 0.0
+        self.ticks = 0
+        self.overruns = 0
+        self.dropped_ticks = 0
+
+    def ticks_due(self):
+        """Return how many ticks should be simulated now"""
+        now = self.clock()
+        self.accumulator += now - self.last_time
+        self.last_time = now
+        due = int(self.accumulator / self.tick_interval)
+        if due == 0:
+            return 0
+        self.accumulator -= due * self.tick_interval
+        if due > 1:
+            self.overruns += 1
+        if due > self.max_catchup_ticks:
+            self.dropped_ticks += due - self.max_catchup_ticks
+            due = self.max_catchup_ticks
+        self.ticks += due
+        return due
+
+    def time_until_next_tick(self):
+        elapsed = self.accumulator + (self.clock() - self.last_time)
+        return max(0.0, self.tick_interval - elapsed)
@@ -0,0 +1,117 @@
+"""Group commit for game result updates.
+
+In write-behind mode, request threads do not run their own transaction for
+each result. They queue the update and wait on a future. One writer thread
+takes everything that queued up while the previous commit ran, waiting at
+most max_delay for more, up to max_batch results. It applies them with one
+executemany() in a single transaction and then resolves the futures. A
+hundred concurrent results cost one commit instead of a hundred, and each
+client is still answered only once its result is committed.
+
+close() flushes what is queued before the writer stops. stats() reports
+batch sizes and commit latency.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from server.metrics import REGISTRY, SIZE_BUCKETS
+
+MAX_BATCH = 500
+MAX_DELAY = 0.01
+
+class ResultWriter:
+    def __init__(self, db, max_batch=MAX_BATCH, max_delay=MAX_DELAY):
+        self.db = db
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.closed = False
+        self.batches = self.results = self.largest_batch = 0
+        self.commit_seconds = self.slowest_commit = 0.0
+        self.thread = threading.Thread(target=self.run, name='result-writer', daemon=True)
+        self.thread.start()
+        REGISTRY.gauge('result_writer_queue_depth', self.queue.qsize, "Game results waiting for a group commit")
+
+    def submit(self, username, won, goals_scored, goals_conceded, score_change):
+        """Queue one result; the future resolves to False if the player does not exist"""
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("result writer is closed")
+            self.queue.put(((username, won, goals_scored, goals_conceded, score_change), future))
+        return future
+
+    def close(self, timeout=10):
+        """Commit everything already queued, then stop the writer thread"""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.queue.put(None)
+        self.thread.join(timeout)
+        print(f"Result writer flushed: {self.stats()}")
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self.next_batch()
+            if batch:
+                self.write(batch)
+
+    def next_batch(self):
+        """Wait for a result, then collect more until max_batch or max_delay. Returns (batch, stopping)."""
+        item = self.queue.get()
+        deadline = time.monotonic() + self.max_delay
+        batch = []
+        while item is not None:
+            batch.append(item)
+            if len(batch) >= self.max_batch:
+                return batch, False
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return batch, False
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    return batch, False
+        return batch, True
+
+    def write(self, batch):
+        started = time.perf_counter()
+        try:
+            applied = self.db.update_game_results([result for result, _ in batch])
+        except Exception as e:
+            print(f"Could not write {len(batch)} game results as one batch: {e}")
+            # The transaction was rolled back; apply them one by one so only the bad ones fail
+            for result, future in batch:
+                try:
+                    future.set_result(self.db.update_game_result(*result))
+                except Exception as e:
+                    future.set_exception(e)
+            return
+        elapsed = time.perf_counter() - started
+        self.batches += 1
+        self.results += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        self.commit_seconds += elapsed
+        self.slowest_commit = max(self.slowest_commit, elapsed)
+        REGISTRY.observe('result_writer_batch_size', len(batch), SIZE_BUCKETS)
+        REGISTRY.observe('result_writer_commit_seconds', elapsed)
+        for (_, future), ok in zip(batch, applied):
+            future.set_result(ok)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'results': self.results,
+            'mean_batch_size': round(self.results / self.batches, 1) if self.batches else 0,
+            'max_batch_size': self.largest_batch,
+            'mean_commit_ms': round(1000 * self.commit_seconds / self.batches, 2) if self.batches else 0,
+            'max_commit_ms': round(1000 * self.slowest_commit, 2),
+            'queued': self.queue.qsize(),
+        }
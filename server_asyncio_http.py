@@ -0,0 +1,168 @@
+"""asyncio front end for the HTTP API.
+
+Serves the same HttpServer routes as server_thread_pool_http.py, but all
+connection and protocol handling runs on one event loop, so idle keep-alive
+connections cost no threads. Route handlers block (SQLite, or waiting on the
+bcrypt process pool) and run in two fixed-size executors: password hashing
+routes get one worker per core, everything else a separate I/O pool, so a
+burst of logins cannot starve leaderboard reads.
+
+Load is bounded everywhere: the listen backlog, the number of open
+connections, and per executor the number of running requests (its thread
+count) and of requests waiting for a thread are all limits. Past them the
+server answers 503 with Retry-After right away instead of letting requests
+queue until clients time out.
+"""
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from server.http_handler import HttpServer
+from server.password_hasher import PasswordHasher
+from server.http_protocol import HttpRequestParser, HttpParseError, set_connection_header, error_response
+from server.metrics import REGISTRY
+from server.session_store import open_session_store
+
+HTTP_PORT = 8000
+BACKLOG = 1024
+MAX_CONNECTIONS = 10000
+IO_WORKERS = 16
+MAX_QUEUED = 128
+KEEP_ALIVE_TIMEOUT = 5
+MAX_REQUESTS_PER_CONNECTION = 1000
+RETRY_AFTER_SECONDS = 1
+CPU_BOUND_ROUTES = {('POST', '/login'), ('POST', '/register')}
+
+class AsyncHttpServer:
+    def __init__(self, httpserver, port=HTTP_PORT, backlog=BACKLOG, max_connections=MAX_CONNECTIONS,
+                 max_queued=MAX_QUEUED, cpu_workers=None, io_workers=IO_WORKERS,
+                 keep_alive_timeout=KEEP_ALIVE_TIMEOUT):
+        self.httpserver = httpserver
+        self.port = port
+        self.backlog = backlog
+        self.max_connections = max_connections
+        self.max_queued = max_queued
+        self.keep_alive_timeout = keep_alive_timeout
+        self.pool_sizes = {'cpu': cpu_workers or os.cpu_count() or 1, 'io': io_workers}
+        self.pools = {name: ThreadPoolExecutor(size, thread_name_prefix=f'http-{name}')
+                      for name, size in self.pool_sizes.items()}
+        self.slots = {}
+        self.pending = {name: 0 for name in self.pools}
+        self.connections = 0
+        self.rejected = 0
+        REGISTRY.gauge('http_executor_queue_depth',
+                       lambda: {name: max(0, self.pending[name] - size) for name, size in self.pool_sizes.items()},
+                       "Requests waiting for an executor thread", label='pool')
+        REGISTRY.gauge('http_open_connections', lambda: self.connections, "Open client connections")
+
+    async def serve(self):
+        # One slot per executor thread, so work never queues invisibly inside an executor
+        self.slots = {name: asyncio.Semaphore(size) for name, size in self.pool_sizes.items()}
+        server = await asyncio.start_server(self.handle_connection, '0.0.0.0', self.port, backlog=self.backlog)
+        print(f"HTTP server (asyncio) running on port {self.port}...")
+        async with server:
+            await server.serve_forever()
+
+    def busy_response(self):
+        self.rejected += 1
+        REGISTRY.inc('http_busy_rejections_total')
+        response = self.httpserver.response(503, 'Service Unavailable', b'{"error": "Server busy, retry later"}',
+                                            {'Content-Type': 'application/json',
+                                             'Retry-After': str(RETRY_AFTER_SECONDS)})
+        return set_connection_header(response, False)
+
+    async def handle_connection(self, reader, writer):
+        self.connections += 1
+        try:
+            if self.connections > self.max_connections:
+                writer.write(self.busy_response())
+                await writer.drain()
+                return
+            await self.serve_requests(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            print(f"Error processing client {writer.get_extra_info('peername')}: {e}")
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def serve_requests(self, reader, writer):
+        parser = HttpRequestParser()
+        served = 0
+        client_ip = (writer.get_extra_info('peername') or (None,))[0]
+        while True:
+            try:
+                data = await asyncio.wait_for(reader.read(65536), self.keep_alive_timeout)
+            except asyncio.TimeoutError:
+                return
+            if not data:
+                return
+            try:
+                requests = parser.feed(data)
+            except HttpParseError as e:
+                self.httpserver.access_log.log({'time': time.time(), 'client': client_ip, 'status': e.status,
+                                                'error': str(e)})
+                writer.write(error_response(e.status, e.reason))
+                await writer.drain()
+                return
+
+            for request in requests:
+                served += 1
+                keep_alive = request.keep_alive and served < MAX_REQUESTS_PER_CONNECTION
+                pool = 'cpu' if (request.method, request.path) in CPU_BOUND_ROUTES else 'io'
+                if self.pending[pool] >= self.pool_sizes[pool] + self.max_queued:
+                    writer.write(self.busy_response())
+                    await writer.drain()
+                    return
+                response = await self.dispatch(pool, request, client_ip)
+                writer.write(set_connection_header(response, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    return
+
+    async def dispatch(self, pool, request, client_ip=None):
+        """Run the route handler in the given executor, waiting for a free thread first"""
+        self.pending[pool] += 1
+        queued_at = time.perf_counter()
+        try:
+            async with self.slots[pool]:
+                REGISTRY.observe('http_executor_wait_seconds', time.perf_counter() - queued_at, pool=pool)
+                return await asyncio.get_running_loop().run_in_executor(
+                    self.pools[pool], self.httpserver.handle_request, request.method, request.path, request.headers,
+                    request.body.decode('utf-8', errors='ignore'), client_ip
+                )
+        finally:
+            self.pending[pool] -= 1
+
+def run_asyncio_http_server(args):
+    # The bcrypt workers fork before the session store opens its SQLite connection
+    hasher = PasswordHasher().start()
+    httpserver = HttpServer(open_session_store(args.session_store), args.write_behind or None, hasher=hasher)
+    server = AsyncHttpServer(
+        httpserver, port=args.port, backlog=args.backlog, max_connections=args.max_connections,
+        max_queued=args.max_queued, cpu_workers=args.cpu_workers, io_workers=args.io_workers,
+        keep_alive_timeout=args.keep_alive_timeout
+    )
+    asyncio.run(server.serve())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Air hockey HTTP API server (asyncio)")
+    parser.add_argument('--port', type=int, default=HTTP_PORT)
+    parser.add_argument('--backlog', type=int, default=BACKLOG, help="listen() backlog")
+    parser.add_argument('--max-connections', type=int, default=MAX_CONNECTIONS,
+                        help="open connections before new ones get 503")
+    parser.add_argument('--max-queued', type=int, default=MAX_QUEUED,
+                        help="requests waiting for a thread, per executor, before new ones get 503")
+    parser.add_argument('--cpu-workers', type=int, default=None,
+                        help="threads for password hashing routes (default: one per core)")
+    parser.add_argument('--io-workers', type=int, default=IO_WORKERS, help="threads for database routes")
+    parser.add_argument('--keep-alive-timeout', type=float, default=KEEP_ALIVE_TIMEOUT,
+                        help="seconds an idle connection is kept open")
+    parser.add_argument('--session-store', choices=('memory', 'sqlite'), default=None,
+                        help="where login sessions live; sqlite shares them between processes "
+                             "(default: $SESSION_STORE or memory)")
+    parser.add_argument('--write-behind', action='store_true',
+                        help="group-commit game results in batches (default: on if $WRITE_BEHIND=1)")
+    run_asyncio_http_server(parser.parse_args())
@@ -1,79 +1,100 @@
 import socket
+import threading
+import time
 from concurrent.futures import ThreadPoolExecutor
-from server.http_handler import HttpServer 
+from server.http_handler import HttpServer
+from server.http_protocol import HttpRequestParser, HttpParseError, set_connection_header, error_response
+from server.metrics import REGISTRY
 
 HTTP_PORT = 8000
-httpserver = HttpServer()
+KEEP_ALIVE_TIMEOUT = 5
+# Total time a client gets to send one request (head and body), however it trickles the bytes in
+REQUEST_TIMEOUT = 10
+MAX_REQUESTS_PER_CONNECTION = 1000
+MAX_WORKERS = 64
+# Created by run_http_server(), so importing this module opens no database
+httpserver = None
+# Connections submitted to the executor and not finished yet, running or waiting for a thread
+pending = 0
+pending_lock = threading.Lock()
 
-def process_the_client(connection, address):
+def process_the_client(connection, address, accepted_at):
+    """Serve requests on one persistent connection until the client closes it or goes idle"""
+    REGISTRY.observe('http_executor_wait_seconds', time.perf_counter() - accepted_at, pool='workers')
+    parser = HttpRequestParser()
+    served = 0
+    deadline = None
     try:
-        header_data = b""
-        connection.settimeout(1) 
         while True:
+            # A per-recv timeout alone lets a client hold this thread forever by sending a byte at a time
+            timeout = KEEP_ALIVE_TIMEOUT if deadline is None else min(KEEP_ALIVE_TIMEOUT,
+                                                                      deadline - time.monotonic())
             try:
-                chunk = connection.recv(1024)
-                if not chunk:
-                    break
-                header_data += chunk
-                if b"\r\n\r\n" in header_data:
-                    break
+                connection.settimeout(max(timeout, 0.001))
+                data = connection.recv(65536)
             except socket.timeout:
+                if deadline is not None and time.monotonic() >= deadline:
+                    httpserver.access_log.log({'time': time.time(), 'client': address[0], 'status': 408,
+                                               'error': "request not received in time"})
+                    connection.settimeout(KEEP_ALIVE_TIMEOUT)
+                    connection.sendall(error_response(408, 'Request Timeout'))
                 break
-        
-        print("---- REQUEST RECEIVED ----")
-        print(header_data.decode('utf-8', errors='ignore'))
-        print("--------------------------")
-        
-        if not header_data:
-            connection.close()
-            return
-
-        parts = header_data.split(b"\r\n\r\n", 1)
-        header_part = parts[0]
-        body_part = parts[1] if len(parts) > 1 else b""
-        
-        headers = header_part.decode('utf-8').split('\r\n')
-        
-        content_length = 0
-        for h in headers:
-            if h.lower().startswith('content-length:'):
-                try:
-                    content_length = int(h.split(':')[1].strip())
-                    break
-                except (ValueError, IndexError):
-                    pass
-        
-        while len(body_part) < content_length:
+            if not data:
+                break
+            if deadline is None:
+                deadline = time.monotonic() + REQUEST_TIMEOUT
             try:
-                chunk = connection.recv(1024)
-                if not chunk:
+                requests = parser.feed(data)
+            except HttpParseError as e:
+                httpserver.access_log.log({'time': time.time(), 'client': address[0], 'status': e.status,
+                                           'error': str(e)})
+                connection.sendall(error_response(e.status, e.reason))
+                break
+
+            keep_alive = True
+            for request in requests:
+                served += 1
+                keep_alive = request.keep_alive and served < MAX_REQUESTS_PER_CONNECTION
+                result = httpserver.handle_request(request.method, request.path, request.headers,
+                                                   request.body.decode('utf-8', errors='ignore'), address[0])
+                connection.sendall(set_connection_header(result, keep_alive))
+                if not keep_alive:
                     break
-                body_part += chunk
-            except socket.timeout:
+            if not keep_alive:
                 break
-            
-        full_request_str = header_part.decode('utf-8') + '\r\n\r\n' + body_part.decode('utf-8', errors='ignore')
-        
-        result = httpserver.process_request(full_request_str)
-        connection.sendall(result)
+            if requests:
+                # The next request's clock starts with its first byte, or now if part of it is already buffered
+                deadline = None if parser.idle else time.monotonic() + REQUEST_TIMEOUT
 
     except Exception as e:
         print(f"Error processing client {address}: {e}")
     finally:
         connection.close()
 
+def connection_done(future):
+    global pending
+    with pending_lock:
+        pending -= 1
 
 def run_http_server():
+    global httpserver, pending
+    httpserver = HttpServer()
     my_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     my_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     my_socket.bind(('0.0.0.0', HTTP_PORT))
     my_socket.listen(5)
     print(f"HTTP server running on port {HTTP_PORT}...")
 
-    with ThreadPoolExecutor(max_workers=20) as executor:
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        # Connections accepted but not yet picked up by a worker thread
+        REGISTRY.gauge('http_executor_queue_depth', lambda: {'workers': max(0, pending - MAX_WORKERS)},
+                       "Requests or connections waiting for an executor thread", label='pool')
         while True:
             connection, client_address = my_socket.accept()
-            executor.submit(process_the_client, connection, client_address)
+            with pending_lock:
+                pending += 1
+            future = executor.submit(process_the_client, connection, client_address, time.perf_counter())
+            future.add_done_callback(connection_done)
 
 if __name__ == "__main__":
     run_http_server()
\ No newline at end of file
@@ -0,0 +1,55 @@
+import random
+import unittest
+from server.match import Match
+from server.simulation import sweeping_input
+
+try:
+    from server.batch_physics import BatchPhysics
+except ImportError:
+    BatchPhysics = None
+
+class NoJitter(random.Random):
+    def random(self):
+        return 0.5
+
+@unittest.skipIf(BatchPhysics is None, "numpy is not installed")
+class BatchPhysicsTest(unittest.TestCase):
+    def assert_engines_agree(self, tick_rate, matches=8, ticks=1200, seed=3):
+        scalar = [Match('a', 'b', tick_rate, swept=False, rng=NoJitter(seed + i)) for i in range(matches)]
+        batch = BatchPhysics(matches, tick_rate, seed=seed, angle_jitter=0, swept=False)
+        for match in scalar:
+            batch.add_match(puck_vel=match.game_state['puck_vel'])
+        inputs = [(sweeping_input(1, seed + i), sweeping_input(2, seed + i)) for i in range(matches)]
+        diverged = set()
+        compared = 0
+        for _ in range(ticks):
+            for slot, (match, (p1, p2)) in enumerate(zip(scalar, inputs)):
+                p1_input, p2_input = next(p1), next(p2)
+                match.step(p1_input, p2_input)
+                batch.set_targets(slot, (p1_input['x'], p1_input['y']), (p2_input['x'], p2_input['y']))
+            # After a goal the engines draw different serve directions, so stop comparing that match
+            diverged.update(int(slot) for slot in batch.step())
+            for slot, match in enumerate(scalar):
+                if slot in diverged:
+                    continue
+                state = batch.game_state(slot)
+                for key in ('puck_pos', 'puck_vel', 'p1_pos', 'p2_pos'):
+                    for a, b in zip(state[key], match.game_state[key]):
+                        self.assertAlmostEqual(a, b, delta=1e-3, msg=f"{key} of match {slot} at tick {match.tick}")
+                compared += 1
+        self.assertGreater(compared, matches * ticks // 4)
+
+    def test_matches_scalar_engine_at_base_tick_rate(self):
+        self.assert_engines_agree(60)
+
+    def test_matches_scalar_engine_at_30_hz(self):
+        self.assert_engines_agree(30)
+
+    def test_refuses_swept_collision(self):
+        with self.assertRaises(ValueError):
+            BatchPhysics(4, tick_rate=30)
+        with self.assertRaises(ValueError):
+            BatchPhysics(4, swept=True)
+
+if __name__ == '__main__':
+    unittest.main()
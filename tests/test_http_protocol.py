@@ -0,0 +1,89 @@
+import unittest
+from server.http_protocol import HttpRequestParser, HttpParseError, set_connection_header
+
+GET = b"GET /leaderboard HTTP/1.1\r\nHost: localhost\r\n\r\n"
+POST = b"POST /login HTTP/1.1\r\nHost: localhost\r\nContent-Length: 13\r\n\r\n{\"name\": \"a\"}"
+CHUNKED = (b"POST /game-result HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n"
+           b"5\r\nhello\r\n7;ext=1\r\n, world\r\n0\r\n\r\n")
+
+class HttpRequestParserTest(unittest.TestCase):
+    def assert_rejected(self, data, status, parser=None):
+        with self.assertRaises(HttpParseError) as raised:
+            (parser or HttpRequestParser()).feed(data)
+        self.assertEqual(raised.exception.status, status)
+
+    def test_simple_request(self):
+        parser = HttpRequestParser()
+        [request] = parser.feed(POST)
+        self.assertEqual((request.method, request.path, request.version), ('POST', '/login', 'HTTP/1.1'))
+        self.assertEqual(request.headers['content-length'], '13')
+        self.assertEqual(request.body, b'{"name": "a"}')
+        self.assertTrue(request.keep_alive)
+        self.assertTrue(parser.idle)
+
+    def test_pipelined_requests_in_one_read(self):
+        requests = HttpRequestParser().feed(GET + POST + b"\r\n" + GET)
+        self.assertEqual([(r.method, r.path) for r in requests],
+                         [('GET', '/leaderboard'), ('POST', '/login'), ('GET', '/leaderboard')])
+        self.assertEqual(requests[1].body, b'{"name": "a"}')
+
+    def test_requests_split_byte_by_byte(self):
+        stream = POST + CHUNKED + GET
+        parser = HttpRequestParser()
+        requests = []
+        for i in range(len(stream)):
+            requests += parser.feed(stream[i:i + 1])
+            if i < len(POST) - 1:
+                self.assertFalse(requests)
+                self.assertFalse(parser.idle)
+        self.assertEqual([r.body for r in requests], [b'{"name": "a"}', b'hello, world', b''])
+        self.assertTrue(parser.idle)
+
+    def test_chunked_body_with_trailers(self):
+        data = (b"POST /x HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n"
+                b"3\r\nabc\r\n0\r\nX-Checksum: 1\r\n\r\n")
+        requests = HttpRequestParser().feed(data + GET)
+        self.assertEqual([(r.path, r.body) for r in requests], [('/x', b'abc'), ('/leaderboard', b'')])
+
+    def test_connection_header(self):
+        [http10, close] = HttpRequestParser().feed(
+            b"GET / HTTP/1.0\r\n\r\nGET / HTTP/1.1\r\nConnection: Close\r\n\r\n")
+        self.assertFalse(http10.keep_alive)
+        self.assertFalse(close.keep_alive)
+        response = set_connection_header(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n", False)
+        self.assertIn(b"\r\nConnection: close\r\n", response)
+
+    def test_malformed_request_line(self):
+        self.assert_rejected(b"GET /\r\n\r\n", 400)
+        self.assert_rejected(b"GET / SPDY/3\r\n\r\n", 400)
+
+    def test_malformed_headers(self):
+        self.assert_rejected(b"GET / HTTP/1.1\r\nNo colon here\r\n\r\n", 400)
+        self.assert_rejected(b"GET / HTTP/1.1\r\nBad name : x\r\n\r\n", 400)
+
+    def test_invalid_content_length(self):
+        self.assert_rejected(b"POST / HTTP/1.1\r\nContent-Length: ten\r\n\r\n", 400)
+        self.assert_rejected(b"POST / HTTP/1.1\r\nContent-Length: -1\r\n\r\n", 400)
+
+    def test_invalid_chunks(self):
+        head = b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n"
+        self.assert_rejected(head + b"zz\r\n", 400)
+        self.assert_rejected(head + b"-5\r\n", 400)
+        self.assert_rejected(head + b"+5\r\n", 400)
+        self.assert_rejected(head + b"\r\n", 400)
+        self.assert_rejected(head + b"5\r\nhelloXY0\r\n\r\n", 400)
+        # Whitespace before a chunk extension is allowed
+        [request] = HttpRequestParser().feed(head + b"5 ;name=x\r\nhello\r\n0\r\n\r\n")
+        self.assertEqual(request.body, b'hello')
+        self.assert_rejected(b"POST / HTTP/1.1\r\nTransfer-Encoding: gzip\r\n\r\n", 501)
+
+    def test_size_limits(self):
+        parser = HttpRequestParser(max_header_bytes=64, max_body_bytes=8)
+        self.assert_rejected(b"GET /" + b"a" * 100, 431, parser)
+        self.assert_rejected(b"POST / HTTP/1.1\r\nContent-Length: 9\r\n\r\n", 413,
+                             HttpRequestParser(max_body_bytes=8))
+        self.assert_rejected(b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nhello\r\n5\r\n", 413,
+                             HttpRequestParser(max_body_bytes=8))
+
+if __name__ == '__main__':
+    unittest.main()
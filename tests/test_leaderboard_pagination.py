@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+import unittest
+from server.database import GameDB
+from server.http_handler import encode_cursor, decode_cursor
+
+class KeysetPaginationTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db = GameDB(os.path.join(self.dir, 'test.db'))
+        # Few distinct scores and wins, so most pages start and end inside a run of ties
+        players = [(f'p{i:03d}', 'x', (i * 7) % 3 * 100, (i * 5) % 4) for i in range(97)]
+        with self.db.get_db_connection() as conn:
+            conn.executemany('INSERT INTO players (name, password_hash, score, wins) VALUES (?, ?, ?, ?)', players)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.dir)
+
+    def walk(self, limit):
+        page = self.db.get_leaderboard_data(0, limit)
+        entries = list(page)
+        # Bounded, so a cursor that repeats rows fails the comparison instead of looping forever
+        while page and len(entries) <= 200:
+            cursor = decode_cursor(encode_cursor(page[-1]))
+            page = self.db.get_leaderboard_after(cursor, limit)
+            self.assertLessEqual(len(page), limit)
+            entries += page
+        return entries
+
+    def test_pages_match_the_full_leaderboard(self):
+        full = self.db.get_leaderboard_data()
+        self.assertEqual(len(full), 97)
+        for limit in (1, 2, 5, 10, 96, 97, 200):
+            self.assertEqual(self.walk(limit), full, f"limit {limit}")
+
+    def test_ranks_are_consecutive(self):
+        self.assertEqual([entry['rank'] for entry in self.walk(7)], list(range(1, 98)))
+
+    def test_cursor_after_the_last_player(self):
+        last = self.db.get_leaderboard_data()[-1]
+        self.assertEqual(self.db.get_leaderboard_after(decode_cursor(encode_cursor(last)), 10), [])
+
+    def test_malformed_cursor(self):
+        with self.assertRaises(ValueError):
+            decode_cursor(encode_cursor({'score': 'high', 'wins': 1, 'name': 'a', 'rank': 1}))
+
+if __name__ == '__main__':
+    unittest.main()
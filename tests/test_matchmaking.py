@@ -0,0 +1,123 @@
+import unittest
+from server.matchmaking import Matchmaker
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+class Player:
+    def __init__(self, name):
+        self.name = name
+        self.alive = True
+
+    def __repr__(self):
+        return self.name
+
+def names(pairs):
+    return [(p1.name, p2.name) for p1, p2 in pairs]
+
+class MatchmakerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        # Buckets of 10 rating points; the window starts at 10 and grows by 5 points per second
+        self.matchmaker = Matchmaker(bucket_width=10, initial_window=10, window_growth=5,
+                                     is_alive=lambda player: player.alive, clock=self.clock)
+
+    def enqueue(self, name, rating):
+        player = Player(name)
+        return player, self.matchmaker.enqueue(player, rating)
+
+    def test_pairs_within_the_initial_window_at_once(self):
+        a, _ = self.enqueue('a', 100)
+        self.clock.now = 3
+        b, pair = self.enqueue('b', 105)
+        self.assertEqual(pair, (a, b))
+        self.assertEqual(len(self.matchmaker), 0)
+        self.assertEqual(self.matchmaker.waits.count, 2)
+
+    def test_nearest_bucket_in_the_window_wins(self):
+        matchmaker = Matchmaker(bucket_width=10, initial_window=50, window_growth=5, clock=self.clock)
+        low, high = Player('low'), Player('high')
+        self.assertIsNone(matchmaker.enqueue(low, 100))
+        self.assertIsNone(matchmaker.enqueue(high, 160))
+        # Buckets 10 and 16 are both within reach of bucket 14; 16 is nearer
+        self.assertEqual(names([matchmaker.enqueue(Player('c'), 140)]), [('high', 'c')])
+        self.assertIn(low, matchmaker)
+
+    def test_window_widens_until_the_pair_fits(self):
+        self.enqueue('a', 0)
+        self.enqueue('b', 100)
+        # The window reaches bucket 10 (100 points) after (100 - 10) / 5 = 18 seconds
+        for now in (1, 5, 10, 17.9):
+            self.clock.now = now
+            self.assertEqual(self.matchmaker.match(), [])
+        self.clock.now = 18
+        self.assertEqual(names(self.matchmaker.match()), [('a', 'b')])
+        self.assertEqual(len(self.matchmaker), 0)
+
+    def test_rechecks_are_scheduled_once_per_bucket(self):
+        self.enqueue('a', 0)
+        self.enqueue('b', 1000)
+        # Each ticket is due again only when its window reaches the next bucket, every 2 seconds
+        self.assertEqual(sorted(at for at, _, _ in self.matchmaker.rechecks), [2, 2])
+        self.clock.now = 1.9
+        self.matchmaker.match()
+        self.assertEqual(sorted(at for at, _, _ in self.matchmaker.rechecks), [2, 2])
+        self.clock.now = 2
+        self.matchmaker.match()
+        self.assertEqual(sorted(at for at, _, _ in self.matchmaker.rechecks), [4, 4])
+
+    def test_max_window_stops_rechecks(self):
+        matchmaker = Matchmaker(bucket_width=10, initial_window=10, window_growth=5, max_window=50,
+                                clock=self.clock)
+        matchmaker.enqueue(Player('a'), 0)
+        matchmaker.enqueue(Player('b'), 100)
+        self.clock.now = 1000
+        self.assertEqual(matchmaker.match(), [])
+        self.assertEqual(matchmaker.rechecks, [])
+        self.assertEqual(len(matchmaker), 2)
+
+    def test_dead_player_is_not_paired_on_recheck(self):
+        a, _ = self.enqueue('a', 0)
+        b, _ = self.enqueue('b', 100)
+        self.clock.now = 17.5
+        self.assertEqual(self.matchmaker.match(), [])
+        a.alive = False
+        self.clock.now = 18
+        self.assertEqual(self.matchmaker.match(), [])
+        self.assertEqual(self.matchmaker.evicted, 1)
+        self.assertNotIn(a, self.matchmaker)
+        self.assertIn(b, self.matchmaker)
+        c, pair = self.enqueue('c', 100)
+        self.assertEqual(pair, (b, c))
+
+    def test_dead_candidate_is_evicted_on_enqueue(self):
+        a, _ = self.enqueue('a', 100)
+        b, _ = self.enqueue('b', 300)
+        a.alive = False
+        c, pair = self.enqueue('c', 100)
+        self.assertIsNone(pair)
+        self.assertEqual(self.matchmaker.evicted, 1)
+        self.assertEqual(len(self.matchmaker), 2)
+        self.assertIn(c, self.matchmaker)
+
+    def test_dead_player_is_not_queued(self):
+        player = Player('dead')
+        player.alive = False
+        self.assertIsNone(self.matchmaker.enqueue(player, 100))
+        self.assertEqual(len(self.matchmaker), 0)
+        self.assertEqual(self.matchmaker.evicted, 1)
+
+    def test_removed_player_is_not_paired(self):
+        a, _ = self.enqueue('a', 100)
+        self.assertTrue(self.matchmaker.remove(a))
+        self.assertFalse(self.matchmaker.remove(a))
+        self.assertIsNone(self.enqueue('b', 100)[1])
+        self.clock.now = 100
+        self.assertEqual(self.matchmaker.match(), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import json
+import unittest
+from common.protocol import (
+    FrameDecoder, StateEncoder, decode_state, encode_input, decode_input, encode_input_ack, decode_input_ack,
+    split_handshake, negotiate_protocol, MSG_STATE, MSG_INPUT, MSG_INPUT_ACK, PROTOCOL_JSON, PROTOCOL_BINARY,
+    SnapshotEncoder, SnapshotDecoder, take_snapshot, snapshot_to_state, MSG_KEYFRAME, MSG_DELTA, POS_SCALE
+)
+
+STATE = {
+    'puck_pos': [600.5, 400.25], 'puck_vel': [-7.5, 3.125],
+    'p1_pos': [100.0, 420.0], 'p2_pos': [1100.0, 380.0],
+    'score': [3, 5], 'game_over': False
+}
+
+class BinaryFrameTest(unittest.TestCase):
+    def test_state_round_trip(self):
+        frame = bytes(StateEncoder().encode(STATE, 1234))
+        [(msg_type, payload)] = FrameDecoder().feed(frame)
+        self.assertEqual(msg_type, MSG_STATE)
+        self.assertEqual(decode_state(payload), {**STATE, 'tick': 1234})
+
+    def test_encoder_reuses_its_buffer(self):
+        encoder = StateEncoder()
+        first = encoder.encode(STATE, 1)
+        encoder.encode({**STATE, 'game_over': True}, 2)
+        [(_, payload)] = FrameDecoder().feed(bytes(first))
+        self.assertEqual(decode_state(payload)['tick'], 2)
+
+    def test_input_round_trips(self):
+        [(msg_type, payload)] = FrameDecoder().feed(encode_input(12.5, 700.0))
+        self.assertEqual(msg_type, MSG_INPUT)
+        self.assertEqual(decode_input(payload), {'x': 12.5, 'y': 700.0})
+        [(msg_type, payload)] = FrameDecoder().feed(encode_input_ack(1.5, 2.5, 99))
+        self.assertEqual(msg_type, MSG_INPUT_ACK)
+        self.assertEqual(decode_input_ack(payload), ({'x': 1.5, 'y': 2.5}, 99))
+
+    def test_frames_split_across_reads(self):
+        stream = bytes(StateEncoder().encode(STATE, 7)) + encode_input(1.0, 2.0) + encode_input(3.0, 4.0)
+        decoder = FrameDecoder()
+        frames = []
+        for i in range(len(stream)):
+            frames += decoder.feed(stream[i:i + 1])
+        self.assertEqual([msg_type for msg_type, _ in frames], [MSG_STATE, MSG_INPUT, MSG_INPUT])
+        self.assertEqual(decode_input(frames[2][1]), {'x': 3.0, 'y': 4.0})
+        self.assertEqual(decoder.buffer, bytearray())
+
+    def test_handshake_split_from_frames(self):
+        handshake = json.dumps({'message': 'Game starting', 'protocol': PROTOCOL_BINARY}).encode()
+        frame = encode_input(5.0, 6.0)
+        self.assertEqual(split_handshake(handshake[:-3]), (None, handshake[:-3]))
+        message, rest = split_handshake(handshake + frame)
+        self.assertEqual(message['protocol'], PROTOCOL_BINARY)
+        self.assertEqual(rest, frame)
+
+    def test_negotiation_falls_back_to_json(self):
+        self.assertEqual(negotiate_protocol({'protocol': PROTOCOL_BINARY}), PROTOCOL_BINARY)
+        self.assertEqual(negotiate_protocol({'protocol': 42}), PROTOCOL_JSON)
+        self.assertEqual(negotiate_protocol({}), PROTOCOL_JSON)
+
+def state_at(tick):
+    """A state where the puck moves every tick, p1 every other tick and p2 and the score never"""
+    return {**STATE, 'puck_pos': [100 + tick * 1.5, 200 + tick * 0.25], 'p1_pos': [100.0 + tick // 2, 420.0]}
+
+class DeltaSnapshotTest(unittest.TestCase):
+    def send(self, encoder, decoder, tick, acked_tick):
+        encoder.record(state_at(tick), tick)
+        [(msg_type, payload)] = FrameDecoder().feed(encoder.encode(acked_tick))
+        self.assertTrue(decoder.apply(msg_type, payload))
+        self.assertEqual(decoder.latest_state(), snapshot_to_state(take_snapshot(state_at(tick))))
+        return msg_type, payload
+
+    def test_quantization_round_trip(self):
+        state = snapshot_to_state(take_snapshot(STATE))
+        for key in ('puck_pos', 'puck_vel', 'p1_pos', 'p2_pos'):
+            for a, b in zip(state[key], STATE[key]):
+                self.assertAlmostEqual(a, b, delta=1 / POS_SCALE)
+        self.assertEqual(state['score'], STATE['score'])
+        self.assertIs(state['game_over'], False)
+
+    def test_keyframe_then_deltas(self):
+        encoder, decoder = SnapshotEncoder(keyframe_interval=60), SnapshotDecoder()
+        msg_type, keyframe = self.send(encoder, decoder, 0, None)
+        self.assertEqual(msg_type, MSG_KEYFRAME)
+        for tick in range(1, 30):
+            msg_type, payload = self.send(encoder, decoder, tick, tick - 1)
+            self.assertEqual(msg_type, MSG_DELTA)
+            self.assertLess(len(payload), len(keyframe))
+
+    def test_delta_against_an_older_ack(self):
+        encoder, decoder = SnapshotEncoder(keyframe_interval=60), SnapshotDecoder()
+        self.send(encoder, decoder, 0, None)
+        for tick in range(1, 10):
+            # The client's acks lag: every delta is against tick 0, the only one it acknowledged
+            self.assertEqual(self.send(encoder, decoder, tick, 0)[0], MSG_DELTA)
+
+    def test_periodic_and_forced_keyframes(self):
+        encoder, decoder = SnapshotEncoder(keyframe_interval=10), SnapshotDecoder()
+        types = [self.send(encoder, decoder, tick, tick - 1 if tick else None)[0] for tick in range(25)]
+        self.assertEqual([tick for tick, msg_type in enumerate(types) if msg_type == MSG_KEYFRAME], [0, 10, 20])
+        # An ack the encoder no longer (or never) had gets a keyframe
+        self.assertEqual(self.send(encoder, decoder, 25, 9999)[0], MSG_KEYFRAME)
+
+    def test_delta_with_unknown_base_is_refused(self):
+        encoder = SnapshotEncoder(keyframe_interval=60)
+        encoder.record(state_at(0), 0)
+        encoder.encode(None)
+        encoder.record(state_at(1), 1)
+        [(msg_type, payload)] = FrameDecoder().feed(encoder.encode(0))
+        self.assertEqual(msg_type, MSG_DELTA)
+        self.assertFalse(SnapshotDecoder().apply(msg_type, payload))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import random
+import shutil
+import tempfile
+import time
+import unittest
+from server.database import GameDB
+from server.rank_index import FenwickTree, RankIndex
+
+def baseline_ranks(players):
+    """Ranks by sorting everyone in leaderboard order: score and wins descending, then name"""
+    order = sorted(players, key=lambda name: (-players[name][0], -players[name][1], name))
+    return {name: rank for rank, name in enumerate(order, 1)}
+
+class FenwickTreeTest(unittest.TestCase):
+    def test_prefix_sums(self):
+        rng = random.Random(1)
+        tree, counts = FenwickTree(50), [0] * 50
+        for _ in range(500):
+            index, delta = rng.randrange(50), rng.choice((1, 1, -1))
+            tree.add(index, delta)
+            counts[index] += delta
+            probe = rng.randrange(60)
+            self.assertEqual(tree.prefix_sum(probe), sum(counts[:probe + 1]))
+
+class RankIndexTest(unittest.TestCase):
+    def assert_matches_baseline(self, index, players):
+        self.assertEqual(len(index), len(players))
+        expected = baseline_ranks(players)
+        self.assertEqual({name: index.rank(name) for name in players}, expected)
+
+    def test_random_updates_against_sorted_baseline(self):
+        rng = random.Random(7)
+        players = {f'p{i}': (rng.randrange(0, 300, 25), rng.randrange(4)) for i in range(200)}
+        index = RankIndex(score_capacity=64)
+        index.load((name, score, wins) for name, (score, wins) in players.items())
+        self.assert_matches_baseline(index, players)
+        for step in range(2000):
+            name = f'p{rng.randrange(260)}'
+            if rng.random() < 0.1:
+                index.remove(name)
+                players.pop(name, None)
+            else:
+                # Scores sometimes jump past the tree's capacity, so it has to grow
+                score = rng.randrange(0, 300, 25) if rng.random() < 0.95 else rng.randrange(1000, 5000)
+                players[name] = (score, rng.randrange(4))
+                index.update(name, *players[name])
+            if step % 100 == 0:
+                self.assert_matches_baseline(index, players)
+        self.assert_matches_baseline(index, players)
+
+    def test_ties_are_broken_by_wins_then_name(self):
+        index = RankIndex()
+        index.load([('carol', 100, 2), ('alice', 100, 2), ('bob', 100, 5), ('dave', 150, 0), ('eve', 0, 0)])
+        self.assertEqual([index.rank(name) for name in ('dave', 'bob', 'alice', 'carol', 'eve')], [1, 2, 3, 4, 5])
+        self.assertIsNone(index.rank('nobody'))
+        self.assertEqual(index.percentile(1), 100.0)
+        self.assertEqual(index.percentile(5), 20.0)
+
+    def test_updates_before_load_are_replayed(self):
+        index = RankIndex()
+        index.update('new', 500, 1)
+        index.update('a', 50, 0)
+        index.remove('b')
+        index.load([('a', 10, 0), ('b', 20, 0), ('c', 30, 0)])
+        self.assert_matches_baseline(index, {'new': (500, 1), 'a': (50, 0), 'c': (30, 0)})
+
+    def test_rank_does_not_wait_forever_for_the_load(self):
+        index = RankIndex()
+        index.update('a', 10, 0)
+        started = time.monotonic()
+        self.assertIsNone(index.rank('a', timeout=0.05))
+        self.assertLess(time.monotonic() - started, 1)
+        index.load([])
+        self.assertEqual(index.rank('a'), 1)
+
+class RankIndexLoaderTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db = GameDB(os.path.join(self.dir, 'test.db'))
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.dir)
+
+    def test_bad_row_still_finishes_the_load(self):
+        with self.db.get_db_connection() as conn:
+            # NULL passes the CHECK constraint, and makes RankIndex.load() raise TypeError
+            conn.execute("INSERT INTO players (name, password_hash, score, wins) VALUES ('bad', 'x', NULL, 0)")
+        self.db.rank_index = RankIndex()
+        self.db.load_rank_index()
+        self.assertTrue(self.db.rank_index.loaded.is_set())
+        self.assertIsNone(self.db.rank_index.rank('bad'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from server.session_store import MemorySessionStore, SQLiteSessionStore, open_session_store
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+class MemorySessionStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.store = MemorySessionStore(ttl=100, max_sessions=3, clock=self.clock)
+
+    def test_expires_after_ttl_without_use(self):
+        token = self.store.create('alice')
+        self.clock.now += 99
+        self.assertEqual(self.store.get(token), 'alice')
+        self.clock.now += 100
+        self.assertIsNone(self.store.get(token))
+        self.assertEqual(len(self.store), 0)
+
+    def test_use_refreshes_expiry(self):
+        token = self.store.create('alice')
+        for _ in range(5):
+            self.clock.now += 60
+            self.assertEqual(self.store.get(token), 'alice')
+
+    def test_least_recently_used_is_evicted(self):
+        tokens = [self.store.create(name) for name in ('a', 'b', 'c')]
+        self.store.get(tokens[0])
+        self.store.create('d')
+        self.assertEqual(len(self.store), 3)
+        self.assertIsNone(self.store.get(tokens[1]))
+        self.assertEqual(self.store.get(tokens[0]), 'a')
+
+    def test_revoke(self):
+        token = self.store.create('alice')
+        self.store.revoke(token)
+        self.store.revoke('unknown')
+        self.assertIsNone(self.store.get(token))
+
+class SQLiteSessionStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def open_store(self, **options):
+        options = {'ttl': 100, 'cache_seconds': 5, 'clock': self.clock, **options}
+        return SQLiteSessionStore(os.path.join(self.dir, 'sessions.db'), **options)
+
+    def stored_expiry(self, store, token):
+        row = store.get_db_connection().execute('SELECT expires_at FROM sessions WHERE token = ?', (token,)).fetchone()
+        return row and row[0]
+
+    def test_expires_after_ttl_without_use(self):
+        store = self.open_store()
+        token = store.create('alice')
+        self.clock.now += 99
+        self.assertEqual(store.get(token), 'alice')
+        self.clock.now += 100
+        self.assertIsNone(store.get(token))
+        self.assertIsNone(store.get(''))
+
+    def test_refresh_is_written_only_after_part_of_the_ttl(self):
+        store = self.open_store()
+        token = store.create('alice')
+        created_expiry = self.stored_expiry(store, token)
+        self.clock.now += 5
+        store.get(token)
+        self.assertEqual(self.stored_expiry(store, token), created_expiry)
+        self.clock.now += 10
+        store.get(token)
+        self.assertEqual(self.stored_expiry(store, token), self.clock.now + 100)
+
+    def test_refresh_reaches_other_processes(self):
+        store, other = self.open_store(), self.open_store()
+        token = store.create('alice')
+        for _ in range(5):
+            self.clock.now += 60
+            self.assertEqual(store.get(token), 'alice')
+        self.assertEqual(other.get(token), 'alice')
+
+    def test_revoke_reaches_other_processes_within_the_cache_time(self):
+        store, other = self.open_store(), self.open_store()
+        token = store.create('alice')
+        self.assertEqual(other.get(token), 'alice')
+        store.revoke(token)
+        self.assertIsNone(store.get(token))
+        self.clock.now += 6
+        self.assertIsNone(other.get(token))
+
+    def test_prune_keeps_the_newest_sessions(self):
+        store = self.open_store(max_sessions=2)
+        expired = store.create('old')
+        self.clock.now += 200
+        tokens = []
+        for name in ('a', 'b', 'c'):
+            tokens.append(store.create(name))
+            self.clock.now += 1
+        store.prune()
+        self.assertIsNone(self.stored_expiry(store, expired))
+        self.assertIsNone(self.stored_expiry(store, tokens[0]))
+        self.assertIsNotNone(self.stored_expiry(store, tokens[2]))
+
+    def test_concurrent_creates_prune_on_schedule(self):
+        store = self.open_store(max_sessions=10)
+        pruned = []
+        store.prune = lambda: pruned.append(1)
+        with mock.patch('server.session_store.PRUNE_EVERY', 50):
+            threads = [threading.Thread(target=lambda: [store.create('alice') for _ in range(25)]) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(pruned), 4)
+
+class OpenSessionStoreTest(unittest.TestCase):
+    def test_kinds(self):
+        self.assertIsInstance(open_session_store('memory'), MemorySessionStore)
+        with self.assertRaises(ValueError):
+            open_session_store('redis')
+
+if __name__ == '__main__':
+    unittest.main()